@@ -1,11 +1,17 @@
-from typing import Iterable
+from typing import Iterable, Optional, Sequence
 import genanki
+import hashlib
 import os.path
+import regex as re
 
-from data_models import Kanji, Kotoba
+from apkg_writer import DeckContents, note_guid as anki_guid, write_package
+from data_models import Kanji, KankenLevels, Kotoba
+from deck_media import KotobaMedia
+from deck_manifest import MANIFEST_PATH, Changelog, DeckManifest, models_hash
 
 KANJI_MODEL_ID = 1976405439
 KOTOBA_MODEL_ID = 1616488250
+KOTOBA_MEDIA_MODEL_ID = 1330576214
 
 # NOTE: May use part-of-speech-differentiated card variants in the future.
 # VERB_MODEL_ID = 1844777987
@@ -17,6 +23,9 @@ KANKEN_DECK_ID = 1169437805
 KANKEN_KANJI_SUBDECK_ID = 1228308188
 KANKEN_KOTOBA_SUBDECK_ID = 1095745966
 
+LEVEL_DECK_DIRECTORY = "build/anki/levels"
+HAN_PATTERN = re.compile(r"[\p{Han}--[々〆〇]]", flags=re.V1)  # Kanji, less the marks that aren't Kanken kanji themselves
+
 def load_generic(file_path: str):
     with open(file_path) as f:
         return f.read()
@@ -85,16 +94,31 @@ KOTOBA_MODEL = genanki.Model(
         css=load_style("kotoba.css")
 )
 
+# Only used with --media, so that the note type of the plain deck stays as it was; the same, with two more fields
+KOTOBA_MEDIA_MODEL = genanki.Model(
+    KOTOBA_MEDIA_MODEL_ID,
+    "Kanken Kotoba (with media)",
+    fields=[dict(field) for field in KOTOBA_MODEL.fields] + [
+        {"name": "Pitch accent images"},
+        {"name": "Audio"},
+    ],
+    templates=[dict(template) for template in KOTOBA_MODEL.templates],
+    css=KOTOBA_MODEL.css
+)
+
+
+def note_guid(fields: Sequence[str]) -> str:
+    return anki_guid(fields[0])  # The character or word field only, so that notes keep their GUID as they change
 
 class KanjiNote(genanki.Note):
     @property
     def guid(self):
-        return genanki.guid_for(self.fields[0]) # The character field only
+        return note_guid(self.fields)
 
 class KotobaNote(genanki.Note):
     @property
     def guid(self):
-        return genanki.guid_for(self.fields[0]) # The word field only
+        return note_guid(self.fields)
 
 def create_kanji_note(kanji: Kanji) -> KanjiNote:
     return KanjiNote(
@@ -102,19 +126,21 @@ def create_kanji_note(kanji: Kanji) -> KanjiNote:
         fields=kanji.as_tuple()
     )
 
-def create_kotoba_note(kotoba: Kotoba) -> KotobaNote:
-    return KotobaNote(
-        KOTOBA_MODEL,
-        fields=kotoba.as_tuple()
-    )
+def kotoba_model(media: Optional[KotobaMedia] = None) -> genanki.Model:
+    return KOTOBA_MODEL if media is None else KOTOBA_MEDIA_MODEL
 
-def build_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba]) -> genanki.Package:
-    # Currently appears to be unnecessary, as cards are only sorted into the subdecks, not the main deck
-    kanken_deck = genanki.Deck(
-        KANKEN_DECK_ID,
-        "漢検一級"
+def kotoba_fields(kotoba: Kotoba, media: Optional[KotobaMedia] = None) -> tuple[str, ...]:
+    "The fields of the kotoba's note, of `kotoba_model(media)`; only with media are there the media fields."
+    return kotoba.as_tuple() if media is None else kotoba.as_tuple() + media.note_fields(kotoba)
+
+def create_kotoba_note(kotoba: Kotoba, media: Optional[KotobaMedia] = None) -> KotobaNote:
+    return KotobaNote(
+        kotoba_model(media),
+        fields=kotoba_fields(kotoba, media)
     )
 
+def create_subdecks() -> tuple[genanki.Deck, genanki.Deck]:
+    "The kanji and kotoba subdecks, still empty."
     kanken_kanji_subdeck = genanki.Deck(
         KANKEN_KANJI_SUBDECK_ID,
         "漢検一級::漢字"
@@ -124,6 +150,16 @@ def build_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba]) -> genanki.Pa
         KANKEN_KOTOBA_SUBDECK_ID,
         "漢検一級::言葉"
     )
+    return kanken_kanji_subdeck, kanken_kotoba_subdeck
+
+def build_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba]) -> genanki.Package:
+    # Currently appears to be unnecessary, as cards are only sorted into the subdecks, not the main deck
+    kanken_deck = genanki.Deck(
+        KANKEN_DECK_ID,
+        "漢検一級"
+    )
+
+    kanken_kanji_subdeck, kanken_kotoba_subdeck = create_subdecks()
 
     for kanji in kanjis:
         note = create_kanji_note(kanji)
@@ -135,3 +171,97 @@ def build_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba]) -> genanki.Pa
     
     package = genanki.Package([kanken_kanji_subdeck, kanken_kotoba_subdeck])
     return package
+
+def write_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba], path: str, timestamp: Optional[float] = None,
+               media: Optional[KotobaMedia] = None) -> None:
+    """Write the package that `build_deck` builds straight to `path`, without a genanki note per kanji and kotoba; see
+    `apkg_writer.write_package`. With `media`, the kotoba notes are of `KOTOBA_MEDIA_MODEL`, with their pitch accent
+    images and audio, and the files they refer to are packaged with them.
+    """
+    kanken_kanji_subdeck, kanken_kotoba_subdeck = create_subdecks()
+    kanji_fields = map(Kanji.as_tuple, kanjis)
+    kotoba_note_fields = (kotoba_fields(kotoba, media) for kotoba in kotobas)
+    write_package(path, [
+        DeckContents(kanken_kanji_subdeck, KANJI_MODEL, ((note_guid(fields), fields) for fields in kanji_fields)),
+        DeckContents(kanken_kotoba_subdeck, kotoba_model(media), ((note_guid(fields), fields) for fields in kotoba_note_fields)),
+    ], timestamp, media.files if media is not None else None)
+
+def write_incremental_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba], path: str, update_path: Optional[str] = None,
+                           manifest_path: str = MANIFEST_PATH, timestamp: Optional[float] = None,
+                           media: Optional[KotobaMedia] = None) -> Changelog:
+    """Write the deck to `path` as `write_deck` does, and compare its notes with those of the last deck written (as
+    recorded in the manifest) to find which have been added, changed or removed since. If none have, and the deck is
+    already there, it's left as it is. With an `update_path`, a package of only the added and changed notes is also
+    written there (if there are any), which Anki imports over the notes of the full deck; removed notes are only listed
+    in the changelog. The update package only carries the media that its own notes refer to.
+    """
+    subdecks = dict(zip((KANJI_MODEL, kotoba_model(media)), create_subdecks()))
+    notes = {
+        KANJI_MODEL: [(note_guid(fields), fields) for fields in map(Kanji.as_tuple, kanjis)],
+        kotoba_model(media): [(note_guid(fields), fields) for fields in (kotoba_fields(kotoba, media) for kotoba in kotobas)],
+    }
+    manifest = DeckManifest(models_hash(list(notes)))
+    for model, model_notes in notes.items():
+        for guid, fields in model_notes:
+            manifest.add(model, guid, fields)
+    changelog = manifest.diff(DeckManifest.load(manifest_path),
+                              {model.name: [field["name"] for field in model.fields]
+                               for model in (KANJI_MODEL, KOTOBA_MODEL, KOTOBA_MEDIA_MODEL)})
+
+    def contents(guids: Optional[set[str]] = None) -> list[DeckContents]:
+        "The notes of each subdeck, or only those with the given GUIDs."
+        return [
+            DeckContents(subdecks[model], model, [note for note in model_notes if guids is None or note[0] in guids])
+            for model, model_notes in notes.items()
+        ]
+
+    media_files = media.files if media is not None else None
+    if not changelog.is_empty or not os.path.exists(path):
+        write_package(path, contents(), timestamp, media_files)
+    # Notes of changed note types must all be imported again for the change to take effect
+    updated = None if changelog.models_changed else {change.guid for change in changelog.added + changelog.changed}
+    if update_path is not None and (updated is None or updated):
+        write_package(update_path, contents(updated), timestamp, media_files)
+    manifest.save(manifest_path)
+    return changelog
+
+def level_deck_name(levels: Sequence[KankenLevels]) -> str:
+    "e.g. 漢検準1級 for a single level, or 漢検5級〜3級 for a range of them."
+    easiest, hardest = min(levels), max(levels)
+    return f"漢検{easiest}級" if easiest == hardest else f"漢検{easiest}級〜{hardest}級"
+
+def level_deck_id(name: str) -> int:
+    "Derived from the deck's name, so that it stays the same from build to build, and Anki updates the deck in place."
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:4]) >> 1  # Of the same magnitude as the IDs above
+
+def kotoba_level(kotoba: Kotoba, kanji_levels: dict[str, KankenLevels]) -> KankenLevels:
+    """The level at which every kanji in the word has been learnt. Kanji that aren't in the Kanken at all are taken to be
+    of its hardest level, and words written without kanji belong to its easiest.
+    """
+    return max((kanji_levels.get(char, KankenLevels.ONE) for char in HAN_PATTERN.findall(kotoba.word)),
+               default=KankenLevels.TEN)
+
+def write_level_deck(kanjis: Iterable[Kanji], kotobas: Iterable[Kotoba], levels: Sequence[KankenLevels],
+                     path: Optional[str] = None, timestamp: Optional[float] = None,
+                     media: Optional[KotobaMedia] = None) -> str:
+    """Write a deck of only the kanji and kotoba of the given levels, with its own kanji and kotoba subdecks, to `path`
+    (by default named after the levels, in LEVEL_DECK_DIRECTORY). `kanjis` should be all of them, even those of other
+    levels, for the levels of the kotoba to be worked out. Returns the path written to.
+    """
+    kanjis = list(kanjis)
+    kanji_levels = {kanji.character: kanji.level for kanji in kanjis}
+    wanted = set(levels)
+    name = level_deck_name(levels)
+    if path is None:
+        os.makedirs(LEVEL_DECK_DIRECTORY, exist_ok=True)
+        path = os.path.join(LEVEL_DECK_DIRECTORY, f"{name}.apkg")
+
+    kanji_fields = (kanji.as_tuple() for kanji in kanjis if kanji.level in wanted)
+    kotoba_note_fields = (kotoba_fields(kotoba, media) for kotoba in kotobas if kotoba_level(kotoba, kanji_levels) in wanted)
+    kanji_subdeck = genanki.Deck(level_deck_id(f"{name}::漢字"), f"{name}::漢字")
+    kotoba_subdeck = genanki.Deck(level_deck_id(f"{name}::言葉"), f"{name}::言葉")
+    write_package(path, [
+        DeckContents(kanji_subdeck, KANJI_MODEL, ((note_guid(fields), fields) for fields in kanji_fields)),
+        DeckContents(kotoba_subdeck, kotoba_model(media), ((note_guid(fields), fields) for fields in kotoba_note_fields)),
+    ], timestamp, media.files if media is not None else None)
+    return path
@@ -0,0 +1,134 @@
+import hashlib
+import html
+import itertools
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Sequence
+
+import genanki
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
+from genanki.util import BASE91_TABLE
+
+BATCH_SIZE = 4096  # Notes inserted at a time
+BASE91_DIGITS = "".join(BASE91_TABLE)
+
+# Anki's stripHTMLMedia, which it strips sort fields with before checksumming them to find duplicate notes
+HTML_MEDIA_PATTERN = re.compile(r"(?i)<img[^>]+src=[\"']?([^\"'>]+)[\"']?[^>]*>")
+HTML_PATTERN = re.compile(r"(?si)<!--.*?-->|<style.*?>.*?</style>|<script.*?>.*?</script>|<.*?>")
+MEDIA_REFERENCE_PATTERN = re.compile(r'<img src="([^"]+)"|\[sound:([^\]]+)\]')
+
+@dataclass
+class DeckContents:
+    deck: genanki.Deck  # Only its ID, name and description are used; notes added to it are ignored
+    model: genanki.Model
+    notes: Iterable[tuple[str, Sequence[str]]]  # (GUID, fields) of each note
+
+def note_guid(*values: str) -> str:
+    """The same GUID as `genanki.guid_for`: the first 64 bits of the SHA-256 of the values joined with "__", written in
+    Anki's base 91, but without converting the hash to an int and back a byte at a time.
+    """
+    hash_int = int.from_bytes(hashlib.sha256("__".join(values).encode()).digest()[:8])
+    digits = []
+    while hash_int:
+        hash_int, digit = divmod(hash_int, 91)
+        digits.append(BASE91_DIGITS[digit])
+    return "".join(reversed(digits))
+
+def field_checksum(field: str) -> int:
+    "The checksum Anki keeps of each note's sort field: the first 32 bits of the SHA-1 of its text without HTML."
+    text = html.unescape(HTML_PATTERN.sub("", HTML_MEDIA_PATTERN.sub(r" \1 ", field)).replace("&nbsp;", " "))
+    return int(hashlib.sha1(text.encode()).hexdigest()[:8], 16)
+
+def note_rows(contents: DeckContents, mod: int, ids: Iterator[int],
+              referenced: Optional[set[str]] = None) -> Iterator[tuple[tuple, list[tuple]]]:
+    """The row of each note in the notes table, with the rows of its cards, numbered from `ids` as genanki numbers them.
+    The names of the media files that the notes refer to are added to `referenced`, if given.
+    """
+    model = contents.model
+    # Which cards each note gets; genanki works this out for every note, from templates rendered for every field
+    requirements = [(card_ord, all if kind == "all" else any, fields) for card_ord, kind, fields in model._req]
+    for guid, fields in contents.notes:
+        if len(fields) != len(model.fields):
+            raise ValueError(f"{model.name} has {len(model.fields)} fields, but the note {guid} has {len(fields)}")
+        note_id = next(ids)
+        sort_field = fields[model.sort_field_index]
+        joined_fields = "\x1f".join(fields)
+        note = (note_id, guid, model.model_id, mod, -1, "  ", joined_fields, sort_field, field_checksum(sort_field), 0, "")
+        if referenced is not None and ("<img" in joined_fields or "[sound:" in joined_fields):
+            referenced.update(image or sound for image, sound in MEDIA_REFERENCE_PATTERN.findall(joined_fields))
+        cards = [
+            (next(ids), note_id, contents.deck.deck_id, card_ord, mod, -1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, "")
+            for card_ord, satisfied, required in requirements
+            if satisfied(fields[field_ord] for field_ord in required)
+        ]
+        yield note, cards
+
+def write_collection(path: str, decks: list[DeckContents], timestamp: float, referenced: Optional[set[str]] = None) -> int:
+    """Write the collection database of a package to `path`. Returns the number of notes written, and adds the names of
+    the media files they refer to to `referenced`, if given.
+    """
+    mod = int(timestamp)
+    ids = itertools.count(int(timestamp * 1000))
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")  # Written from scratch, and thrown away on failure
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(APKG_SCHEMA)
+        connection.executescript(APKG_COL)
+        decks_json, models_json = connection.execute("SELECT decks, models FROM col").fetchone()
+        all_decks, all_models = json.loads(decks_json), json.loads(models_json)
+
+        written = 0
+        connection.execute("BEGIN")
+        for contents in decks:
+            all_decks[str(contents.deck.deck_id)] = contents.deck.to_json()
+            all_models[str(contents.model.model_id)] = contents.model.to_json(timestamp, contents.deck.deck_id)
+            rows = note_rows(contents, mod, ids, referenced)
+            while batch := list(itertools.islice(rows, BATCH_SIZE)):
+                connection.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (note for note, _ in batch))
+                connection.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       (card for _, cards in batch for card in cards))
+                written += len(batch)
+        connection.execute("UPDATE col SET decks = ?, models = ?", (json.dumps(all_decks), json.dumps(all_models)))
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+    return written
+
+def write_package(path: str, decks: list[DeckContents], timestamp: Optional[float] = None,
+                  media: Optional[dict[str, str]] = None) -> int:
+    """Write an .apkg with the same collection as genanki's `Package.write_to_file` would for the same decks, notes and
+    timestamp, but with the notes inserted in bulk rather than one statement at a time. The one difference is that each
+    note's sort field checksum is filled in, as Anki itself would, rather than left as 0. Returns the number of notes.
+
+    `media` are the paths of the media files that the notes may refer to, by the name they're referred to by. Only
+    those that the notes written do refer to are packaged, each once, and copied over a chunk at a time.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    directory = os.path.dirname(path) or "."
+    descriptor, database_path = tempfile.mkstemp(suffix=".anki2", dir=directory)
+    os.close(descriptor)
+    package_path = f"{path}.tmp"
+    try:
+        referenced = set() if media else None
+        written = write_collection(database_path, decks, timestamp, referenced)
+        media_names = sorted(name for name in referenced or () if name in media)
+        with zipfile.ZipFile(package_path, mode="w") as package:
+            package.write(database_path, "collection.anki2")  # Copied over in chunks, rather than read in whole
+            # As genanki packages media: numbered entries, and a JSON object of the name of each
+            package.writestr("media", json.dumps({str(number): name for number, name in enumerate(media_names)}))
+            for number, name in enumerate(media_names):
+                package.write(media[name], str(number))
+        os.replace(package_path, path)
+    finally:
+        os.remove(database_path)
+        if os.path.exists(package_path):
+            os.remove(package_path)
+    return written
@@ -0,0 +1,121 @@
+"""Load test for lookup_server.py: sends random look-ups from several keep-alive connections at once, and reports the
+latency percentiles and throughput. Start the server first, e.g.
+
+    python lookup_server.py &
+    python benchmarks/lookup_load.py --connections 8 --duration 10
+
+Queries are drawn from the keys the server itself reports, with a skew towards a few popular ones (see --skew), much as
+study tools tend to look the same entries up over and over.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+# (kind, index) pairs that queries are made from
+QUERY_INDEXES = [("kanji", "character"), ("kanji", "reading"), ("kanji", "radical"), ("kanji", "strokes"),
+                 ("kanji", "level"), ("kotoba", "word"), ("kotoba", "reading")]
+
+def fetch_json(host: str, port: int, path: str):
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        connection.request("GET", path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+def query_paths(host: str, port: int) -> list[str]:
+    paths = []
+    for kind, index in QUERY_INDEXES:
+        for key in fetch_json(host, port, f"/keys?kind={kind}&index={index}"):
+            paths.append(f"/{kind}?{index}={quote(key)}")
+    return paths
+
+def run_connection(host: str, port: int, paths: list[str], cumulative_weights: list[float], deadline: float, seed: int,
+                   latencies: list[float], errors: list[str]) -> None:
+    generator = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            path = generator.choices(paths, cum_weights=cumulative_weights)[0]
+            start = time.perf_counter()
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                errors.append(f"{response.status} {path}")
+    finally:
+        connection.close()
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def main():
+    cli_parser = argparse.ArgumentParser(prog="lookup-load-test", description="Load-test the look-up server")
+    cli_parser.add_argument("--url", default="http://127.0.0.1:8765", help="server to test (default: http://127.0.0.1:8765)")
+    cli_parser.add_argument("--connections", type=int, default=8, help="concurrent connections (default: 8)")
+    cli_parser.add_argument("--duration", type=float, default=10.0, help="seconds to send requests for (default: 10)")
+    cli_parser.add_argument("--skew", type=float, default=1.0,
+                            help="Zipf exponent of how often each query is picked; 0 picks them uniformly (default: 1)")
+    cli_parser.add_argument("--seed", type=int, default=0, help="seed of the random queries (default: 0)")
+    cli_parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = cli_parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    paths = query_paths(host, port)
+    random.Random(args.seed).shuffle(paths)
+    cumulative_weights = list(itertools.accumulate(1 / (rank + 1) ** args.skew for rank in range(len(paths))))
+    stats_before = fetch_json(host, port, "/stats")
+
+    latencies: list[float] = []  # list.append is atomic, so the connections can share these
+    errors: list[str] = []
+    deadline = time.perf_counter() + args.duration
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_connection,
+                         args=(host, port, paths, cumulative_weights, deadline, args.seed + i, latencies, errors))
+        for i in range(args.connections)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats_after = fetch_json(host, port, "/stats")
+
+    if not latencies:
+        raise SystemExit("No requests were completed")
+    latencies.sort()
+    hits = stats_after["cache"]["hits"] - stats_before["cache"]["hits"]
+    misses = stats_after["cache"]["misses"] - stats_before["cache"]["misses"]
+    results = {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "cache_hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+    }
+    print(f"{results['requests']} requests ({results['errors']} errors) over {args.connections} connections in "
+          f"{elapsed:.1f}s: {results['requests_per_second']:.0f} requests/s")
+    print(f"latency p50 {results['p50_ms']:.2f} ms   p90 {results['p90_ms']:.2f} ms   p99 {results['p99_ms']:.2f} ms   "
+          f"mean {results['mean_ms']:.2f} ms")
+    print(f"response cache hit rate {results['cache_hit_rate']:.1%}")
+    for error in errors[:10]:
+        print(error)
+
+    if args.json:
+        with open(args.json, mode="w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
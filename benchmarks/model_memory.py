@@ -0,0 +1,108 @@
+"""Memory benchmark of the data models: how much memory the parsed kanji and kotoba take up once loaded, and how large
+and how quick to load their pickles (as kept in the parse cache) are. The objects are either parsed from the fixture
+pages in benchmarks/fixtures/, many times over, or loaded from an existing parse cache of the full corpus, e.g.
+
+    python benchmarks/model_memory.py --scale 500
+    python benchmarks/model_memory.py --cache build/cache/parse_cache.sqlite3 --compare before.json
+
+Run it from the directory holding supplementary/ when parsing the fixtures.
+"""
+import argparse
+import gc
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import kanjipedia_collator
+from data_models import SCHEMA_VERSION
+from pipeline import load_fixtures
+
+def fixture_pickles(scale: int) -> dict[str, list[bytes]]:
+    "One pickle per parsed page, as the parse cache keeps them, of every fixture page `scale` times over, by kind."
+    pickles = {}
+    for kind, pages in load_fixtures().items():
+        results = [kanjipedia_collator.PAGE_PARSERS[kind](data.decode(), "bs4") for _, data in pages]
+        pickles[kind] = [pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL) for _ in range(scale) for result in results]
+    return pickles
+
+def cached_pickles(path: str) -> dict[str, list[bytes]]:
+    "The pickles of every page in a parse cache, by kind, re-pickled so as to use the current models' layout."
+    pickles = {}
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for kind, data in connection.execute("SELECT kind, data FROM parsed ORDER BY kind, name"):
+            pickles.setdefault(kind, []).append(pickle.dumps(pickle.loads(data), protocol=pickle.HIGHEST_PROTOCOL))
+    finally:
+        connection.close()
+    return pickles
+
+def measure(blobs: list[bytes], repeat: int) -> dict:
+    "Size of the pickles, the best time of `repeat` loads of all of them, and the memory the loaded objects take up."
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        objects = [pickle.loads(blob) for blob in blobs]
+        times.append(time.perf_counter() - start)
+        del objects
+
+    gc.collect()
+    tracemalloc.start()
+    objects = [pickle.loads(blob) for blob in blobs]
+    resident, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "objects": len(objects),
+        "resident_bytes": resident,
+        "pickle_bytes": sum(map(len, blobs)),
+        "load_seconds": min(times),
+    }
+
+def print_results(results: dict, baseline: Optional[dict] = None) -> None:
+    def change(kind: str, key: str) -> str:
+        old = baseline and baseline["kinds"].get(kind, {}).get(key)
+        return f" ({(results['kinds'][kind][key] - old) / old:+.1%})" if old else ""
+
+    print(f"Schema version {results['schema_version']}:")
+    for kind, stats in results["kinds"].items():
+        print(f"  {kind:<8} {stats['objects']:7} objects   "
+              f"resident {stats['resident_bytes'] / 1024 / 1024:8.2f} MiB{change(kind, 'resident_bytes')}   "
+              f"pickled {stats['pickle_bytes'] / 1024 / 1024:8.2f} MiB{change(kind, 'pickle_bytes')}   "
+              f"load {stats['load_seconds'] * 1000:8.1f} ms{change(kind, 'load_seconds')}")
+
+def main():
+    cli_parser = argparse.ArgumentParser(prog="model-memory-benchmark", description="Benchmark the data models' memory use")
+    cli_parser.add_argument("--scale", type=int, default=200,
+                            help="how many times over to load the parsed fixtures (default: 200)")
+    cli_parser.add_argument("--cache", metavar="PATH", help="load the pages of this parse cache instead of the fixtures")
+    cli_parser.add_argument("--repeat", type=int, default=5, help="loads to time, of which the best is kept (default: 5)")
+    cli_parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    cli_parser.add_argument("--compare", metavar="PATH", help="results of an earlier run to show the changes against")
+    args = cli_parser.parse_args()
+
+    pickles = cached_pickles(args.cache) if args.cache else fixture_pickles(args.scale)
+    results = {
+        "schema_version": SCHEMA_VERSION,
+        "source": args.cache or f"fixtures x{args.scale}",
+        "kinds": {kind: measure(blobs, args.repeat) for kind, blobs in pickles.items()},
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, mode="w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
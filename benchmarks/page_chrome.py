@@ -0,0 +1,206 @@
+"""The parts of a Kanjipedia page around its entry: the <head> full of metadata, stylesheets and scripts, the site header
+and search form, the side column of rankings and indices, and the site map and tracking scripts of the footer. These
+make up most of a real page, tens of KB of it, and are added to the bare pages of the fixtures and of the synthetic
+corpus so that they're as large, and as slow to parse, as real ones. The full-size fixtures were written with
+
+    python benchmarks/page_chrome.py benchmarks/fixtures/kanji/0000005.html benchmarks/fixtures/kanji/full-0000005.html
+    python benchmarks/page_chrome.py benchmarks/fixtures/kotoba/0000020600.html benchmarks/fixtures/kotoba/full-0000020600.html --seed 1
+
+None of it is anything the collator reads, and it's kept clear of what it looks for (level images, stroke counts, kotoba
+links and the like), so pages parse the same with it as without.
+"""
+import argparse
+import html
+import random
+import re
+
+NAVIGATION = [
+    ("/", "トップ"), ("/sakuin/onkun", "音訓索引"), ("/sakuin/bushu", "部首索引"), ("/sakuin/kakusu", "総画数索引"),
+    ("/sakuin/honbun", "言葉索引"), ("/sakuin/yojijyukugo", "四字熟語索引"), ("/sakuin/koji_kotowaza", "故事・ことわざ索引"),
+    ("/sakuin/jyukujikun_ateji", "熟字訓・当て字索引"), ("/sakuin/doukunigi", "同訓異義"), ("/about", "漢字ペディアとは"),
+    ("/help", "使い方"), ("/faq", "よくある質問"), ("/news", "お知らせ"), ("/contact", "お問い合わせ"),
+]
+GOJUUON = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわ"
+SITE_MAP = [
+    "漢字ペディアについて", "利用規約", "プライバシーポリシー", "著作権について", "推奨環境", "サイトマップ", "運営団体",
+    "漢検とは", "漢検の受検案内", "漢字カフェ", "漢字の学習", "漢字の豆知識", "漢字ミュージアム", "広告掲載について",
+]
+SCRIPTS = [
+    "/common/js/jquery.js", "/common/js/jquery.easing.js", "/common/js/jquery.cookie.js", "/common/js/common.js",
+    "/common/js/search.js", "/common/js/rollover.js", "/common/js/smoothscroll.js", "/common/js/history.js",
+    "/common/js/slick.min.js", "/common/js/ofi.min.js",
+]
+STYLESHEETS = ["/common/css/reset.css", "/common/css/base.css", "/common/css/layout.css", "/common/css/module.css",
+               "/common/css/kanji.css", "/common/css/kotoba.css", "/common/css/print.css", "/common/css/slick.css"]
+# Characters to fill the side column's lists with; kept to kanji, as the collator's regexes only look for markup
+RANKING_CHARACTERS = "亜哀挨愛曖悪握圧扱宛嵐安案暗以衣位囲医依委威為畏胃尉異移萎偉椅彙意違維慰遺緯域育一壱逸茨芋引印因咽姻"
+
+def head_extras(generator: random.Random, title: str) -> str:
+    "Metadata, stylesheets and scripts, including the inline configuration and styles that real pages carry."
+    metadata = [
+        '<meta name="viewport" content="width=device-width, initial-scale=1">',
+        '<meta http-equiv="X-UA-Compatible" content="IE=edge">',
+        f'<meta name="description" content="{title}。漢字ペディアは、日本漢字能力検定協会が運営する漢字・言葉の辞書サイトです。">',
+        '<meta name="keywords" content="漢字,漢字辞典,読み方,意味,部首,画数,成り立ち,熟語,四字熟語,故事,ことわざ,漢検">',
+        f'<meta property="og:title" content="{title}｜漢字ペディア">',
+        '<meta property="og:type" content="article">',
+        '<meta property="og:image" content="https://www.kanjipedia.jp/common/images/ogp.png">',
+        '<meta property="og:site_name" content="漢字ペディア">',
+        '<meta name="twitter:card" content="summary_large_image">',
+        '<meta name="format-detection" content="telephone=no">',
+        '<link rel="icon" href="/favicon.ico">',
+        '<link rel="apple-touch-icon" href="/common/images/apple-touch-icon.png">',
+    ]
+    metadata += [f'<link rel="stylesheet" href="{stylesheet}?v={generator.randrange(10 ** 8)}">' for stylesheet in STYLESHEETS]
+    metadata += [f'<script src="{script}?v={generator.randrange(10 ** 8)}"></script>' for script in SCRIPTS]
+    rules = "\n".join(
+        f".module{i} .item{j}{{margin:{generator.randint(0, 40)}px {generator.randint(0, 40)}px;"
+        f"font-size:{generator.randint(10, 24)}px;color:#{generator.randrange(16 ** 6):06x};line-height:1.{generator.randint(2, 9)}}}"
+        for i in range(24) for j in range(6)
+    )
+    configuration = ",\n".join(
+        f'  "slot{i}": {{"id": "div-gpt-ad-{generator.randrange(10 ** 13)}-{i}", "sizes": [[300, 250], [336, 280]], '
+        f'"targeting": {{"page": "dictionary", "position": {i}}}}}'
+        for i in range(40)
+    )
+    return "\n".join(metadata) + f"""
+<style>
+{rules}
+</style>
+<script>
+window.dataLayer = window.dataLayer || [];
+function gtag(){{dataLayer.push(arguments);}}
+gtag('js', new Date());
+gtag('config', 'G-{generator.randrange(16 ** 10):010X}');
+var adSlots = {{
+{configuration}
+}};
+for (var i = 0; i < 40 && i < adSlots.length; i++) {{ defineSlot(adSlots["slot" + i]); }}
+</script>
+"""
+
+def site_header() -> str:
+    "The site's logo, search form and navigation, which come before the entry."
+    options = "\n".join(f'<li><label><input type="radio" name="sk" value="{value}"{" checked" if value == "perfect" else ""}>'
+                        f'{label}</label></li>'
+                        for value, label in (("perfect", "完全一致"), ("forward", "前方一致"), ("backward", "後方一致"),
+                                             ("partial", "部分一致")))
+    navigation = "\n".join(f'<li><a href="{href}">{label}</a></li>' for href, label in NAVIGATION)
+    return f"""<!-- ▼ヘッダー -->
+<div id="siteHeader">
+<p class="siteLogo"><a href="/"><img src="/common/images/logo.png" alt="漢字ペディア" width="240" height="48"></a></p>
+<div id="searchBox">
+<form action="/search" method="get">
+<ul class="searchTarget">
+<li><label><input type="radio" name="kt" value="1" checked>漢字</label></li>
+<li><label><input type="radio" name="kt" value="2">言葉</label></li>
+</ul>
+<p class="searchInput"><input type="text" name="k" value="" placeholder="漢字・言葉を入力" maxlength="40"><button type="submit">検索</button></p>
+<ul class="searchMethod">
+{options}
+</ul>
+</form>
+</div>
+<ul id="siteNav">
+{navigation}
+</ul>
+</div>
+<!-- ▲ヘッダー -->
+"""
+
+def side_column(generator: random.Random) -> str:
+    "Banners, rankings of kanji and the kana and radical indices, which come after the entry."
+    ranking = "\n".join(
+        f'<li><span class="rank">{rank}</span><a href="/kanji/{generator.randrange(10 ** 10):010}">'
+        f'{generator.choice(RANKING_CHARACTERS)}</a></li>'
+        for rank in range(1, 51)
+    )
+    recent = "\n".join(f'<li><a href="/kanji/{generator.randrange(10 ** 10):010}">{character}</a></li>'
+                       for character in generator.sample(RANKING_CHARACTERS, 20))
+    kana = "\n".join(f'<li><a href="/sakuin/honbun/{kana}">{kana}</a></li>' for kana in GOJUUON)
+    radicals = "\n".join(f'<li><a href="/sakuin/bushu/{number}"><img src="/common/images/bushu_s/{number}.png" '
+                         f'alt="部首{number}" width="24" height="24"></a></li>'
+                         for number in range(1, 215))
+    banners = "\n".join(f'<li><a href="/banner/{number}" target="_blank"><img src="/common/images/banner/{number}.jpg" '
+                        f'alt="バナー{number}" width="300" height="100"></a></li>'
+                        for number in range(1, 9))
+    return f"""<!-- ▼サイドカラム -->
+<div id="sideColumn">
+<div class="adArea"><div id="div-gpt-ad-side-1" style="width:300px;height:250px;"></div></div>
+<section class="sideRanking">
+<h2>よく検索される漢字</h2>
+<ol>
+{ranking}
+</ol>
+</section>
+<section class="sideHistory">
+<h2>最近見た漢字</h2>
+<ul>
+{recent}
+</ul>
+</section>
+<section class="sideIndex">
+<h2>言葉を五十音から探す</h2>
+<ul class="gojuon">
+{kana}
+</ul>
+<h2>部首から探す</h2>
+<ul class="bushuList">
+{radicals}
+</ul>
+</section>
+<ul class="sideBanner">
+{banners}
+</ul>
+<div class="adArea"><div id="div-gpt-ad-side-2" style="width:300px;height:600px;"></div></div>
+</div>
+<!-- ▲サイドカラム -->
+"""
+
+def site_footer() -> str:
+    "The site map and the tracking scripts, which come before the footer's copyright notice."
+    links = "\n".join(f'<li><a href="/info/{number}">{label}</a></li>' for number, label in enumerate(SITE_MAP, start=1))
+    return f"""<!-- ▼フッター -->
+<div id="siteMap">
+<ul>
+{links}
+</ul>
+<p class="pageTop"><a href="#container"><img src="/common/images/pagetop.png" alt="ページの先頭へ"></a></p>
+</div>
+<script>
+(function(w, d, s, l, i) {{
+  w[l] = w[l] || []; w[l].push({{"gtm.start": new Date().getTime(), event: "gtm.js"}});
+  var f = d.getElementsByTagName(s)[0], j = d.createElement(s), dl = l != "dataLayer" ? "&l=" + l : "";
+  j.async = true; j.src = "https://www.googletagmanager.com/gtm.js?id=" + i + dl; f.parentNode.insertBefore(j, f);
+}})(window, document, "script", "dataLayer", "GTM-KANJIPD");
+$(function() {{ if ($(window).width() < 768) {{ $("#sideColumn").insertAfter("#contents"); }} }});
+</script>
+<noscript><iframe src="https://www.googletagmanager.com/ns.html?id=GTM-KANJIPD" height="0" width="0" style="display:none"></iframe></noscript>
+<!-- ▲フッター -->
+"""
+
+def add_chrome(page: str, generator: random.Random) -> str:
+    """The page with the site's chrome added around its entry: in its <head>, after its <body> opens, and before its
+    footer, as on Kanjipedia. Pages are expected to be laid out like the fixtures.
+    """
+    title_start, title_end = page.find("<title>"), page.find("</title>")
+    title = page[title_start + len("<title>"):title_end].split("｜")[0] if title_start != -1 else ""
+    title = html.escape(re.sub(r"<[^>]*>", "", title))  # e.g. of headwords shown as images, which can't go in attributes
+    page = page.replace("</head>", head_extras(generator, title) + "</head>", 1)
+    page = page.replace("<body>\n", "<body>\n" + site_header(), 1)
+    return page.replace('<div id="footer">', side_column(generator) + site_footer() + '<div id="footer">', 1)
+
+def main():
+    cli_parser = argparse.ArgumentParser(prog="page-chrome", description="Add Kanjipedia's page chrome to a bare page")
+    cli_parser.add_argument("input")
+    cli_parser.add_argument("output")
+    cli_parser.add_argument("--seed", type=int, default=0, help="seed of the generated content (default: 0)")
+    args = cli_parser.parse_args()
+
+    with open(args.input) as f:
+        page = f.read()
+    with open(args.output, mode="w") as f:
+        f.write(add_chrome(page, random.Random(args.seed)))
+
+if __name__ == "__main__":
+    main()
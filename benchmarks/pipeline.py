@@ -0,0 +1,215 @@
+"""Collation pipeline benchmark over the checked-in pages in benchmarks/fixtures/: how long each page takes to parse with
+each extraction engine, and how long, how much memory and how much output each stage of a full compile takes. Run it
+from the directory holding supplementary/, e.g.
+
+    python benchmarks/pipeline.py --scale 50 --compare build/benchmarks/pipeline-20260101-120000.json
+
+Most fixtures are reduced to the entry itself; the full-* ones carry the site's chrome as well (see page_chrome.py),
+as real pages do, and --chrome adds it to all of them, for timings of pages the size of real ones throughout.
+
+Results are written as JSON (by default to build/benchmarks/), so that later runs can be compared against them.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import kanjipedia_collator
+from export_writers import kanji_as_dict, kotoba_as_dict, write_jsonl, write_tsv
+from kotoba_store import KOTOBA_KIND
+from page_chrome import add_chrome
+from sqlite_export import write_sqlite_database
+
+FIXTURES_DIRECTORY = os.path.join(REPOSITORY_ROOT, "benchmarks", "fixtures")
+RESULTS_DIRECTORY = "build/benchmarks"
+RESULTS_FORMAT_VERSION = 1
+KINDS = {"kanji": "kanji", "kotoba": KOTOBA_KIND}  # Fixture directory: page kind
+FULL_SIZE_PREFIX = "full-"  # Of the fixtures that already carry the site's chrome
+
+def load_fixtures(chrome: bool = False) -> dict[str, list[tuple[str, bytes]]]:
+    "(name, content) pairs of the fixture pages, by kind; with `chrome`, every page is made full-size."
+    fixtures = {}
+    for directory, kind in KINDS.items():
+        fixtures[kind] = []
+        for path in sorted(glob.glob(os.path.join(FIXTURES_DIRECTORY, directory, "*.html"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path, mode="rb") as f:
+                data = f.read()
+            if chrome and not name.startswith(FULL_SIZE_PREFIX):
+                data = add_chrome(data.decode(), random.Random(name)).encode()
+            fixtures[kind].append((name, data))
+    return fixtures
+
+def time_per_page(fixtures: dict[str, list[tuple[str, bytes]]], repeat: int) -> dict:
+    "Median time to parse each fixture page, by kind, engine and page name, in milliseconds, and the size of each page."
+    results = {}
+    for kind, pages in fixtures.items():
+        parse = kanjipedia_collator.PAGE_PARSERS[kind]
+        for engine in kanjipedia_collator.ENGINES:
+            timings = {}
+            for name, data in pages:
+                page = data.decode()
+                parse(page, engine)  # Warm up, e.g. the supplementary tables' connection
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    parse(page, engine)
+                    times.append(time.perf_counter() - start)
+                timings[name] = statistics.median(times) * 1000
+            results[f"{kind}/{engine}"] = {"pages": timings, "mean": statistics.fmean(timings.values()),
+                                           "bytes": {name: len(data) for name, data in pages}}
+    return results
+
+def measure(stage: Callable[[], object]) -> tuple[object, float, int]:
+    "Run `stage` twice: once to time it, and once under tracemalloc (which slows it down) for its peak memory."
+    start = time.perf_counter()
+    result = stage()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def build_deck_file(all_kanji: list, all_kotoba: list, path: str) -> None:
+    from anki_deck_generator import write_deck
+    write_deck(all_kanji, all_kotoba, path)
+
+def time_compile(fixtures: dict[str, list[tuple[str, bytes]]], scale: int, jobs: int, engine: str) -> dict:
+    """Parse every fixture page `scale` times over, as if the corpus were that much larger, and write every output from
+    the result. Returns the time, peak traced memory and output size of each stage.
+    """
+    pages = {kind: [(f"{name}-{i}", data) for i in range(scale) for name, data in kind_pages]
+             for kind, kind_pages in fixtures.items()}
+    results = {}
+
+    def parse_stage(kind: str) -> Callable[[], list]:
+        return lambda: [result for _, result in kanjipedia_collator.parse_pages(kind, pages[kind], jobs, engine)]
+
+    parsed = {}
+    for kind in pages:
+        parsed[kind], elapsed, peak = measure(parse_stage(kind))
+        failures = [result for result in parsed[kind] if isinstance(result, kanjipedia_collator.ParseFailure)]
+        if failures:
+            raise RuntimeError(f"{len(failures)} {kind} fixture page(s) could not be parsed:\n{failures[0].error}")
+        results[f"parse {kind}"] = {"seconds": elapsed, "peak_memory": peak, "pages": len(pages[kind])}
+    all_kanji, all_kotoba = parsed["kanji"], parsed[KOTOBA_KIND]
+
+    with tempfile.TemporaryDirectory() as directory:
+        def output(name: str) -> str:
+            return os.path.join(directory, name)
+
+        stages = {
+            "tsv": (lambda: (write_tsv(output("kanji.tsv"), all_kanji), write_tsv(output("kotoba.tsv"), all_kotoba)),
+                    ["kanji.tsv", "kotoba.tsv"]),
+            "json": (lambda: (write_jsonl(output("kanji.jsonl"), all_kanji, kanji_as_dict),
+                              write_jsonl(output("kotoba.jsonl"), all_kotoba, kotoba_as_dict)),
+                     ["kanji.jsonl", "kotoba.jsonl"]),
+            "sqlite": (lambda: write_sqlite_database(all_kanji, all_kotoba, output("kanken.sqlite3")), ["kanken.sqlite3"]),
+            "deck": (lambda: build_deck_file(all_kanji, all_kotoba, output("deck.apkg")), ["deck.apkg"]),
+        }
+        for name, (stage, files) in stages.items():
+            try:
+                _, elapsed, peak = measure(stage)
+            except (ImportError, OSError) as e:
+                # e.g. the deck's templates, which aren't part of the repository, are missing
+                print(f"{name}: skipped ({e})", file=sys.stderr)
+                results[name] = {"skipped": str(e)}
+                continue
+            results[name] = {
+                "seconds": elapsed, "peak_memory": peak,
+                "output_bytes": sum(os.path.getsize(output(file)) for file in files),
+            }
+    results["total"] = {"seconds": sum(stage.get("seconds", 0.0) for stage in results.values())}
+    return results
+
+def git_revision() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=REPOSITORY_ROOT)
+    return result.stdout.strip() if result.returncode == 0 else "unknown"
+
+def print_results(results: dict, baseline: Optional[dict] = None) -> None:
+    def change(new: float, old: Optional[float]) -> str:
+        return f"  ({(new - old) / old:+.1%})" if old else ""
+
+    print("Per-page parse time (median, ms):")
+    for label, timing in results["per_page"].items():
+        old = baseline and baseline["per_page"].get(label, {}).get("mean")
+        print(f"  {label:<16} mean {timing['mean']:7.3f}{change(timing['mean'], old)}")
+        for name, ms in timing["pages"].items():
+            print(f"    {name:<20} {ms:7.3f}   {timing['bytes'][name] / 1024:6.1f} KiB")
+
+    print(f"Compile of {results['scale']}x the fixtures ({results['engine']} engine, {results['jobs']} job(s)):")
+    for name, stage in results["compile"].items():
+        if "skipped" in stage:
+            print(f"  {name:<14} skipped")
+            continue
+        old = baseline and baseline["compile"].get(name, {}).get("seconds")
+        line = f"  {name:<14} {stage['seconds']:8.3f}s{change(stage['seconds'], old)}"
+        if "peak_memory" in stage:
+            line += f"   peak {stage['peak_memory'] / 1024 / 1024:7.2f} MiB"
+        if "output_bytes" in stage:
+            line += f"   output {stage['output_bytes'] / 1024:9.1f} KiB"
+        print(line)
+    print(f"Peak resident memory: {results['max_rss_kib'] / 1024:.1f} MiB")
+
+def main():
+    cli_parser = argparse.ArgumentParser(prog="pipeline-benchmark", description="Benchmark the collation pipeline")
+    cli_parser.add_argument("--repeat", type=int, default=20, help="runs per page for the per-page timings (default: 20)")
+    cli_parser.add_argument("--scale", type=int, default=20,
+                            help="how many times over to parse the fixtures for the compile timings (default: 20)")
+    cli_parser.add_argument("--jobs", "-j", type=int, default=1, help="processes to parse with when compiling (default: 1)")
+    cli_parser.add_argument("--engine", choices=kanjipedia_collator.ENGINES, default="bs4",
+                            help="extraction engine to compile with (default: bs4)")
+    cli_parser.add_argument("--chrome", action="store_true",
+                            help="add the site's chrome to every fixture page, so that all of them are full-size")
+    cli_parser.add_argument("--json", metavar="PATH",
+                            help=f"where to write the results (default: a timestamped file in {RESULTS_DIRECTORY}/)")
+    cli_parser.add_argument("--compare", metavar="PATH", help="results of an earlier run to show the changes against")
+    args = cli_parser.parse_args()
+
+    fixtures = load_fixtures(args.chrome)
+    now = datetime.datetime.now()
+    results = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "timestamp": now.isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": args.scale,
+        "jobs": args.jobs,
+        "engine": args.engine,
+        "chrome": args.chrome,
+        "per_page": time_per_page(fixtures, args.repeat),
+        "compile": time_compile(fixtures, args.scale, args.jobs, args.engine),
+        # Kilobytes on Linux (bytes on macOS), for this process only; parse workers, if any, aren't counted
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    path = args.json or os.path.join(RESULTS_DIRECTORY, f"pipeline-{now:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, mode="w") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"Results written to {path}")
+
+if __name__ == "__main__":
+    main()
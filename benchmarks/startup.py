@@ -0,0 +1,56 @@
+"""Startup benchmark: how long each entry point takes to import in a fresh interpreter, and how long the supplementary
+tables in global_data take to load on first access. Run it from the directory holding supplementary/, e.g.
+
+    python benchmarks/startup.py --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["global_data", "kanjipedia_scraper", "kanjipedia_collator", "kanken_processor"]
+TABLES = ["KANJI_READINGS", "IMAGE_NAME_TO_RADICAL", "HEADWORD_KANJI_TO_UNICODE", "SPECIAL_IMAGE_EXCEPTIONS",
+          "KANJI_ETYMOLOGIES", "PITCH_ACCENTS"]
+
+def time_in_fresh_interpreter(setup: str, statement: str) -> float:
+    "Seconds taken by `statement` in a new interpreter, after running `setup`."
+    program = f"{setup}\nimport time\nstart = time.perf_counter()\n{statement}\nprint(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-c", program], capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": REPOSITORY_ROOT}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout)
+
+def measure(label: str, setup: str, statement: str, repeat: int, results: dict) -> None:
+    try:
+        times = [time_in_fresh_interpreter(setup, statement) for _ in range(repeat)]
+    except RuntimeError as e:
+        print(f"{label:<52} failed: {e}")
+        return
+    results[label] = {"median": statistics.median(times), "min": min(times)}
+    print(f"{label:<52} median {statistics.median(times) * 1000:8.1f} ms   min {min(times) * 1000:8.1f} ms")
+
+def main():
+    cli_parser = argparse.ArgumentParser(prog="startup-benchmark", description="Benchmark import and table load times")
+    cli_parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (default: 5)")
+    cli_parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = cli_parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        measure(f"import {module}", "", f"import {module}", args.repeat, results)
+    for table in TABLES:
+        measure(f"first access of global_data.{table}", "import global_data", f"global_data.{table}", args.repeat, results)
+
+    if args.json:
+        with open(args.json, mode="w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
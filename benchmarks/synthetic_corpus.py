@@ -0,0 +1,299 @@
+"""Synthetic Kanjipedia corpus generator, for finding out how the collator and exporters scale to corpora many times the
+size of the real one. Pages are laid out like Kanjipedia's (see benchmarks/fixtures/) and filled with real characters,
+readings and radicals from the supplementary data, so that they parse like real pages. Run it from the directory holding
+supplementary/, e.g.
+
+    python benchmarks/synthetic_corpus.py --kanji 60000 --kotoba 400000 --mix hyougai=0.5 --chrome
+    cd build/synthetic && python ../../kanken_processor.py compile-all --engine fast
+
+By default the pages are written into a pack store and kotoba store under build/synthetic/kanjipedia/, as the scraper
+would, with supplementary/ linked in beside them, so that kanken_processor.py can be run on them from that directory.
+With --chrome, pages carry the site's header, side column and scripts (see page_chrome.py), and are as large as real ones.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from dataclasses import dataclass
+from typing import Iterator
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import global_data
+from corpus_pack import PackStore
+from kotoba_store import KOTOBA_KIND, KotobaStore
+from page_chrome import add_chrome
+from supplementary.pronunciation.accent_tsv_to_json import read_accent_rows
+
+OUTPUT_DIRECTORY = "build/synthetic"
+KOTOBA_INDEX = "kotoba"  # The index parse_all_kotoba reads by default
+
+# How often each feature appears, as the fraction of kanji or kotoba pages that have it
+FEATURES = {
+    "hyougai": 0.15,  # Kanji: a kun reading marked as outside the jōyō list
+    "kokuji": 0.03,  # Kanji: marked as a kokuji
+    "origin": 0.4,  # Kanji: has a glyph origin explanation
+    "multi_meaning": 0.5,  # Kanji: several numbered meanings, with sub-meanings
+    "image_headword": 0.05,  # Kanji: headword shown as an nw_ image (see headword_kanji_to_unicode.json)
+    "known_word": 0.6,  # Kotoba: a real word and reading from the accent data, rather than random kanji
+    "jukujikun": 0.05,  # Kotoba: headword in angle brackets
+    "usage_symbols": 0.1,  # Kotoba: ▲ and △ marks in the headword
+    "katakana_reading": 0.05,  # Kotoba: reading given in katakana
+    "column": 0.1,  # Kotoba: "■コラムを読んでみよう" advertisement after the explanation
+}
+LEVELS = ["10", "9", "8", "7", "6", "5", "4", "3", "準2", "2", "準1", "1"]
+MEANING_NUMBERS = "一二三四"
+SUBMEANING_NUMBERS = "①②③④⑤"
+FILLER = "意味説明用例語義転用古語比喩雅語俗語文語口語副詞名詞動詞形容"
+HIRAGANA_TO_KATAKANA = {codepoint: codepoint + 0x60 for codepoint in range(0x3041, 0x3097)}
+KATAKANA = {chr(codepoint) for codepoint in range(0x30A1, 0x30F7)}  # Those that normalize_katakana accepts
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="UTF-8">
+<title>{title}｜漢字ペディア</title>
+<link rel="stylesheet" href="/common/css/style.css">
+<script src="/common/js/jquery.js"></script>
+</head>
+<body>
+<div id="header"><ul id="gNav"><li><a href="/">トップ</a></li><li><a href="/sakuin/honbun">索引</a></li></ul></div>
+<div id="container">
+<div id="contents">
+"""
+PAGE_FOOT = """</div>
+</div>
+<div id="footer"><p>Copyright 公益財団法人 日本漢字能力検定協会</p></div>
+</body>
+</html>
+"""
+HYOUGAI_ICON = '<img alt="外" src="/common/images/icon_loanword.png"/>'
+
+@dataclass
+class SourceData:
+    "The real data that synthetic pages are filled from."
+    kanji: list[str]  # Characters with readings in kanji_readings.json
+    readings: dict[str, dict[str, list[str]]]
+    radicals: list[tuple[str, str]]  # (image name, radical) pairs
+    image_headwords: list[tuple[str, str]]  # (nw_ image number, character) pairs
+    words: list[tuple[str, str]]  # (word, reading) pairs with pitch accents
+
+def load_source_data() -> SourceData:
+    with open(global_data.KANJI_READINGS_PATH) as f:
+        readings = json.load(f)
+    with open(global_data.IMAGE_NAME_TO_RADICAL_PATH) as f:
+        radicals = sorted(json.load(f).items())
+    with open(global_data.HEADWORD_KANJI_TO_UNICODE_PATH) as f:
+        image_headwords = sorted((number, kanji) for number, kanji in json.load(f).items() if kanji in readings)
+    words = sorted({
+        (word, reading) for word, reading, _ in read_accent_rows(global_data.PITCH_ACCENTS_PATH)
+        if any(char in readings for char in word)
+    })
+    return SourceData(sorted(readings), readings, radicals, image_headwords, words)
+
+def to_katakana(reading: str) -> str:
+    return reading.translate(HIRAGANA_TO_KATAKANA)
+
+def on_readings(source: SourceData, kanji: str) -> list[str]:
+    "The kanji's on readings in katakana, as Kanjipedia gives them; only those the collator can convert back are kept."
+    readings = source.readings[kanji]
+    on = dict.fromkeys(to_katakana(reading.strip()) for kind in ("on", "goon", "kanon", "kanyoon", "toon", "soon")
+                       for reading in readings[kind])
+    return [reading for reading in on if reading and set(reading) <= KATAKANA]
+
+def kun_html(generator: random.Random, source: SourceData, kanji: str, hyougai: bool) -> str:
+    readings = []
+    for reading in source.readings[kanji]["kun"]:
+        base, _, okurigana = reading.strip().partition("-")
+        if not base:
+            continue
+        readings.append(f'{base}<span class="txtNormal">{okurigana}</span>' if okurigana else base)
+    if hyougai and readings:
+        # Kanjipedia marks hyougai readings with an icon, and lists them after the others
+        position = generator.randrange(len(readings))
+        readings.append(HYOUGAI_ICON + readings.pop(position))
+    return "・".join(readings)
+
+def filler(generator: random.Random, length: int) -> str:
+    return "".join(generator.choices(FILLER, k=length)) + "。"
+
+def meaning_html(generator: random.Random, multi_meaning: bool) -> str:
+    if not multi_meaning:
+        return filler(generator, generator.randint(4, 20))
+    meanings = []
+    for number in MEANING_NUMBERS[:generator.randint(2, len(MEANING_NUMBERS))]:
+        meaning = f'<img src="/common/images/icon_{number}.png" alt="{number}">{filler(generator, generator.randint(3, 12))}'
+        if generator.random() < 0.5:
+            meaning += "\n" + "".join(f"{digit}{filler(generator, generator.randint(2, 8))}"
+                                      for digit in SUBMEANING_NUMBERS[:generator.randint(2, len(SUBMEANING_NUMBERS))])
+        meanings.append(meaning)
+    return "".join(meanings)
+
+def kanji_page(generator: random.Random, source: SourceData, mix: dict[str, float], kotoba_links: list[tuple[str, str]]) -> str:
+    def has(feature: str) -> bool:
+        return generator.random() < mix[feature]
+
+    if has("image_headword") and source.image_headwords:
+        number, kanji = generator.choice(source.image_headwords)
+        headword = f'<img src="/common/images/kanji/180/nw_{number}.png">'
+    else:
+        kanji = generator.choice(source.kanji)
+        headword = kanji
+    radical_image, radical = generator.choice(source.radicals)
+    strokes = generator.randint(1, 30)
+
+    body = f"""<div id="kanjiLeftSection">
+<p id="kanjiOyaji">{headword}</p>
+<div class="kanjiLevel"><img src="/common/images/level/kyu.png" alt="{generator.choice(LEVELS)}級"></div>
+{'<p class="kokuji"><img src="/common/images/icon_kokuji.gif" alt="国字"></p>' if has("kokuji") else ""}
+<ul class="kanjiYomi">
+<li><div class="onkunIcon"><img src="/common/images/icon_on.png" alt="音"></div><p class="onkunYomi">{"・".join(on_readings(source, kanji))}</p></li>
+<li><div class="onkunIcon"><img src="/common/images/icon_kun.png" alt="訓"></div><p class="onkunYomi">{kun_html(generator, source, kanji, has("hyougai"))}</p></li>
+</ul>
+<div class="kanjiBushuArea"><p class="kanjiBushu">部首</p><p><a href="/bushu/{radical_image}"><img src="/common/images/bushu/{radical_image}.png" alt="{radical}"></a></p></div>
+<p class="kanjiKakusu">画数：({strokes})<br>部首内画数{generator.randint(0, strokes - 1)}</p>
+</div>
+<div id="kanjiRightSection">
+<div class="kanjiMeaning">
+<p>{meaning_html(generator, has("multi_meaning"))}</p>
+</div>
+"""
+    if has("origin"):
+        body += f"""<div class="kanjiOrigin">
+<h3>成り立ち</h3>
+<p class="originSource"><a href="https://promo.kadokawa.co.jp/shinjigen/" target="_blank">出典：『角川新字源』</a></p>
+<p>{filler(generator, generator.randint(10, 40))}</p>
+</div>
+"""
+    body += '<h3>熟語</h3>\n<ul class="kotobaList">\n'
+    body += "".join(f'<li><a href="/kotoba/{kotoba_id}">{word}</a></li>\n' for kotoba_id, word in kotoba_links)
+    body += "</ul>\n</div>\n"
+    return PAGE_HEAD.format(title=f"「{kanji}」の部首・画数・読み方・意味など") + body + PAGE_FOOT
+
+def kotoba_word(generator: random.Random, source: SourceData, mix: dict[str, float]) -> tuple[str, str]:
+    "A (headword, reading) pair for a kotoba page, headword marks included."
+    if generator.random() < mix["known_word"] and source.words:
+        word, reading = generator.choice(source.words)
+    else:
+        characters = generator.choices(source.kanji, k=generator.randint(2, 4))
+        word = "".join(characters)
+        reading = "".join(
+            (source.readings[kanji]["kun"] or source.readings[kanji]["kanon"] or source.readings[kanji]["goon"] or ["か"])[0]
+            .strip().replace("-", "")
+            for kanji in characters
+        )
+    if generator.random() < mix["usage_symbols"]:
+        position = generator.randrange(len(word))
+        word = word[:position] + generator.choice("▲△") + word[position:]
+    if generator.random() < mix["jukujikun"]:
+        word = f"〈{word}〉"
+    if generator.random() < mix["katakana_reading"]:
+        reading = to_katakana(reading)
+    return word, reading
+
+def kotoba_page(generator: random.Random, source: SourceData, mix: dict[str, float], word: str, reading: str) -> str:
+    paragraphs = [filler(generator, generator.randint(10, 60)) for _ in range(generator.randint(1, 3))]
+    if generator.random() < mix["column"]:
+        paragraphs.append(f"■コラムを読んでみよう\n「{word[0]}」のつく言葉")
+    body = f"""<div id="kotobaArea">
+<div class="kotobaHead">
+<p>{word}</p>
+<p class="kotobaYomi">{reading}</p>
+</div>
+</div>
+<div id="kotobaExplanationSection">
+""" + "".join(f"<p>{paragraph}</p>\n" for paragraph in paragraphs) + "</div>\n"
+    return PAGE_HEAD.format(title=f"「{word}」の意味・読み方") + body + PAGE_FOOT
+
+def generate_pages(kanji_count: int, kotoba_count: int, mix: dict[str, float], seed: int,
+                   chrome: bool = False) -> Iterator[tuple[str, str, str]]:
+    """Yield (kind, name, page) for `kanji_count` kanji pages and `kotoba_count` kotoba pages, each kotoba linked from
+    one of the kanji pages, with the site's chrome if `chrome`. The same seed always gives the same pages.
+    """
+    if chrome:
+        chrome_generator = random.Random(seed)  # Of its own, so that the entries are the same with chrome as without
+        for kind, name, page in generate_pages(kanji_count, kotoba_count, mix, seed):
+            yield kind, name, add_chrome(page, chrome_generator)
+        return
+
+    generator = random.Random(seed)
+    source = load_source_data()
+    kotoba_per_kanji, extra = divmod(kotoba_count, max(kanji_count, 1))
+    kotoba_number = 0
+    for kanji_number in range(kanji_count):
+        links = []
+        for _ in range(kotoba_per_kanji + (kanji_number < extra)):
+            kotoba_id = f"{kotoba_number:010}"
+            word, reading = kotoba_word(generator, source, mix)
+            yield KOTOBA_KIND, kotoba_id, kotoba_page(generator, source, mix, word, reading)
+            links.append((kotoba_id, word))
+            kotoba_number += 1
+        yield "kanji", f"S{kanji_number:07}", kanji_page(generator, source, mix, links)
+
+def write_pack(directory: str, pages: Iterator[tuple[str, str, str]]) -> None:
+    "Store the pages as the scraper would, with supplementary/ linked in so that the collator can be run from `directory`."
+    pack = PackStore(os.path.join(directory, "kanjipedia", "pack"))
+    kotoba_store = KotobaStore(pack, os.path.join(directory, "kanjipedia", "kotoba", "membership.sqlite3"))
+    kotoba_ids = []
+    for count, (kind, name, page) in enumerate(pages, start=1):
+        pack.put(kind, name, page.encode(), commit=False)
+        if kind == KOTOBA_KIND:
+            kotoba_ids.append(name)
+        if count % 10000 == 0:
+            pack.commit()
+            print(f"{count} pages written...", file=sys.stderr)
+    pack.commit()
+    kotoba_store.add_membership(KOTOBA_INDEX, kotoba_ids)
+    pack.close()
+
+    for linked in ("supplementary", "anki"):
+        link, target = os.path.join(directory, linked), os.path.abspath(linked)
+        if os.path.exists(target) and not os.path.lexists(link):
+            os.symlink(target, link)
+
+def write_html(directory: str, pages: Iterator[tuple[str, str, str]]) -> None:
+    "Write the pages as loose .html files, one directory per kind."
+    for kind, name, page in pages:
+        os.makedirs(os.path.join(directory, kind), exist_ok=True)
+        with open(os.path.join(directory, kind, f"{name}.html"), mode="w") as f:
+            f.write(page)
+
+def parse_mix(values: list[str]) -> dict[str, float]:
+    mix = dict(FEATURES)
+    for value in values:
+        feature, _, fraction = value.partition("=")
+        if feature not in FEATURES:
+            raise argparse.ArgumentTypeError(f"Unknown feature {feature}; choose from {', '.join(FEATURES)}")
+        mix[feature] = float(fraction)
+    return mix
+
+def main():
+    cli_parser = argparse.ArgumentParser(prog="synthetic-corpus", description="Generate a synthetic Kanjipedia corpus")
+    cli_parser.add_argument("--kanji", type=int, default=6000, help="number of kanji pages (default: 6000)")
+    cli_parser.add_argument("--kotoba", type=int, default=40000, help="number of kotoba pages (default: 40000)")
+    cli_parser.add_argument("--mix", action="append", default=[], metavar="FEATURE=FRACTION",
+                            help=f"fraction of pages with a feature; may be given more than once. Features (and their "
+                                 f"defaults): {', '.join(f'{feature} ({fraction})' for feature, fraction in FEATURES.items())}")
+    cli_parser.add_argument("--seed", type=int, default=0, help="seed of the generated content (default: 0)")
+    cli_parser.add_argument("--chrome", action="store_true",
+                            help="add the site's header, side column and scripts to every page, as on real pages")
+    cli_parser.add_argument("--format", choices=["pack", "html"], default="pack",
+                            help="write a pack store that the collator can read (default), or loose .html files")
+    cli_parser.add_argument("--output", default=OUTPUT_DIRECTORY, help=f"directory to write to (default: {OUTPUT_DIRECTORY})")
+    args = cli_parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        cli_parser.error(str(e))
+    pages = generate_pages(args.kanji, args.kotoba, mix, args.seed, args.chrome)
+    os.makedirs(args.output, exist_ok=True)
+    if args.format == "pack":
+        write_pack(args.output, pages)
+    else:
+        write_html(args.output, pages)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import zlib
+from typing import Iterable, Iterator, Optional
+
+PACK_PATH = "kanjipedia/pack"
+SEGMENT_SIZE = 64 * 1024 * 1024  # Start a new segment file once the current one grows past this many bytes
+
+# Loose-file layout used before the pack store existed, as (kind, directory) pairs
+LEGACY_DIRECTORIES = [
+    ("kanji", "kanjipedia/kanji"),
+    ("kotoba", "kanjipedia/kotoba/entries"),
+]
+LEGACY_INDEX_DIRECTORY = "kanjipedia/indices"
+
+class PackStore:
+    """Content-addressed store for the raw Kanjipedia corpus. Pages are zlib-compressed one by one and appended to
+    a handful of large segment files, so that any page can still be read on its own; an SQLite index maps each
+    (kind, name) to the SHA-256 of its content, and each hash to where its compressed bytes live. Identical pages
+    are only ever stored once.
+    """
+    def __init__(self, path: str = PACK_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, "index.sqlite3"))
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS names (
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                hash TEXT NOT NULL REFERENCES blobs (hash),
+                PRIMARY KEY (kind, name)
+            );
+        """)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:05}.pack")
+
+    def _current_segment(self) -> int:
+        (segment,) = self.connection.execute("SELECT COALESCE(MAX(segment), 0) FROM blobs").fetchone()
+        if os.path.exists(self.segment_path(segment)) and os.path.getsize(self.segment_path(segment)) >= SEGMENT_SIZE:
+            segment += 1
+        return segment
+
+    def put(self, kind: str, name: str, data: bytes, *, commit: bool = True) -> str:
+        "Store `data` as the page `name` of `kind`, replacing any previous version. Returns the content hash."
+        content_hash = hashlib.sha256(data).hexdigest()
+        if not self.connection.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash,)).fetchone():
+            compressed = zlib.compress(data, 9)
+            segment = self._current_segment()
+            with open(self.segment_path(segment), mode="ab") as f:
+                offset = f.tell()
+                f.write(compressed)
+            self.connection.execute(
+                "INSERT INTO blobs (hash, segment, offset, length) VALUES (?, ?, ?, ?)",
+                (content_hash, segment, offset, len(compressed))
+            )
+        self.connection.execute("INSERT OR REPLACE INTO names (kind, name, hash) VALUES (?, ?, ?)", (kind, name, content_hash))
+        if commit:
+            self.connection.commit()
+        return content_hash
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def has(self, kind: str, name: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM names WHERE kind = ? AND name = ?", (kind, name)).fetchone() is not None
+
+    def hash_of(self, kind: str, name: str) -> Optional[str]:
+        row = self.connection.execute("SELECT hash FROM names WHERE kind = ? AND name = ?", (kind, name)).fetchone()
+        return row and row[0]
+
+    def hashes(self, kind: str, names: Optional[Iterable[str]] = None) -> dict[str, str]:
+        "Content hashes of every page of `kind`, or only the given names, keyed by name."
+        rows = self.connection.execute("SELECT name, hash FROM names WHERE kind = ? ORDER BY name", (kind,))
+        if names is None:
+            return dict(rows)
+        wanted = set(names)
+        return {name: content_hash for name, content_hash in rows if name in wanted}
+
+    def get(self, kind: str, name: str) -> Optional[bytes]:
+        row = self.connection.execute(
+            "SELECT segment, offset, length FROM names JOIN blobs USING (hash) WHERE kind = ? AND name = ?", (kind, name)
+        ).fetchone()
+        if row is None:
+            return None
+        segment, offset, length = row
+        with open(self.segment_path(segment), mode="rb") as f:
+            f.seek(offset)
+            return zlib.decompress(f.read(length))
+
+    def names(self, kind: str) -> list[str]:
+        return [name for (name,) in self.connection.execute("SELECT name FROM names WHERE kind = ? ORDER BY name", (kind,))]
+
+    def count(self, kind: str) -> int:
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM names WHERE kind = ?", (kind,)).fetchone()
+        return count
+
+    def kinds(self) -> list[str]:
+        return [kind for (kind,) in self.connection.execute("SELECT DISTINCT kind FROM names ORDER BY kind")]
+
+    def items(self, kind: str, names: Optional[Iterable[str]] = None, *, by_name: bool = False) -> Iterator[tuple[str, bytes]]:
+        """Stream (name, content) pairs for every page of `kind`, or only the given names. By default pages come in the
+        order they lie on disk, so that each segment is read front to back; `by_name` sorts them by name instead.
+        """
+        order = "name" if by_name else "segment, offset"
+        rows = self.connection.execute(
+            f"SELECT name, segment, offset, length FROM names JOIN blobs USING (hash) WHERE kind = ? ORDER BY {order}",
+            (kind,)
+        ).fetchall()
+        if names is not None:
+            wanted = set(names)
+            rows = [row for row in rows if row[0] in wanted]
+
+        open_segment, f = None, None
+        try:
+            for name, segment, offset, length in rows:
+                if segment != open_segment:
+                    if f:
+                        f.close()
+                    open_segment, f = segment, open(self.segment_path(segment), mode="rb")
+                f.seek(offset)
+                yield name, zlib.decompress(f.read(length))
+        finally:
+            if f:
+                f.close()
+
+    def import_directory(self, kind: str, directory: str, *, delete: bool = False) -> int:
+        "Pack every .html file in `directory` as a page of `kind`, named after the file. Returns the number of files packed."
+        files = sorted(file for file in os.listdir(directory) if file.endswith(".html"))
+        for file in files:
+            with open(os.path.join(directory, file), mode="rb") as f:
+                self.put(kind, os.path.splitext(file)[0], f.read(), commit=False)
+        self.commit()
+        if delete:
+            for file in files:
+                os.remove(os.path.join(directory, file))
+            if not os.listdir(directory):
+                os.rmdir(directory)
+        return len(files)
+
+    def segments_on_disk(self) -> dict[int, str]:
+        "Path of every segment file in the store, by segment number, whether or not any blob still lies in it."
+        segments = {}
+        for file in os.listdir(self.path):
+            number = file.removeprefix("segment-").removesuffix(".pack")
+            if file.startswith("segment-") and file.endswith(".pack") and number.isdigit():
+                segments[int(number)] = os.path.join(self.path, file)
+        return segments
+
+    def compact(self) -> tuple[int, int]:
+        """Copy the blobs that some page still refers to into new segments, and delete the old ones along with every
+        blob that has been replaced. Returns the total size of the segments before and after.
+        """
+        old_segments = self.segments_on_disk()
+        before = sum(map(os.path.getsize, old_segments.values()))
+        rows = self.connection.execute(
+            "SELECT hash, segment, offset, length FROM blobs WHERE hash IN (SELECT hash FROM names) ORDER BY segment, offset"
+        ).fetchall()
+
+        # Written after every existing segment, so that nothing in use is touched until the index points at the copies
+        segment = max(old_segments, default=-1) + 1
+        moved = []
+        source_segment, source, target = None, None, None
+        try:
+            for content_hash, old_segment, offset, length in rows:
+                if old_segment != source_segment:
+                    if source:
+                        source.close()
+                    source_segment, source = old_segment, open(self.segment_path(old_segment), mode="rb")
+                if target is None or target.tell() >= SEGMENT_SIZE:
+                    if target is not None:
+                        target.close()
+                        segment += 1
+                    target = open(self.segment_path(segment), mode="wb")
+                source.seek(offset)
+                moved.append((segment, target.tell(), content_hash))
+                target.write(source.read(length))
+            if target is not None:
+                target.flush()
+                os.fsync(target.fileno())
+        finally:
+            for f in (source, target):
+                if f:
+                    f.close()
+
+        with self.connection:
+            self.connection.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM names)")
+            self.connection.executemany("UPDATE blobs SET segment = ?, offset = ? WHERE hash = ?", moved)
+        in_use = {segment for (segment,) in self.connection.execute("SELECT DISTINCT segment FROM blobs")}
+        for number, path in self.segments_on_disk().items():
+            if number not in in_use:
+                os.remove(path)
+        return before, sum(map(os.path.getsize, self.segments_on_disk().values()))
+
+    def export_directory(self, kind: str, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name, data in self.items(kind):
+            with open(os.path.join(directory, f"{name}.html"), mode="wb") as f:
+                f.write(data)
+
+def legacy_directories() -> list[tuple[str, str]]:
+    directories = list(LEGACY_DIRECTORIES)
+    if os.path.isdir(LEGACY_INDEX_DIRECTORY):
+        for index_name in sorted(os.listdir(LEGACY_INDEX_DIRECTORY)):
+            directories.append((f"index:{index_name}", os.path.join(LEGACY_INDEX_DIRECTORY, index_name)))
+    return directories
+
+def loose_page_directories() -> list[tuple[str, str]]:
+    "The (kind, directory) pairs of the old layout that still hold loose pages."
+    return [(kind, directory) for kind, directory in legacy_directories()
+            if os.path.isdir(directory) and any(file.endswith(".html") for file in os.listdir(directory))]
+
+def migrate_directory_layout(pack: PackStore, *, delete: bool = True) -> None:
+    "Move pages saved as loose files by earlier versions of the scraper into the pack store."
+    for kind, directory in loose_page_directories():
+        print(f"Packing {directory} as {kind}...", file=sys.stderr)
+        count = pack.import_directory(kind, directory, delete=delete)
+        print(f"Packed {count} pages.", file=sys.stderr)
+
+def open_pack_store() -> PackStore:
+    """Open the pack store. Pages still saved as loose files are left where they are, and only warned about, as packing
+    them (and deleting the files) is a one-off step of its own: `python corpus_pack.py migrate`.
+    """
+    pack = PackStore()
+    if directories := loose_page_directories():
+        print(f"Warning: {', '.join(directory for _, directory in directories)} still hold(s) pages as loose files, "
+              "which are not read from; run `python corpus_pack.py migrate` to pack them", file=sys.stderr)
+    return pack
+
+def main():
+    cli_parser = argparse.ArgumentParser(
+        prog="corpus-pack",
+        description="Program that manages the packed Kanjipedia corpus",
+    )
+    subparsers = cli_parser.add_subparsers(dest="action", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="pack pages saved as loose .html files, including kotoba saved "
+                                                           "in the old per-index layout")
+    migrate_parser.add_argument("--keep", action="store_true", help="keep the loose files after packing them")
+    unpack_parser = subparsers.add_parser("unpack", help="write the pages of one kind out as loose .html files")
+    unpack_parser.add_argument("kind")
+    unpack_parser.add_argument("directory")
+    subparsers.add_parser("stats", help="show how many pages of each kind are stored")
+    subparsers.add_parser("compact", help="rewrite the segments without the pages that have since been replaced")
+
+    args = cli_parser.parse_args()
+    pack = PackStore()
+    if args.action == "migrate":
+        from kotoba_store import KotobaStore  # Imported here, as the kotoba store is itself built on the pack store
+        migrate_directory_layout(pack, delete=not args.keep)
+        KotobaStore(pack).migrate_legacy_layout(delete=not args.keep)
+    elif args.action == "unpack":
+        pack.export_directory(args.kind, args.directory)
+    elif args.action == "stats":
+        for kind in pack.kinds():
+            print(kind, pack.count(kind), sep="\t")
+    elif args.action == "compact":
+        before, after = pack.compact()
+        print(f"Compacted the pack from {before / 1024 / 1024:.1f} MiB to {after / 1024 / 1024:.1f} MiB", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import sqlite3
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterable, Optional
+
+FRONTIER_PATH = "kanjipedia/frontier.sqlite3"
+
+MAX_ATTEMPTS = 8
+BASE_RETRY_DELAY = 60.0  # Seconds; doubles with every failed attempt
+MAX_RETRY_DELAY = 6 * 60 * 60.0
+
+class UrlState(Enum):
+    PENDING = "pending"
+    FETCHED = "fetched"
+    FAILED = "failed"
+    NOT_FOUND = "not_found"
+
+@dataclass
+class FrontierEntry:
+    kind: str  # e.g. "kanji", "index:honbun", "kotoba"
+    key: str  # Identifies the entry within its kind, e.g. the kanji itself or the kotoba ID
+    url: str
+    state: UrlState
+    attempts: int
+    next_retry: float  # Unix time before which a failed entry should not be retried
+
+def retry_delay(attempts: int) -> float:
+    return min(BASE_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+class Frontier:
+    """Persistent record of every URL the scraper knows about and what became of it, so that each crawl can resume
+    exactly where the previous one stopped. Failed URLs are rescheduled with exponential backoff rather than retried
+    on the spot, and are given up on after `MAX_ATTEMPTS` attempts.
+    """
+    def __init__(self, path: str = FRONTIER_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_retry REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                PRIMARY KEY (kind, key)
+            );
+            CREATE INDEX IF NOT EXISTS urls_due ON urls (kind, state, next_retry);
+        """)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add(self, kind: str, key: str, url: str) -> bool:
+        "Register a URL as pending unless it is already known. Returns whether it was new."
+        with self.connection:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO urls (kind, key, url) VALUES (?, ?, ?)", (kind, key, url))
+        return cursor.rowcount == 1
+
+    def add_many(self, kind: str, entries: Iterable[tuple[str, str]]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO urls (kind, key, url) VALUES (?, ?, ?)",
+                ((kind, key, url) for key, url in entries)
+            )
+
+    def get(self, kind: str, key: str) -> Optional[FrontierEntry]:
+        row = self.connection.execute(
+            "SELECT kind, key, url, state, attempts, next_retry FROM urls WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        return self._to_entry(row) if row else None
+
+    def due(self, kind: str, now: Optional[float] = None) -> list[FrontierEntry]:
+        "All entries of `kind` that are waiting to be fetched now: pending ones, and failed ones whose retry time has come."
+        rows = self.connection.execute(
+            """SELECT kind, key, url, state, attempts, next_retry FROM urls
+               WHERE kind = ? AND (state = 'pending' OR (state = 'failed' AND next_retry <= ? AND attempts < ?))
+               ORDER BY rowid""",
+            (kind, time.time() if now is None else now, MAX_ATTEMPTS)
+        ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def next_retry_time(self, kind: str) -> Optional[float]:
+        "The earliest time at which a failed entry of `kind` may be retried, or None if none are scheduled."
+        (next_retry,) = self.connection.execute(
+            "SELECT MIN(next_retry) FROM urls WHERE kind = ? AND state = 'failed' AND attempts < ?", (kind, MAX_ATTEMPTS)
+        ).fetchone()
+        return next_retry
+
+    def counts(self, kind: str) -> dict[UrlState, int]:
+        rows = self.connection.execute("SELECT state, COUNT(*) FROM urls WHERE kind = ? GROUP BY state", (kind,))
+        return {UrlState(state): count for state, count in rows}
+
+    def mark_fetched(self, kind: str, key: str) -> None:
+        self._set_state(kind, key, UrlState.FETCHED)
+
+    def mark_not_found(self, kind: str, key: str) -> None:
+        self._set_state(kind, key, UrlState.NOT_FOUND)
+
+    def mark_pending(self, kind: str, key: str) -> None:
+        "Queue an entry to be fetched again, e.g. because the stored copy turned out to be unusable."
+        with self.connection:
+            self.connection.execute(
+                "UPDATE urls SET state = 'pending', attempts = 0, next_retry = 0, last_error = NULL WHERE kind = ? AND key = ?",
+                (kind, key)
+            )
+
+    def mark_failed(self, kind: str, key: str, error: str) -> None:
+        with self.connection:
+            (attempts,) = self.connection.execute(
+                "SELECT attempts + 1 FROM urls WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            self.connection.execute(
+                "UPDATE urls SET state = 'failed', attempts = ?, next_retry = ?, last_error = ? WHERE kind = ? AND key = ?",
+                (attempts, time.time() + retry_delay(attempts), error, kind, key)
+            )
+
+    def _set_state(self, kind: str, key: str, state: UrlState) -> None:
+        with self.connection:
+            self.connection.execute(
+                "UPDATE urls SET state = ?, attempts = attempts + 1, last_error = NULL WHERE kind = ? AND key = ?",
+                (state.value, kind, key)
+            )
+
+    @staticmethod
+    def _to_entry(row: tuple) -> FrontierEntry:
+        kind, key, url, state, attempts, next_retry = row
+        return FrontierEntry(kind, key, url, UrlState(state), attempts, next_retry)
@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+import requests
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+class FetchError(Exception):
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.reason = reason
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens are added every second, up to `capacity`, and each request spends one.
+    The bucket can also be blocked outright for a while (e.g. to honour a Retry-After header).
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0
+            self._last_refill = now
+
+class Crawler:
+    """Keeps up to `workers` requests in flight while a shared token bucket enforces a global requests-per-second budget.
+    The budget adapts AIMD-style: it creeps back up towards `requests_per_second` after each healthy response, is halved
+    when the server answers 429 or 5xx, and is trimmed when response latency climbs above `latency_threshold` seconds.
+    """
+    def __init__(
+        self,
+        workers: int = 4,
+        requests_per_second: float = 2.0,
+        *,
+        min_requests_per_second: float = 0.1,
+        latency_threshold: float = 3.0,
+        timeout: float = 30.0,
+        max_attempts: int = 5,
+        backoff: float = 5.0,
+    ):
+        self.workers = workers
+        self.max_rate = requests_per_second
+        self.min_rate = min(min_requests_per_second, requests_per_second)
+        self.latency_threshold = latency_threshold
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.bucket = TokenBucket(requests_per_second)
+        self._local = threading.local()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def _session(self) -> requests.Session:
+        # Sessions aren't guaranteed to be thread-safe, so each worker thread keeps its own connection pool
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _adapt(self, status: Optional[int], latency: float) -> None:
+        if status is None or status in THROTTLE_STATUSES:
+            self.bucket.set_rate(max(self.min_rate, self.rate / 2))
+        elif latency > self.latency_threshold:
+            self.bucket.set_rate(max(self.min_rate, self.rate * 0.8))
+        else:
+            self.bucket.set_rate(min(self.max_rate, self.rate + self.max_rate / 20))
+
+    def fetch(self, url: str) -> requests.Response:
+        """Fetch `url` within the rate budget. Any response that is not a throttling/server error is returned as-is
+        (including 404s); throttling, server errors and connection errors are retried with backoff, and a `FetchError`
+        is raised once `max_attempts` have been used up.
+        """
+        reason = "no attempts made"
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            start = time.monotonic()
+            try:
+                response = self._session().get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._adapt(None, time.monotonic() - start)
+                reason = str(e)
+                self.bucket.block_for(self.backoff * 2 ** attempt)
+                continue
+
+            self._adapt(response.status_code, time.monotonic() - start)
+            if response.status_code not in THROTTLE_STATUSES:
+                return response
+
+            reason = f"HTTP {response.status_code}"
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                retry_after = self.backoff * 2 ** attempt
+            self.bucket.block_for(retry_after)
+        raise FetchError(url, reason)
+
+    def run(self, func: Callable[[T], R], items: Iterable[T]) -> Iterator[tuple[T, Optional[R], Optional[Exception]]]:
+        """Apply `func` to every item on the worker pool, keeping at most `workers` calls in flight, and yield
+        (item, result, exception) triples in completion order. Exceptions raised by `func` are yielded, not raised.
+        """
+        items = iter(items)
+        in_flight: dict[Future, T] = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                for item in items:
+                    in_flight[executor.submit(func, item)] = item
+                    if len(in_flight) >= self.workers:
+                        break
+                if not in_flight:
+                    return
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    exception = future.exception()
+                    yield item, (None if exception else future.result()), exception
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,7 +1,10 @@
 from dataclasses import dataclass, field
 from enum import Enum, IntEnum, auto
-from typing import Self, TypedDict, Union
+import sys
+from typing import Optional, Self, TypedDict, Union
 
+# Bump whenever the layout of the dataclasses below changes, so that pickled objects of the old layout are not reused
+SCHEMA_VERSION = 3
 
 class KankenLevels(IntEnum):
     TEN = auto()
@@ -62,6 +65,12 @@ class KankenLevels(IntEnum):
             self.ONE: "1",
         }[self]
 
+def _reduce_to_fields(self):
+    """Pickle a dataclass as a call to its constructor with its fields' values, which is both smaller and quicker to load
+    than the default pickle of a slotted object, which names and sets every attribute in turn.
+    """
+    return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
 class RikuSho(IntEnum):
     PICTOGRAPH = auto()
     IDEOGRAPH = auto()
@@ -70,29 +79,39 @@ class RikuSho(IntEnum):
     ARBITRARY = auto()
     UNKNOWN = auto()
 
-@dataclass
+@dataclass(slots=True)
 class Pictograph:
     description: str
 
-@dataclass
+    __reduce__ = _reduce_to_fields
+
+@dataclass(slots=True)
 class Ideograph:
     description: str
 
-@dataclass
+    __reduce__ = _reduce_to_fields
+
+@dataclass(slots=True)
 class IdeographicCompound:
     characters: list[str]
     description: str
 
-@dataclass
+    __reduce__ = _reduce_to_fields
+
+@dataclass(slots=True)
 class PhonoSemanticCompound:
     characters: list[str]
     description: list[str]
 
-@dataclass
+    __reduce__ = _reduce_to_fields
+
+@dataclass(slots=True)
 class GlyphOrigin:
     type: RikuSho
     origin: Union[Pictograph, Ideograph, IdeographicCompound, PhonoSemanticCompound, str]
 
+    __reduce__ = _reduce_to_fields
+
     def __str__(self) -> str:
         if self.type is RikuSho.IDEOGRAPH:
             return f"指事 {self.origin}"
@@ -113,12 +132,19 @@ KANJI_LEVELS: dict[str, str] = {
     "字": KankenLevels.TEN
 }
 
-@dataclass
+@dataclass(slots=True)
 class BaseAndOkurigana:
     base: str  # Part that the kanji subsumes
     okurigana: str  # Okurigana part that is written in kana
     # Example: 重んじる has reading おも-んじる, where base = おも and okurigana = んじる
 
+    def __post_init__(self):
+        # The same few thousand readings recur across the whole corpus, so each is kept only once
+        self.base = sys.intern(self.base)
+        self.okurigana = sys.intern(self.okurigana)
+
+    __reduce__ = _reduce_to_fields  # Through __init__, so that unpickled readings are interned too
+
     @classmethod
     def parse_okurigana(cls, string: str) -> Self:
         if "-" not in string:
@@ -140,19 +166,33 @@ class BaseAndOkurigana:
     #     }
 
 
-@dataclass(init=False)
+def _unpickle_reading(base: str, okurigana: str, in_kanken: bool, in_wiktionary: bool, is_hyougai: bool) -> "Reading":
+    reading = Reading.__new__(Reading)
+    reading.reading = BaseAndOkurigana(base, okurigana)
+    reading.in_kanken = in_kanken
+    reading.in_wiktionary = in_wiktionary
+    reading.is_hyougai = is_hyougai
+    return reading
+
+@dataclass(init=False, slots=True)
 class Reading:
     reading: BaseAndOkurigana  # Literal reading
     in_kanken: bool  # Reading is found in the Kanken Kanji Jiten
     in_wiktionary: bool # Reading is found on EN Wiktionary
     is_hyougai: bool
 
-    def __init__(self, reading: str, in_kanken: bool, in_wiktionary: bool, is_hyougai: bool = False):
-        self.reading = BaseAndOkurigana.parse_okurigana(reading)
+    def __init__(self, reading: Union[str, BaseAndOkurigana], in_kanken: bool, in_wiktionary: bool, is_hyougai: bool = False):
+        # Also taken already parsed, as by dataclasses.replace
+        self.reading = reading if isinstance(reading, BaseAndOkurigana) else BaseAndOkurigana.parse_okurigana(reading)
         self.in_kanken = in_kanken
         self.in_wiktionary = in_wiktionary
         self.is_hyougai = is_hyougai
-    
+
+    def __reduce__(self):
+        # Not through __init__, which takes the reading as one string to parse
+        return _unpickle_reading, (self.reading.base, self.reading.okurigana, self.in_kanken, self.in_wiktionary,
+                                   self.is_hyougai)
+
     def __str__(self):
         return f"{self.reading}:{'k' if self.in_kanken else ''}{'w' if self.in_wiktionary else ''}{'h' if self.is_hyougai else ''}"
 
@@ -166,7 +206,7 @@ class Reading:
 
 # Temporarily use this class when parsing kun readings from Kanjipedia, as this information must later be collated into the overall
 # `Reading` object, but the hyougai-pertaining information must be retained in the meantime.
-@dataclass(init=False)
+@dataclass(init=False, slots=True)
 class KankenReading:
     reading: BaseAndOkurigana
     is_hyougai: bool
@@ -178,11 +218,13 @@ class KankenReading:
     def __hash__(self):
         return hash((self.reading, self.is_hyougai))
 
-@dataclass
+@dataclass(slots=True)
 class Meaning:
     qualifier: str
     submeanings: list[str] # TODO: make class with "examples" attribute? Must ensure the format of entries roughly allows for this.
 
+    __reduce__ = _reduce_to_fields
+
     def __str__(self):
         out = self.qualifier
         def_num = "①"
@@ -204,7 +246,7 @@ class Meaning:
     #         "submeanings": self.submeanings
     #     }
 
-@dataclass
+@dataclass(slots=True)
 class Kanji:
     character: str
     level: KankenLevels
@@ -226,6 +268,8 @@ class Kanji:
     replaces: list[str]
     replaced_by: list[str]
 
+    __reduce__ = _reduce_to_fields
+
     @property
     def is_jouyou(self) -> bool:
         return KankenLevels.is_jouyou(self.level)
@@ -289,11 +333,11 @@ class Kanji:
     #         "replaced_by": self.replaced_by,
     #     }
 
-@dataclass
+@dataclass(slots=True)
 class Kanjitab:
-    pass
+    __reduce__ = _reduce_to_fields
 
-@dataclass
+@dataclass(slots=True)
 class Kotoba:
     word: str
     reading: str  # List of readings?
@@ -302,6 +346,8 @@ class Kotoba:
     is_jukujikun_ateji: bool  # If the word uses "irregular" readings
     kanjitab: Kanjitab
 
+    __reduce__ = _reduce_to_fields
+
     @staticmethod
     def process_pitch_accent_patterns(pattern: list[str]) -> str:
         return ",".join(f"[{accent}]" for accent in pattern)
@@ -320,6 +366,26 @@ class Kotoba:
             self.as_tuple()
         )
 
+# Raw values read off a Kanjipedia page by either extraction engine, before the collator interprets them
+@dataclass(slots=True)
+class KanjiPageFields:
+    oyaji_text: str  # Text of the headword; empty when the headword is shown as an image
+    level: str  # As in the level image's alt text, e.g. "準1"
+    is_kokuji: bool
+    on_text: str  # Text of the on reading block, with "・" inserted before hyougai readings
+    kun_html: str  # Inner HTML of the kun reading block
+    bushu_image: str  # Path of the radical image
+    strokes: str
+    added_strokes: str
+    meaning_html: str  # Inner HTML of the first paragraph of the meaning section
+    origin_text: Optional[str]  # Glyph origin explanation, if the page has one
+
+@dataclass(slots=True)
+class KotobaPageFields:
+    word: str
+    reading: str
+    explanation: str  # Unstripped text of the explanation section
+
 def kanken_level_single(kanji: str) -> str:
     return KANJI_LEVELS[kanji]
 
@@ -0,0 +1,131 @@
+import datetime
+import hashlib
+import itertools
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Optional, Sequence
+
+import genanki
+
+MANIFEST_PATH = "build/anki/manifest.json"
+CHANGELOG_DIRECTORY = "build/anki/changelog"
+MANIFEST_FORMAT_VERSION = 1
+
+def field_hash(value: str) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=8).hexdigest()
+
+def models_hash(models: Sequence[genanki.Model]) -> str:
+    "Identifies the fields, templates and styling of the note types, a change to which calls for the whole deck to be rewritten."
+    # As written to the collection, less the build time; genanki fills defaults into a model's fields and templates the
+    # first time it's written, so they're hashed the same before as after
+    return field_hash(json.dumps([model.to_json(0, None) for model in models], ensure_ascii=False, sort_keys=True))
+
+@dataclass
+class NoteChange:
+    kind: str  # Name of the note type, e.g. Kanken Kanji
+    key: str  # The first field, i.e. the character or word, which the note's GUID is derived from
+    guid: str
+    fields: list[str] = field(default_factory=list)  # Names of the fields that changed, for changed notes
+
+@dataclass
+class Changelog:
+    timestamp: str
+    models_changed: bool  # If so, every note should be re-imported, as the note types themselves have changed
+    added: list[NoteChange] = field(default_factory=list)
+    changed: list[NoteChange] = field(default_factory=list)
+    removed: list[NoteChange] = field(default_factory=list)
+    # First fields shared by more than one note, e.g. by homographs, whose notes then also share their GUID
+    duplicate_keys: list[str] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.models_changed or self.added or self.changed or self.removed)
+
+    def summary(self) -> str:
+        out = f"{len(self.added)} note(s) added, {len(self.changed)} changed, {len(self.removed)} removed"
+        fields = {}
+        for change in self.changed:
+            for name in change.fields:
+                fields[name] = fields.get(name, 0) + 1
+        if fields:
+            out += " (" + ", ".join(f"{name}: {count}" for name, count in sorted(fields.items(), key=lambda item: -item[1])) + ")"
+        if self.models_changed:
+            out += "; note types changed"
+        return out
+
+    def write(self, directory: str = CHANGELOG_DIRECTORY) -> str:
+        "Write the changelog as JSON to a file named after its timestamp in `directory`. Returns the path written to."
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.timestamp.replace(':', '')}.json")
+        with open(path, mode="w") as f:
+            json.dump(asdict(self), f, indent=4, ensure_ascii=False)
+        return path
+
+def manifest_key(guid: str, occurrence: int) -> str:
+    "Notes are recorded by GUID, and those that share the GUID of an earlier note by GUID and occurrence."
+    return guid if occurrence == 1 else f"{guid} {occurrence}"  # No GUID contains a space
+
+def guid_of(key: str) -> str:
+    return key.split(" ")[0]
+
+class DeckManifest:
+    """The notes of the last deck built, by GUID: the note type, the first field and a hash of every field of each. This
+    is what each build is compared against, to find the notes that have been added, changed or removed since. Notes
+    whose GUID is shared with an earlier one (see `manifest_key`) are told apart by the order they were added in.
+    """
+    def __init__(self, models: str = "", notes: Optional[dict[str, tuple[str, str, list[str]]]] = None):
+        self.models = models
+        self.notes = notes if notes is not None else {}
+        self.duplicate_keys: list[str] = []
+
+    def add(self, model: genanki.Model, guid: str, fields: Sequence[str]) -> None:
+        occurrence = 1
+        while manifest_key(guid, occurrence) in self.notes:
+            occurrence += 1
+        if occurrence == 2:
+            self.duplicate_keys.append(fields[0])
+        self.notes[manifest_key(guid, occurrence)] = (model.name, fields[0], [field_hash(value) for value in fields])
+
+    @classmethod
+    def load(cls, path: str = MANIFEST_PATH) -> Optional["DeckManifest"]:
+        "The manifest at `path`, or None if there isn't one (of the current format)."
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get("format_version") != MANIFEST_FORMAT_VERSION:
+            return None
+        return cls(data["models"], {note_key: tuple(note) for note_key, note in data["notes"].items()})
+
+    def save(self, path: str = MANIFEST_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", mode="w") as f:
+            json.dump({"format_version": MANIFEST_FORMAT_VERSION, "models": self.models, "notes": self.notes}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def diff(self, previous: Optional["DeckManifest"], field_names: dict[str, list[str]]) -> Changelog:
+        """The changes since the `previous` manifest; every note is new if there is none. `field_names` are the names of
+        each note type's fields, by note type name, to name the fields that have changed.
+        """
+        changelog = Changelog(datetime.datetime.now().isoformat(timespec="seconds"),
+                              models_changed=previous is None or previous.models != self.models,
+                              duplicate_keys=list(self.duplicate_keys))
+        old_notes = previous.notes if previous is not None else {}
+        for note_key, (kind, key, hashes) in self.notes.items():
+            old = old_notes.get(note_key)
+            if old is None:
+                changelog.added.append(NoteChange(kind, key, guid_of(note_key)))
+            elif old[2] != hashes:
+                # Those of the old note type too, for fields that it had and that the new one doesn't
+                names = max(field_names.get(kind, []), field_names.get(old[0], []), key=len)
+                changed = [names[i] if i < len(names) else str(i)
+                           for i, (new_hash, old_hash) in enumerate(itertools.zip_longest(hashes, old[2]))
+                           if new_hash != old_hash]
+                changelog.changed.append(NoteChange(kind, key, guid_of(note_key), changed))
+        for note_key, (kind, key, _) in old_notes.items():
+            if note_key not in self.notes:
+                changelog.removed.append(NoteChange(kind, key, guid_of(note_key)))
+        return changelog
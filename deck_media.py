@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+import regex as re
+
+from data_models import Kotoba
+from kana import kata_to_hira
+
+ACCENT_IMAGE_DIRECTORY = "supplementary/pronunciation/accent_images"
+AUDIO_DIRECTORY = "build/cache/audio"  # <word>.wav, as saved by get_pron.py
+MEDIA_INDEX_PATH = "build/cache/media_index.sqlite3"
+HASH_BUFFER_SIZE = 1024 * 1024
+SMALL_KANA = set("ぁぃぅぇぉゃゅょゎ")  # Part of the mora of the kana before them
+ACCENT_PATTERN = re.compile(r"\d+")  # The accents of a pattern, e.g. 0 and 1 of (名)0,(副)1
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, mode="rb") as f:
+        while chunk := f.read(HASH_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+class MediaIndex:
+    """The hash of the content of each media file, remembered by path, size and modification time, so that files are
+    only read again once they've changed.
+    """
+    def __init__(self, path: str = MEDIA_INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            )
+        """)
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def media_name(self, path: str) -> str:
+        "The name the file is packaged under: the hash of its content, with its extension, so that copies are packaged once."
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT hash FROM media WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                      (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is None:
+            row = (hash_file(path),)
+            self.connection.execute("INSERT OR REPLACE INTO media (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime_ns, row[0]))
+        return row[0] + os.path.splitext(path)[1].lower()
+
+def kana_pitches(reading: str, accent: int) -> list[tuple[str, str]]:
+    """The pitch of each kana of a reading in hiragana, with its accent given as the mora after which the pitch drops
+    (0 for none): high, low or drop, the last of which is the kana that the pitch drops after.
+    """
+    morae: list[str] = []
+    for kana in reading:
+        if kana in SMALL_KANA and morae:
+            morae[-1] += kana
+        else:
+            morae.append(kana)
+
+    out = []
+    for position, mora in enumerate(morae, start=1):
+        if accent == 0:
+            pitch = "low" if position == 1 else "high"
+        elif accent == 1:
+            pitch = "high" if position == 1 else "low"
+        else:
+            pitch = "high" if 1 < position <= accent else "low"
+        for i, kana in enumerate(mora):
+            out.append((kana, "drop" if position == accent and i == len(mora) - 1 else pitch))
+    return out
+
+@dataclass
+class KotobaMedia:
+    "The media fields of kotoba notes, and the files they refer to, by the name they're packaged under."
+    fields: dict[tuple, tuple[str, str]] = field(default_factory=dict)  # (Pitch accent images, Audio), by `media_key`
+    files: dict[str, str] = field(default_factory=dict)  # Path of each file
+
+    def note_fields(self, kotoba: Kotoba) -> tuple[str, str]:
+        return self.fields.get(media_key(kotoba), ("", ""))
+
+def media_key(kotoba: Kotoba) -> tuple:
+    return kotoba.word, kotoba.reading, tuple(kotoba.pitch_accent_pattern)
+
+def load_accent_images(directory: str = ACCENT_IMAGE_DIRECTORY) -> dict[tuple[str, str], str]:
+    "Path of an image of each (kana, pitch); of several images of the same, the first by name is used."
+    with open(os.path.join(directory, "mappings.json")) as f:
+        mappings = json.load(f)
+    images = {}
+    for name, image in sorted(mappings.items()):
+        images.setdefault((image["kana"], image["pitch"]), os.path.join(directory, name))
+    return images
+
+def accent_images_field(kotoba: Kotoba, images: dict[tuple[str, str], str], media_name: Callable[[str], str]) -> str:
+    "A row of kana images for each accent of the kotoba, or nothing for those with kana that there are no images of."
+    reading = "".join(kata_to_hira.get(kana, kana) for kana in kotoba.reading)
+    rows = []
+    for accent in dict.fromkeys(int(accent) for pattern in kotoba.pitch_accent_pattern for accent in ACCENT_PATTERN.findall(pattern)):
+        paths = [images.get(kana_pitch) for kana_pitch in kana_pitches(reading, accent)]
+        if paths and all(paths):
+            rows.append("".join(f'<img src="{media_name(path)}">' for path in paths))
+    return "<br>".join(rows)
+
+def collect_kotoba_media(all_kotoba: Iterable[Kotoba], image_directory: str = ACCENT_IMAGE_DIRECTORY,
+                         audio_directory: str = AUDIO_DIRECTORY, index_path: str = MEDIA_INDEX_PATH) -> KotobaMedia:
+    """The pitch accent images and audio of every kotoba. Each file is only hashed once per build, and only if it has
+    changed since the last, so that this takes time in proportion to the number of distinct files rather than of notes.
+    """
+    images = load_accent_images(image_directory)
+    audio = set(os.listdir(audio_directory)) if os.path.isdir(audio_directory) else set()
+    media = KotobaMedia()
+    names: dict[str, str] = {}  # By path
+    index = MediaIndex(index_path)
+
+    def media_name(path: str) -> str:
+        if path not in names:
+            names[path] = index.media_name(path)
+            media.files[names[path]] = path
+        return names[path]
+
+    try:
+        for kotoba in all_kotoba:
+            key = media_key(kotoba)
+            if key in media.fields:
+                continue
+            sound = ""
+            if f"{kotoba.word}.wav" in audio:
+                sound = f"[sound:{media_name(os.path.join(audio_directory, kotoba.word + '.wav'))}]"
+            media.fields[key] = (accent_images_field(kotoba, images, media_name), sound)
+    finally:
+        index.close()
+    return media
@@ -1,15 +1,16 @@
 import regex as re
 import json
 
+from corpus_pack import open_pack_store
+
 HOMOPHONIC_GROUP_PATTERN = re.compile(r'<a href="/sakuin/doukunigi/items/\d+">\s+<span>(.+)</span><br>\s+((?:\s\w)+)')
 KANAS = "あかさたなはまやらわ"
 
 def main():
     homophonic_groups: dict[list[str], list[str]] = {}
+    pack = open_pack_store()  # kanjipedia/indices/doukun_igi/*.html, once packed as index:doukun_igi by corpus_pack.py migrate
     for kana in KANAS:
-        html_file_path = f"kanjipedia/indices/doukun_igi/{kana}.html"
-        with open(html_file_path) as f:
-            contents = f.read()
+        contents = pack.get("index:doukun_igi", kana).decode()
         
         for match in HOMOPHONIC_GROUP_PATTERN.finditer(contents):
             kun, kanji_list = match.groups()
@@ -0,0 +1,98 @@
+import dataclasses
+import gzip
+import io
+import json
+from typing import Any, Callable, Iterable, TextIO
+
+from data_models import Kanji, Kotoba, Meaning, Reading
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+BUFFER_SIZE = 1024 * 1024
+
+def open_output(path: str, compression: str = "none") -> TextIO:
+    """Open `path` (with the usual suffix of `compression` appended) for writing UTF-8 text through a large buffer,
+    compressing it on the fly. zstd needs Python 3.14's compression.zstd, or else the zstandard package.
+    """
+    path += COMPRESSION_SUFFIXES[compression]
+    if compression == "none":
+        return open(path, mode="w", encoding="utf-8", buffering=BUFFER_SIZE)
+    elif compression == "gzip":
+        # The default level (9) costs several times as much time as 6 for barely smaller files
+        return gzip.open(path, mode="wt", encoding="utf-8", compresslevel=6)
+    elif compression == "zstd":
+        try:
+            from compression import zstd
+            return zstd.open(path, mode="wt", encoding="utf-8")
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression needs Python 3.14 or later, or the zstandard package") from None
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, mode="wb")), encoding="utf-8")
+    raise ValueError(f"Unknown compression: {compression}")
+
+def write_lines(path: str, lines: Iterable[str], compression: str = "none") -> None:
+    "Write one line per string, as they come, without a newline after the last one."
+    with open_output(path, compression) as f:
+        separator = ""
+        for line in lines:
+            f.write(separator)
+            f.write(line)
+            separator = "\n"
+
+def write_tsv(path: str, items: Iterable[Kanji | Kotoba], compression: str = "none") -> None:
+    write_lines(path, (str(item) for item in items), compression)
+
+def write_jsonl(path: str, items: Iterable[Any], serialize: Callable[[Any], dict], compression: str = "none") -> None:
+    write_lines(path, (json.dumps(serialize(item), ensure_ascii=False) for item in items), compression)
+
+# Purpose-built equivalents of `dataclasses.asdict` for the objects that are dumped as JSON. They build exactly the same
+# dicts, but without asdict's generic recursion and deep copies, which make up most of the cost of a JSON dump.
+
+def _reading_as_dict(reading: Reading) -> dict:
+    return {
+        "reading": {"base": reading.reading.base, "okurigana": reading.reading.okurigana},
+        "in_kanken": reading.in_kanken,
+        "in_wiktionary": reading.in_wiktionary,
+        "is_hyougai": reading.is_hyougai,
+    }
+
+def _meaning_as_dict(meaning: Meaning) -> dict:
+    return {"qualifier": meaning.qualifier, "submeanings": list(meaning.submeanings)}
+
+def _field_as_dict(value: Any) -> Any:
+    # Rare or still-empty dataclass fields (glyph origin details, kanjitabs) are left to asdict
+    return dataclasses.asdict(value) if dataclasses.is_dataclass(value) else value
+
+def kanji_as_dict(kanji: Kanji) -> dict:
+    return {
+        "character": kanji.character,
+        "level": kanji.level,
+        "is_kokuji": kanji.is_kokuji,
+        "meanings": [_meaning_as_dict(meaning) for meaning in kanji.meanings],
+        "on": [_reading_as_dict(reading) for reading in kanji.on],
+        "goon": [_reading_as_dict(reading) for reading in kanji.goon],
+        "kanon": [_reading_as_dict(reading) for reading in kanji.kanon],
+        "kanyoon": [_reading_as_dict(reading) for reading in kanji.kanyoon],
+        "toon": [_reading_as_dict(reading) for reading in kanji.toon],
+        "soon": [_reading_as_dict(reading) for reading in kanji.soon],
+        "kun": [_reading_as_dict(reading) for reading in kanji.kun],
+        "radical": kanji.radical,
+        "strokes": kanji.strokes,
+        "added_strokes": kanji.added_strokes,
+        "glyph_origin": {"type": kanji.glyph_origin.type, "origin": _field_as_dict(kanji.glyph_origin.origin)},
+        "replaces": list(kanji.replaces),
+        "replaced_by": list(kanji.replaced_by),
+    }
+
+def kotoba_as_dict(kotoba: Kotoba) -> dict:
+    return {
+        "word": kotoba.word,
+        "reading": kotoba.reading,
+        "pitch_accent_pattern": list(kotoba.pitch_accent_pattern),
+        "meaning": kotoba.meaning,
+        "is_jukujikun_ateji": kotoba.is_jukujikun_ateji,
+        "kanjitab": _field_as_dict(kotoba.kanjitab),
+    }
@@ -0,0 +1,112 @@
+import argparse
+import itertools
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from tqdm import tqdm
+
+import fast_extraction
+import kanjipedia_collator
+from corpus_pack import open_pack_store
+from kotoba_store import KOTOBA_KIND
+
+# Per kind: (reference extractor, fast extractor, assembly of the extracted fields into the final object)
+EXTRACTORS = {
+    "kanji": (
+        kanjipedia_collator.extract_kanji_fields_bs4,
+        fast_extraction.extract_kanji_fields,
+        kanjipedia_collator.assemble_kanji,
+    ),
+    KOTOBA_KIND: (
+        kanjipedia_collator.extract_kotoba_fields_bs4,
+        fast_extraction.extract_kotoba_fields,
+        lambda fields, page: kanjipedia_collator.assemble_kotoba(fields),
+    ),
+}
+
+@dataclass
+class ParityResult:
+    checked: int = 0
+    fallbacks: int = 0  # Pages the fast engine declined, leaving them to the reference engine
+    failures: list[tuple[str, str]] = field(default_factory=list)  # Pages the reference engine itself cannot read
+    mismatches: list[tuple[str, object, object]] = field(default_factory=list)  # (name, reference fields, fast fields)
+    reference_time: float = 0.0
+    fast_time: float = 0.0
+
+def compare_engines(kind: str, pages: Iterable[tuple[str, bytes]]) -> ParityResult:
+    "Run both extraction engines over (name, content) pairs of pages of `kind`, and compare what they read."
+    reference, fast, assemble = EXTRACTORS[kind]
+    result = ParityResult()
+    for name, data in pages:
+        page = data.decode()
+
+        start = time.perf_counter()
+        try:
+            expected = reference(page)
+        except Exception as e:
+            result.failures.append((name, repr(e)))
+            continue
+        result.reference_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            actual = fast(page)
+        except fast_extraction.FastPathError:
+            actual = None
+        result.fast_time += time.perf_counter() - start
+        result.checked += 1
+
+        if actual is None:
+            result.fallbacks += 1
+        elif actual != expected:
+            result.mismatches.append((name, expected, actual))
+        else:
+            try:
+                if assemble(actual, page) != assemble(expected, page):
+                    result.mismatches.append((name, expected, actual))
+            except Exception:
+                pass  # Fields are equal, so the reference engine's result would have failed in the same way
+    return result
+
+def check_parity(kind: str, limit: Optional[int] = None, show: int = 10) -> bool:
+    """Run both extraction engines over every stored page of `kind`, and check that the fast engine reads each page it
+    accepts exactly as the reference engine does. Returns whether there were no mismatches.
+    """
+    pack = open_pack_store()
+    total = pack.count(kind) if limit is None else min(limit, pack.count(kind))
+    result = compare_engines(kind, tqdm(itertools.islice(pack.items(kind), limit), total=total))
+    checked, mismatches = result.checked, result.mismatches
+
+    print(f"{kind}: {checked} page(s) checked, {len(mismatches)} mismatch(es), {result.fallbacks} fallback(s) to bs4, "
+          f"{len(result.failures)} page(s) unreadable by either engine")
+    if checked:
+        print(f"bs4: {result.reference_time:.2f}s ({result.reference_time / checked * 1000:.2f} ms/page); "
+              f"fast: {result.fast_time:.2f}s ({result.fast_time / checked * 1000:.2f} ms/page)")
+
+    for name, expected, actual in mismatches[:show]:
+        print(f"--- {kind} {name}", file=sys.stderr)
+        for field in expected.__dataclass_fields__:
+            if getattr(expected, field) != getattr(actual, field):
+                print(f"{field}:\n  bs4:  {getattr(expected, field)!r}\n  fast: {getattr(actual, field)!r}", file=sys.stderr)
+    if len(mismatches) > show:
+        print(f"... and {len(mismatches) - show} more", file=sys.stderr)
+    return not mismatches
+
+def main():
+    cli_parser = argparse.ArgumentParser(
+        prog="extraction-parity",
+        description="Program that checks the fast extraction engine against the BeautifulSoup one over the stored corpus",
+    )
+    cli_parser.add_argument("--kind", action="append", choices=list(EXTRACTORS), dest="kinds",
+                            help="page kind to check; may be given more than once (default: all)")
+    cli_parser.add_argument("--limit", type=int, help="only check the first LIMIT pages of each kind")
+    cli_parser.add_argument("--show", type=int, default=10, help="number of mismatches to print in full (default: 10)")
+    args = cli_parser.parse_args()
+
+    ok = all([check_parity(kind, args.limit, args.show) for kind in args.kinds or EXTRACTORS])
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
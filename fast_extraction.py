@@ -0,0 +1,333 @@
+from html.entities import html5 as HTML5_ENTITIES
+from html.parser import HTMLParser
+from typing import Callable, Optional
+
+import regex as re
+
+from data_models import KanjiPageFields, KotobaPageFields
+
+# Fast extraction engine for Kanjipedia pages. Rather than building a BeautifulSoup tree of the whole page, the regions
+# the collator reads are located with regexes over the raw source, and only those small slices are run through the
+# standard library's HTMLParser. Text and inner HTML are reproduced exactly as BeautifulSoup (with "html.parser")
+# would give them; any page that looks like it could be read differently raises FastPathError, and should be handed to
+# the reference engine in kanjipedia_collator instead.
+
+HYOUGAI_TEXT = '<img alt="外" src="/common/images/icon_loanword.png"/>'
+
+# As in BeautifulSoup's HTMLTreeBuilder
+VOID_ELEMENTS = {
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image", "img", "input",
+    "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+}
+MULTI_VALUED_ATTRIBUTES = {
+    "*": {"class", "accesskey", "dropzone"},
+    "a": {"rel", "rev"},
+    "link": {"rel", "rev"},
+    "td": {"headers"},
+    "th": {"headers"},
+    "form": {"accept-charset"},
+    "object": {"archive"},
+    "area": {"rel"},
+    "icon": {"sizes"},
+    "iframe": {"sandbox"},
+    "output": {"for"},
+}
+# Elements whose strings BeautifulSoup leaves out of .text, or gives special treatment while parsing
+UNSUPPORTED_TAGS = {"script", "style", "template", "rt", "rp", "pre", "textarea", "title", "plaintext", "xmp"}
+ASCII_SPACES = " \n\t\x0c\r"
+
+# Regions that HTMLParser does not read as markup; these are blanked out before searching for tags. Which elements
+# have raw text content depends on the Python version.
+RAW_TEXT_ELEMENTS = (*HTMLParser.CDATA_CONTENT_ELEMENTS, *getattr(HTMLParser, "RCDATA_CONTENT_ELEMENTS", ()))
+OPAQUE_PATTERN = re.compile(
+    rf"<!--.*?-->|<!DOCTYPE[^>]*>|<({'|'.join(RAW_TEXT_ELEMENTS)})\b[^>]*>.*?</\1\s*>",
+    flags=re.DOTALL | re.IGNORECASE
+)
+UNUSUAL_MARKUP_PATTERN = re.compile(
+    r"<[!?]|<(?:rt|rp|template|pre|textarea)\b"  # Leftover declarations and comments, elements with special strings
+    r"""|=\s*(?:"[^"]*[<>][^"]*"|'[^']*[<>][^']*'|[^\s"'>]*<)""",  # Angle brackets inside attribute values
+    flags=re.IGNORECASE
+)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+REFERENCE_PATTERN = re.compile(r"&(?:#(?:\d+|[xX][0-9a-fA-F]+);|[A-Za-z][A-Za-z0-9]*;)?")
+LEVEL_PATTERN = re.compile(r'alt="(準?\d{1,2})級"')
+STROKE_COUNT_PATTERN = re.compile(r'画数：\((\d+)\)')
+ADDED_STROKE_COUNT_PATTERN = re.compile(r'部首内画数(\d+)')
+
+class FastPathError(Exception):
+    pass
+
+def check_references(source: str) -> None:
+    """Only allow character references in text that HTMLParser and BeautifulSoup are certain to decode alike. (Attribute
+    values are decoded by HTMLParser in both engines.)
+    """
+    for m in REFERENCE_PATTERN.finditer(TAG_PATTERN.sub("", source)):
+        reference = m.group()
+        if reference == "&":
+            raise FastPathError("bare ampersand")
+        if reference.startswith("&#"):
+            codepoint = int(reference[3:-1], 16) if reference[2] in "xX" else int(reference[2:-1])
+            if codepoint == 0 or 0x80 <= codepoint <= 0x9F or 0xD800 <= codepoint <= 0xDFFF or codepoint > 0x10FFFF:
+                raise FastPathError(f"unusual character reference {reference}")
+        elif reference[1:] not in HTML5_ENTITIES:
+            raise FastPathError(f"unknown entity {reference}")
+
+def escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def quote_attribute(value: str) -> str:
+    value = escape_text(value)
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', "&quot;") + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+def is_multi_valued(tag: str, attribute: str) -> bool:
+    return attribute in MULTI_VALUED_ATTRIBUTES["*"] or attribute in MULTI_VALUED_ATTRIBUTES.get(tag, ())
+
+class SliceReader(HTMLParser):
+    """Reads a slice of a page as BeautifulSoup would, collecting its text and its re-serialised HTML. Anything the
+    collator's BeautifulSoup calls might treat differently (comments, scripts, unbalanced tags, ...) raises FastPathError.
+    """
+    def __init__(self, single_element: bool = True):
+        super().__init__(convert_charrefs=True)
+        self.single_element = single_element
+        self.text: list[str] = []
+        self.markup: list[str] = []
+        self.open_tags: list[str] = []
+        self.closed_roots = 0
+        self.pending_text: list[str] = []
+
+    def end_text(self) -> None:
+        "Like BeautifulSoup, turn each run of text into one string, collapsing it if it is only whitespace."
+        if not self.pending_text:
+            return
+        text = "".join(self.pending_text)
+        self.pending_text = []
+        if not text.strip(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        self.text.append(text)
+        self.markup.append(escape_text(text))
+
+    def start_tag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> str:
+        self.end_text()
+        if tag in UNSUPPORTED_TAGS:
+            raise FastPathError(f"unsupported <{tag}>")
+        if self.single_element and not self.open_tags and self.closed_roots:
+            raise FastPathError("markup after the end of the slice")
+        if len({name for name, _ in attrs}) != len(attrs):
+            raise FastPathError(f"duplicate attributes on <{tag}>")
+
+        serialised = [f"<{tag}"]
+        for name, value in sorted(attrs, key=lambda attr: attr[0]):
+            value = value or ""
+            if is_multi_valued(tag, name) and value != " ".join(value.split()):
+                raise FastPathError(f"unnormalised {name} attribute on <{tag}>")
+            serialised.append(f" {name}={quote_attribute(value)}")
+        return "".join(serialised)
+
+    def handle_starttag(self, tag, attrs):
+        start = self.start_tag(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self.markup.append(start + "/>")
+            if not self.open_tags:
+                self.closed_roots += 1
+        else:
+            self.markup.append(start + ">")
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        start = self.start_tag(tag, attrs)
+        self.markup.append(start + ("/>" if tag in VOID_ELEMENTS else f"></{tag}>"))
+        if not self.open_tags:
+            self.closed_roots += 1
+
+    def handle_endtag(self, tag):
+        self.end_text()
+        if not self.open_tags or self.open_tags[-1] != tag:
+            raise FastPathError(f"mismatched </{tag}>")
+        self.open_tags.pop()
+        self.markup.append(f"</{tag}>")
+        if not self.open_tags:
+            self.closed_roots += 1
+
+    def handle_data(self, data):
+        if self.single_element and not self.open_tags and self.closed_roots:
+            raise FastPathError("text after the end of the slice")
+        self.pending_text.append(data)
+
+    def close(self):
+        super().close()
+        self.end_text()
+
+    def handle_comment(self, data):
+        raise FastPathError("comment")
+
+    def handle_decl(self, decl):
+        raise FastPathError("declaration")
+
+    def handle_pi(self, data):
+        raise FastPathError("processing instruction")
+
+    def unknown_decl(self, data):
+        raise FastPathError("CDATA or unknown declaration")
+
+def read_slice(source: str, *, fragment: bool = False) -> SliceReader:
+    """Parse a slice of HTML. Unless it is a `fragment` (any sequence of balanced nodes), the slice must consist of a
+    single element, start tag to end tag.
+    """
+    check_references(source)
+    reader = SliceReader(single_element=not fragment)
+    reader.feed(source)
+    reader.close()
+    if reader.open_tags:
+        raise FastPathError(f"unclosed <{reader.open_tags[-1]}>")
+    if not fragment and reader.closed_roots != 1:
+        raise FastPathError("slice is not a single element")
+    return reader
+
+def element_text(source: str) -> str:
+    return "".join(read_slice(source).text)
+
+def element_contents(source: str) -> str:
+    "The inner HTML of an element, as BeautifulSoup's decode_contents() would serialise it."
+    markup = read_slice(source).markup
+    return "".join(markup[1:-1])
+
+class Page:
+    def __init__(self, source: str):
+        self.source = source
+        # Same length as the source, so that offsets found in it apply to the source too
+        self.masked = OPAQUE_PATTERN.sub(lambda m: " " * len(m.group()), source)
+        if UNUSUAL_MARKUP_PATTERN.search(self.masked):
+            raise FastPathError("page contains markup the fast path does not handle")
+
+    def find_start_tag(
+        self, name: str, predicate: Optional[Callable[[dict[str, str]], bool]] = None, start: int = 0,
+        end: Optional[int] = None, hint: Optional[str] = None
+    ) -> Optional[re.Match]:
+        """The first start tag named `name` (any name if "") at or after `start` whose attributes satisfy `predicate`,
+        like BeautifulSoup's find() and find_next(). `hint` is a string the tag must contain unless it has character
+        references in it, and saves parsing the attributes of most candidates.
+        """
+        name_pattern = re.escape(name) if name else r"[a-zA-Z][^\s/>]*"
+        pattern = re.compile(rf"<({name_pattern})(?=[\s/>])[^>]*>", flags=re.IGNORECASE)
+        for m in pattern.finditer(self.masked, start, len(self.masked) if end is None else end):
+            if hint is not None and hint not in m.group() and "&" not in m.group():
+                continue
+            if predicate is None or predicate(start_tag_attributes(m.group())):
+                return m
+        return None
+
+    def element_span(self, start_tag: re.Match) -> tuple[int, int]:
+        "The (start, end) offsets of the element opened by `start_tag`, end tag included."
+        name = start_tag.group(1)
+        depth = 0
+        for m in re.finditer(rf"<(/?){re.escape(name)}(?=[\s/>])[^>]*?(/?)>", self.masked, pos=start_tag.start(), flags=re.IGNORECASE):
+            if m.group(1):
+                depth -= 1
+            elif not m.group(2):
+                depth += 1
+            if depth == 0:
+                return start_tag.start(), m.end()
+        raise FastPathError(f"unclosed <{name}>")
+
+    def element_source(self, start_tag: re.Match) -> str:
+        start, end = self.element_span(start_tag)
+        return self.source[start:end]
+
+    def require(self, m: Optional[re.Match], description: str) -> re.Match:
+        if m is None:
+            raise FastPathError(f"page has no {description}")
+        return m
+
+class AttributeReader(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.attrs: Optional[dict[str, str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        self.attrs = {name: value or "" for name, value in attrs}
+
+    handle_startendtag = handle_starttag
+
+def start_tag_attributes(tag_source: str) -> dict[str, str]:
+    reader = AttributeReader()
+    reader.feed(tag_source)
+    reader.close()
+    if reader.attrs is None:
+        raise FastPathError(f"unreadable start tag {tag_source}")
+    return reader.attrs
+
+def has_class(class_name: str) -> Callable[[dict[str, str]], bool]:
+    "Match tags as BeautifulSoup matches attrs={'class': class_name}: any one class, or the whole attribute value."
+    return lambda attrs: "class" in attrs and (class_name in attrs["class"].split() or attrs["class"] == class_name)
+
+def has_attribute(name: str, value: str) -> Callable[[dict[str, str]], bool]:
+    return lambda attrs: attrs.get(name) == value
+
+def extract_kanji_fields(page_data: str) -> KanjiPageFields:
+    page = Page(page_data)
+
+    oyaji = page.require(page.find_start_tag("", has_attribute("id", "kanjiOyaji"), hint="kanjiOyaji"), "headword")
+    level = page.require(LEVEL_PATTERN.search(page_data), "level").group(1)
+    is_kokuji = page.find_start_tag("img", has_attribute("src", "/common/images/icon_kokuji.gif"), hint="icon_kokuji") is not None
+
+    on_icon = page.require(page.find_start_tag("img", has_attribute("src", "/common/images/icon_on.png"), hint="icon_on"), "on icon")
+    on_block = page.require(page.find_start_tag("p", has_class("onkunYomi"), on_icon.end(), hint="onkunYomi"), "on readings")
+    on_html = element_contents(page.element_source(on_block))
+    on_text = "".join(read_slice(on_html.replace(HYOUGAI_TEXT, "・" + HYOUGAI_TEXT), fragment=True).text)
+
+    kun_icon = page.require(page.find_start_tag("img", has_attribute("src", "/common/images/icon_kun.png"), hint="icon_kun"), "kun icon")
+    kun_block = page.require(page.find_start_tag("p", has_class("onkunYomi"), kun_icon.end(), hint="onkunYomi"), "kun readings")
+
+    bushu = page.require(page.find_start_tag("p", has_class("kanjiBushu"), hint="kanjiBushu"), "radical")
+    bushu_image = page.require(page.find_start_tag("img", None, bushu.end()), "radical image")
+    bushu_attributes = start_tag_attributes(bushu_image.group())
+    if "src" not in bushu_attributes:
+        raise FastPathError("radical image has no src")
+
+    strokes = page.require(STROKE_COUNT_PATTERN.search(page_data), "stroke count").group(1)
+    added_strokes = page.require(ADDED_STROKE_COUNT_PATTERN.search(page_data), "added stroke count").group(1)
+
+    right_section = page.require(page.find_start_tag("", has_attribute("id", "kanjiRightSection"), hint="kanjiRightSection"), "meaning section")
+    right_section_end = page.element_span(right_section)[1]
+    meaning_div = page.require(page.find_start_tag("div", None, right_section.end(), right_section_end), "meaning block")
+    meaning_div_end = page.element_span(meaning_div)[1]
+    meaning = page.require(page.find_start_tag("p", None, meaning_div.end(), meaning_div_end), "meaning paragraph")
+
+    origin_text = None
+    if (origin_head := page.find_start_tag("", has_attribute("href", "https://promo.kadokawa.co.jp/shinjigen/"), hint="shinjigen")):
+        if (origin_explanation := page.find_start_tag("p", None, origin_head.end())):
+            origin_text = element_text(page.element_source(origin_explanation)).strip()
+
+    return KanjiPageFields(
+        oyaji_text=element_text(page.element_source(oyaji)),
+        level=level,
+        is_kokuji=is_kokuji,
+        on_text=on_text,
+        kun_html=element_contents(page.element_source(kun_block)),
+        bushu_image=bushu_attributes["src"],
+        strokes=strokes,
+        added_strokes=added_strokes,
+        meaning_html=element_contents(page.element_source(meaning)),
+        origin_text=origin_text
+    )
+
+def extract_kotoba_fields(page_data: str) -> KotobaPageFields:
+    page = Page(page_data)
+
+    headline_div = page.require(page.find_start_tag("div", has_attribute("id", "kotobaArea"), hint="kotobaArea"), "headline")
+    word = page.require(page.find_start_tag("p", None, headline_div.end()), "word")
+    reading = page.require(page.find_start_tag("p", None, word.end()), "reading")
+    explanation = page.require(
+        page.find_start_tag("div", has_attribute("id", "kotobaExplanationSection"), hint="kotobaExplanationSection"),
+        "explanation"
+    )
+
+    return KotobaPageFields(
+        word=element_text(page.element_source(word)),
+        reading=element_text(page.element_source(reading)),
+        explanation=element_text(page.element_source(explanation))
+    )
@@ -47,17 +47,26 @@ def main():
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("word", nargs="?")
+    parser.add_argument("word", nargs="*")
     parser.add_argument("-o", default="output.wav", metavar="o")
+    parser.add_argument("-d", "--directory", metavar="DIRECTORY",
+                        help="save the audio of each word to DIRECTORY/<word>.wav instead, skipping words already saved "
+                             "there; e.g. build/cache/audio, for kanken_processor.py --media")
 
     args = parser.parse_args()
+    if len(args.word) > 1 and args.directory is None:
+        parser.error("more than one word needs -d/--directory, as -o only takes one")
 
-    if not args.word:
-        word = input("Enter word to get audio for: ")
-    else:
-        word = args.word
-    out_path = Path(args.o)
-    save_wav(word, out_path)
+    words = args.word or [input("Enter word to get audio for: ")]
+    if args.directory is None:
+        save_wav(words[0], Path(args.o))
+        return
+    directory = Path(args.directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for word in words:
+        out_path = directory / f"{word}.wav"
+        if not out_path.exists():
+            save_wav(word, out_path)
 
 
 if __name__ == "__main__":
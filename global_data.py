@@ -1,21 +1,66 @@
-import json
-from data_models import KaikkiKanjiData, ReadingSet
-from supplementary.pronunciation.accent_tsv_to_json import ReadingRecord
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, Optional
 
-with open("supplementary/pronunciation/kanji_readings.json") as f:
-    KANJI_READINGS: dict[str, ReadingSet] = json.load(f)
+from pitch_accents import PitchAccentIndex, build_pitch_accent_table
+from supplementary_bundle import BundleTable, SupplementaryBundle, TableBuilder, build_jsonl_table
 
-with open("supplementary/kanjipedia/bushu_image_to_unicode.json") as f:
-    IMAGE_NAME_TO_RADICAL: dict[str, str] = json.load(f)
+if TYPE_CHECKING:
+    from data_models import KaikkiKanjiData, ReadingSet
 
-with open("supplementary/kanjipedia/headword_kanji_to_unicode.json") as f:
-    HEADWORD_KANJI_TO_UNICODE: dict[str, str] = json.load(f)
+KANJI_READINGS_PATH = "supplementary/pronunciation/kanji_readings.json"
+IMAGE_NAME_TO_RADICAL_PATH = "supplementary/kanjipedia/bushu_image_to_unicode.json"
+HEADWORD_KANJI_TO_UNICODE_PATH = "supplementary/kanjipedia/headword_kanji_to_unicode.json"
+SPECIAL_IMAGE_EXCEPTIONS_PATH = "supplementary/kanjipedia/special_image_exceptions.json"
+KANJI_ETYMOLOGIES_PATH = "supplementary/characters/kanji_etymologies.jsonl"
+PITCH_ACCENTS_PATH = "supplementary/pronunciation/accents.tsv"
 
-with open("supplementary/kanjipedia/special_image_exceptions.json") as f:
-    SPECIAL_IMAGE_EXCEPTIONS: dict[str, str] = json.load(f)
+# The tables below are read from the supplementary bundle (see supplementary_bundle.py) on first access, e.g.
+# `global_data.KANJI_READINGS`; each looks entries up in the bundle rather than holding them in memory. Most are
+# read-only mappings. Access them through the module rather than with `from global_data import`, which would open the bundle
+# (and build it, if needed) on import.
+KANJI_READINGS: Mapping[str, "ReadingSet"]
+IMAGE_NAME_TO_RADICAL: Mapping[str, str]
+HEADWORD_KANJI_TO_UNICODE: Mapping[str, str]
+SPECIAL_IMAGE_EXCEPTIONS: Mapping[str, str]
+KANJI_ETYMOLOGIES: Mapping[str, list["KaikkiKanjiData"]]
+PITCH_ACCENTS: PitchAccentIndex  # Look up with PITCH_ACCENTS.get(word, reading)
 
-with open("supplementary/characters/kanji_etymologies.json") as f:
-    KANJI_ETYMOLOGIES: dict[str, list[KaikkiKanjiData]] = json.load(f)
+# Every file that parsed pages depend on, by the name of the table compiled from it
+TABLE_PATHS = {
+    "KANJI_READINGS": KANJI_READINGS_PATH,
+    "IMAGE_NAME_TO_RADICAL": IMAGE_NAME_TO_RADICAL_PATH,
+    "HEADWORD_KANJI_TO_UNICODE": HEADWORD_KANJI_TO_UNICODE_PATH,
+    "SPECIAL_IMAGE_EXCEPTIONS": SPECIAL_IMAGE_EXCEPTIONS_PATH,
+    "KANJI_ETYMOLOGIES": KANJI_ETYMOLOGIES_PATH,
+    "PITCH_ACCENTS": PITCH_ACCENTS_PATH,
+}
+OPTIONAL_TABLES = {"KANJI_ETYMOLOGIES"}  # Generated from a separate kaikki.org dump, so may not have been set up
+# Tables that aren't plain JSON objects: how each is compiled into the bundle, and the class it is read through
+TABLE_BUILDERS: dict[str, TableBuilder] = {
+    "KANJI_ETYMOLOGIES": build_jsonl_table,
+    "PITCH_ACCENTS": build_pitch_accent_table,
+}
+TABLE_VIEWS = {
+    "PITCH_ACCENTS": PitchAccentIndex,
+}
 
-with open("supplementary/pronunciation/accents.json") as f:
-    PITCH_ACCENTS: dict[str, ReadingRecord] = json.load(f)
+_bundle: Optional[SupplementaryBundle] = None
+
+def bundle() -> SupplementaryBundle:
+    "The bundle the tables are read from, first rebuilt if any of their files has changed since it was built."
+    global _bundle
+    if _bundle is None:
+        _bundle = SupplementaryBundle(TABLE_PATHS, OPTIONAL_TABLES, TABLE_BUILDERS)
+        _bundle.ensure()
+    return _bundle
+
+def fingerprint() -> str:
+    "Identifies the current content of every table, so that caches of parsed pages can tell when they are out of date."
+    return bundle().fingerprint
+
+def __getattr__(name: str) -> Any:
+    if name not in TABLE_PATHS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    table = TABLE_VIEWS.get(name, BundleTable)(bundle(), name)
+    globals()[name] = table  # Later look-ups find the table directly, without going through __getattr__
+    return table
@@ -1 +1,4 @@
-grep -rnw 'kanjipedia/kanji' -e 'icon_rewrite.png' | sed -E 's/(kanjipedia\/kanji\/.\.html).+/\1/' > kakikae.txt
\ No newline at end of file
+# Kanji pages are kept in the pack store, so unpack them for grep first, afresh every time so as not to grep stale pages
+rm -rf build/cache/kanji_pages
+python corpus_pack.py unpack kanji build/cache/kanji_pages
+grep -rnw 'build/cache/kanji_pages' -e 'icon_rewrite.png' | sed -E 's/(build\/cache\/kanji_pages\/.\.html).+/\1/' > kakikae.txt
\ No newline at end of file
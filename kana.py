@@ -0,0 +1,14 @@
+"Kana tables, kept apart from the collator so that they can be imported without its parsers."
+
+# https://stackoverflow.com/questions/4877139/how-can-i-convert-all-japanese-hiragana-to-katakana-characters-in-python
+hira_start = int("3041", 16)
+hira_end = int("3096", 16)
+kata_start = int("30a1", 16)
+kata_to_hira = dict()
+for i in range(hira_start, hira_end+1):
+    # print(chr(i), chr(i-hira_start+kata_start))
+    kata_to_hira[chr(i-hira_start+kata_start)] = chr(i)
+
+def normalize_katakana(katakana: str) -> str:
+    # katakana = katakana.strip()
+    return "".join(kata_to_hira[char] for char in katakana)
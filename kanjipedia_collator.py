@@ -1,11 +1,23 @@
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 import itertools
-from typing import Generator
+import sys
+import time
+import traceback
+from typing import Generator, Iterable, Optional, Union
 import regex as re
 import os.path
 import bs4
 from tqdm import tqdm
-from data_models import GlyphOrigin, Kanji, Kanjitab, KankenReading, KankenLevels, Kotoba, Meaning, Reading, RikuSho
-from global_data import KANJI_READINGS, IMAGE_NAME_TO_RADICAL, HEADWORD_KANJI_TO_UNICODE, KANJI_ETYMOLOGIES, PITCH_ACCENTS, SPECIAL_IMAGE_EXCEPTIONS
+from data_models import SCHEMA_VERSION, GlyphOrigin, Kanji, KanjiPageFields, Kanjitab, KankenReading, KankenLevels, Kotoba, KotobaPageFields, Meaning, Reading, RikuSho
+import fast_extraction
+from kana import kata_to_hira, normalize_katakana
+from corpus_pack import PackStore, open_pack_store
+from parse_cache import ParseCache
+from kotoba_store import KOTOBA_KIND, open_kotoba_store
+import global_data
+import profiling
 
 def compile_yojijukugo() -> list[str]:
     yoji_pattern = re.compile(r'<div id="kotobaArea">[\s\S]+?<p>.*?(\w{4})<\/p>\s*<p class="kotobaYomi">(\w+)<\/p>')
@@ -13,42 +25,44 @@ def compile_yojijukugo() -> list[str]:
     angle_brackets_pattern = re.compile(r'〈|〉')
     gaiji_pattern = re.compile(r'<img src="/common/images/kanji/\d+/std_(.+?)\.png">')
     out = []
-    for file in os.listdir("kanjipedia/kotoba/yojijyukugo"):
-        relative_path = os.path.join("kanjipedia/kotoba/yojijyukugo", file)
-        with open(relative_path) as f:
-            content = f.read()
-            content = spelling_note_pattern.sub("", content)  # Strip these two which get in the way of the regex
-            content = angle_brackets_pattern.sub("", content)
-            content = gaiji_pattern.sub(lambda m: chr(int(m.group(1), 16)), content)  # Replace gaiji images with their corresponding Unicode character
-            m = yoji_pattern.search(content)
-            out.append(m.group(1))
+    store = open_kotoba_store(open_pack_store())
+    for _, page in store.pack.items(KOTOBA_KIND, store.ids_in("yojijyukugo")):
+        content = page.decode()
+        content = spelling_note_pattern.sub("", content)  # Strip these two which get in the way of the regex
+        content = angle_brackets_pattern.sub("", content)
+        content = gaiji_pattern.sub(lambda m: chr(int(m.group(1), 16)), content)  # Replace gaiji images with their corresponding Unicode character
+        m = yoji_pattern.search(content)
+        out.append(m.group(1))
     return out
 
 IMAGE_OYAJI_PATTERN = re.compile(r'<p id="kanjiOyaji"><img src="/common/images/kanji/180/(nw|std)_(.+)\.png"></p>')
-def convert_kanji_image(page_data: str, parser: bs4.BeautifulSoup) -> str:
-    if (text := parser.find(id="kanjiOyaji").text):
-        return text
+def kanji_from_oyaji(oyaji_text: str, page_data: str) -> str:
+    if oyaji_text:
+        return oyaji_text
     elif (m := IMAGE_OYAJI_PATTERN.search(page_data)):
         image_type = m.group(1)  # 'nw' or 'std'; 'nw' is special and apparently arbitrary, so needs look-up
         if image_type == "std":
             kanji_code = m.group(2)
 
-            if kanji_code in SPECIAL_IMAGE_EXCEPTIONS:
-                return SPECIAL_IMAGE_EXCEPTIONS[kanji_code]
+            if kanji_code in global_data.SPECIAL_IMAGE_EXCEPTIONS:
+                return global_data.SPECIAL_IMAGE_EXCEPTIONS[kanji_code]
 
             return chr(int(kanji_code, 16))  # The kanji image file is just named after its own Unicode codepoint
         else:
             num = m.group(2)
             try:
-                return HEADWORD_KANJI_TO_UNICODE[num]
+                return global_data.HEADWORD_KANJI_TO_UNICODE[num]
             except:
                 print(page_data)
                 raise Exception(num)
     else:
         raise Exception("Kanji could not be retrieved")
 
+def convert_kanji_image(page_data: str, parser: bs4.BeautifulSoup) -> str:
+    return kanji_from_oyaji(parser.find(id="kanjiOyaji").text, page_data)
+
 def create_reading_list(wiktionary_readings: list[str], kanken_readings: list[KankenReading]) -> list[Reading]:
-    wiktionary_set = set(wiktionary_readings)
+    wiktionary_set = dict.fromkeys(wiktionary_readings)  # Ordered as on Wiktionary, rather than by hash
     out = []
     seen_readings = set()
     for reading in kanken_readings:
@@ -106,19 +120,6 @@ def parse_meaning_list(meaning_string: str) -> list[Meaning]:
     return split
 
 
-# https://stackoverflow.com/questions/4877139/how-can-i-convert-all-japanese-hiragana-to-katakana-characters-in-python
-hira_start = int("3041", 16)
-hira_end = int("3096", 16)
-kata_start = int("30a1", 16)
-kata_to_hira = dict()
-for i in range(hira_start, hira_end+1):
-    # print(chr(i), chr(i-hira_start+kata_start))
-    kata_to_hira[chr(i-hira_start+kata_start)] = chr(i)
-
-def normalize_katakana(katakana: str) -> str:
-    # katakana = katakana.strip()
-    return "".join(kata_to_hira[char] for char in katakana)
-
 OKURIGANA_READING_PATTERN = re.compile(r"(.+)<span class=\"txtNormal\">(.+?)<")
 HYOUGAI_TEXT = '<img alt="外" src="/common/images/icon_loanword.png"/>'
 def parse_kanjipedia_kun(kun_string: str) -> list[KankenReading]:
@@ -140,26 +141,53 @@ def parse_kanjipedia_kun(kun_string: str) -> list[KankenReading]:
     return out
 
 # Parsing kanji
-def parse_single_kanji(page_data: str) -> Kanji:
-    """Return an as-yet incomplete (with some fields yet to be populated) Kanji object.
-    The reason it must be incomplete is because updated "shitatsuki" (and other) data
-    must be able to be added to the Kanji object from other sources, i.e.
-    the rest of the program should be able to add related compounds to the given fields
-    once some Kotoba have been parsed already.
-    """
+def extract_kanji_fields_bs4(page_data: str) -> KanjiPageFields:
+    "The reference extraction engine, which builds a full BeautifulSoup tree of the page."
     parser = bs4.BeautifulSoup(page_data, "html.parser")
 
-    
-    kanji = convert_kanji_image(page_data, parser)
-    level = KankenLevels.str_to_enum(re.search(r'alt="(準?\d{1,2})級"', page_data).group(1))
-    is_kokuji = bool(parser.find("img", src="/common/images/icon_kokuji.gif"))
+    on_html = parser.find("img", src="/common/images/icon_on.png").find_next("p", attrs={"class": "onkunYomi"}).decode_contents()
+    if (origin_head := parser.find(href="https://promo.kadokawa.co.jp/shinjigen/")) and (
+        (origin_explanation := origin_head.find_next("p"))
+    ):
+        origin_text = origin_explanation.text.strip()
+    else:
+        origin_text = None
+
+    return KanjiPageFields(
+        oyaji_text=parser.find(id="kanjiOyaji").text,
+        level=re.search(r'alt="(準?\d{1,2})級"', page_data).group(1),
+        is_kokuji=bool(parser.find("img", src="/common/images/icon_kokuji.gif")),
+        on_text=bs4.BeautifulSoup(on_html.replace(HYOUGAI_TEXT, "・" + HYOUGAI_TEXT), "html.parser").text,
+        kun_html=parser.find("img", src="/common/images/icon_kun.png").find_next("p", attrs={"class": "onkunYomi"}).decode_contents(),
+        bushu_image=parser.find("p", attrs={"class": "kanjiBushu"}).find_next("img").attrs["src"],
+        strokes=re.search(r'画数：\((\d+)\)', page_data).group(1),
+        added_strokes=re.search(r'部首内画数(\d+)', page_data).group(1),
+        meaning_html=parser.find(id="kanjiRightSection").findChild("div").findChild("p").decode_contents(),
+        origin_text=origin_text
+    )
+
+def extract_kanji_fields(page_data: str, engine: str = "bs4") -> KanjiPageFields:
+    """Pull the raw fields out of a kanji page with the given extraction engine. The fast engine hands any page it is
+    not certain to read exactly like the reference engine back to the reference engine.
+    """
+    if engine == "fast":
+        try:
+            return fast_extraction.extract_kanji_fields(page_data)
+        except fast_extraction.FastPathError:
+            pass
+    return extract_kanji_fields_bs4(page_data)
+
+def assemble_kanji(fields: KanjiPageFields, page_data: str) -> Kanji:
+    kanji = kanji_from_oyaji(fields.oyaji_text, page_data)
+    level = KankenLevels.str_to_enum(fields.level)
+    is_kokuji = fields.is_kokuji
     
     # Fetch reading data (from Wiktionary)
-    wiktionary_readings = KANJI_READINGS[kanji]
+    wiktionary_readings = global_data.KANJI_READINGS[kanji]
 
     # Fetch reading data (from this Kanjipedia page)
-    kanken_on = [KankenReading(reading, is_hyougai=False) for reading in map(normalize_katakana, map(str.strip, bs4.BeautifulSoup(parser.find("img", src="/common/images/icon_on.png").find_next("p", attrs={"class": "onkunYomi"}).decode_contents().replace(HYOUGAI_TEXT, "・" + HYOUGAI_TEXT), "html.parser").text.replace("／", "").split("・")))]
-    kanken_kun = parse_kanjipedia_kun(parser.find("img", src="/common/images/icon_kun.png").find_next("p", attrs={"class": "onkunYomi"}).decode_contents())
+    kanken_on = [KankenReading(reading, is_hyougai=False) for reading in map(normalize_katakana, map(str.strip, fields.on_text.replace("／", "").split("・")))]
+    kanken_kun = parse_kanjipedia_kun(fields.kun_html)
 
     # # TODO: exclude readings that are present in Wiktionary from these lists?
     # kun = []
@@ -177,22 +205,18 @@ def parse_single_kanji(page_data: str) -> Kanji:
     toon = create_reading_list_with_primary_wiktionary_readings(wiktionary_readings["toon"], kanken_on)
 
     # Kanji trivia
-    bushu_image = parser.find("p", attrs={"class": "kanjiBushu"}).find_next("img").attrs["src"]
-    numeric_radical_code = os.path.splitext(os.path.split(bushu_image)[1])[0]
-    radical = IMAGE_NAME_TO_RADICAL[numeric_radical_code]
+    numeric_radical_code = os.path.splitext(os.path.split(fields.bushu_image)[1])[0]
+    radical = global_data.IMAGE_NAME_TO_RADICAL[numeric_radical_code]
     
-    stroke_count = re.search(r'画数：\((\d+)\)', page_data).group(1)
-    added_stroke_count = re.search(r'部首内画数(\d+)', page_data).group(1)
+    stroke_count = fields.strokes
+    added_stroke_count = fields.added_strokes
 
-    kanji_right_section = parser.find(id="kanjiRightSection")
-    meanings = parse_meaning_list(kanji_right_section.findChild("div").findChild("p").decode_contents().strip().replace("\n", "<br>"))
+    meanings = parse_meaning_list(fields.meaning_html.strip().replace("\n", "<br>"))
 
-    if (origin_head := parser.find(href="https://promo.kadokawa.co.jp/shinjigen/")) and (
-        (origin_explanation := origin_head.find_next("p"))
-    ):
-        origin = GlyphOrigin(RikuSho.ARBITRARY, origin_explanation.text.strip())
+    if fields.origin_text is not None:
+        origin = GlyphOrigin(RikuSho.ARBITRARY, fields.origin_text)
     else:
-        if kanji in KANJI_ETYMOLOGIES:
+        if kanji in global_data.KANJI_ETYMOLOGIES:
             # TODO: extract the etymology from the etymology templates and give a precise etymology
             pass
         origin = GlyphOrigin(RikuSho.UNKNOWN, None)
@@ -220,11 +244,18 @@ def parse_single_kanji(page_data: str) -> Kanji:
         replaces=[]
     )
 
-def parse_all_kanji(save_path: str = "kanjipedia/kanji") -> Generator[Kanji, None, None]:
-    for file in tqdm(os.listdir(save_path)):
-        file_path = os.path.join(save_path, file)
-        with open(file_path) as f:
-            yield parse_single_kanji(f.read())
+def parse_single_kanji(page_data: str, engine: str = "bs4") -> Kanji:
+    """Return an as-yet incomplete (with some fields yet to be populated) Kanji object.
+    The reason it must be incomplete is because updated "shitatsuki" (and other) data
+    must be able to be added to the Kanji object from other sources, i.e.
+    the rest of the program should be able to add related compounds to the given fields
+    once some Kotoba have been parsed already.
+    """
+    return assemble_kanji(extract_kanji_fields(page_data, engine), page_data)
+
+def parse_all_kanji(jobs: int = 1, engine: str = "bs4", cache: Optional[ParseCache] = None) -> Generator[Kanji, None, None]:
+    pack = open_pack_store()
+    yield from parse_stored_pages(pack, "kanji", pack.names("kanji"), jobs, engine, cache)
 
 USAGE_SYMBOL_PATTERN = re.compile(r"[▲△〈〉]")
 def strip_usage_symbols(headword: str) -> str:
@@ -244,21 +275,37 @@ def get_nyms(meanings: str) -> tuple[list[str], list[str]]:
     pass
 
 COLUMN_RUBRIC_PATTERN = re.compile(r"■コラムを読んでみよう\n.+")
-def parse_single_kotoba(page_data: str) -> Kotoba:
+def extract_kotoba_fields_bs4(page_data: str) -> KotobaPageFields:
+    "The reference extraction engine, which builds a full BeautifulSoup tree of the page."
     parser = bs4.BeautifulSoup(page_data, "html.parser")
     
     headline_div = parser.find("div", id="kotobaArea")
-    word = headline_div.find_next("p").text
-    reading = headline_div.find_next("p").find_next("p").text
+    return KotobaPageFields(
+        word=headline_div.find_next("p").text,
+        reading=headline_div.find_next("p").find_next("p").text,
+        explanation=parser.find("div", id="kotobaExplanationSection").text
+    )
+
+def extract_kotoba_fields(page_data: str, engine: str = "bs4") -> KotobaPageFields:
+    if engine == "fast":
+        try:
+            return fast_extraction.extract_kotoba_fields(page_data)
+        except fast_extraction.FastPathError:
+            pass
+    return extract_kotoba_fields_bs4(page_data)
+
+def assemble_kotoba(fields: KotobaPageFields) -> Kotoba:
+    word = fields.word
+    reading = fields.reading
     
     is_jukujikun_ateji = has_ateji_or_jukujikun(word)
     word = strip_usage_symbols(word)
 
-    meaning = parser.find("div", id="kotobaExplanationSection").text.strip()
+    meaning = fields.explanation.strip()
     meaning = COLUMN_RUBRIC_PATTERN.sub("", meaning)  # Remove kanji article advertisements
     meaning = meaning.replace("\n", "<br>")  # Encode newlines without using the delimiting \n character
 
-    pitch_accent_pattern = PITCH_ACCENTS.get(word, {"accent": []})["accent"]  # If no accents found, just give an empty list
+    pitch_accent_pattern = global_data.PITCH_ACCENTS.get(word, reading)  # If no accents found, just give an empty list
 
     return Kotoba(
         word=word,
@@ -269,8 +316,116 @@ def parse_single_kotoba(page_data: str) -> Kotoba:
         kanjitab=Kanjitab()
     )
 
-def parse_all_kotoba(save_path: str = "kanjipedia/kotoba/kotoba") -> Generator[Kotoba, None, None]:
-    for file in tqdm(os.listdir(save_path)):
-        file_path = os.path.join(save_path, file)
-        with open(file_path) as f:
-            yield parse_single_kotoba(f.read())
\ No newline at end of file
+def parse_single_kotoba(page_data: str, engine: str = "bs4") -> Kotoba:
+    return assemble_kotoba(extract_kotoba_fields(page_data, engine))
+
+def parse_all_kotoba(
+    index_names: tuple[str, ...] = ("kotoba",), jobs: int = 1, engine: str = "bs4", cache: Optional[ParseCache] = None
+) -> Generator[Kotoba, None, None]:
+    "Parse every stored kotoba reached from any of the given indices (by default, those linked from kanji pages), each once."
+    store = open_kotoba_store(open_pack_store())
+    yield from parse_stored_pages(store.pack, KOTOBA_KIND, store.ids_in(*index_names), jobs, engine, cache)
+
+PAGE_PARSERS = {
+    "kanji": parse_single_kanji,
+    KOTOBA_KIND: parse_single_kotoba,
+}
+PARSER_VERSION = 3  # Bump whenever a change to the parsers changes what they produce, so that cached results are not reused
+CHUNK_SIZE = 64  # Pages handed to a worker process at a time
+ENGINES = ("bs4", "fast")  # "bs4" is the reference; "fast" falls back to it for any page it cannot read with certainty
+
+@dataclass
+class ParseFailure:
+    name: str
+    error: str
+
+def parse_chunk(kind: str, chunk: list[tuple[str, bytes]], engine: str = "bs4") -> list[tuple[str, Union[Kanji, Kotoba, ParseFailure], float]]:
+    "(name, result, seconds taken to parse) of each page of the chunk."
+    out = []
+    for name, page in chunk:
+        start = time.perf_counter()
+        try:
+            result = PAGE_PARSERS[kind](page.decode(), engine)
+        except Exception:
+            result = ParseFailure(name, traceback.format_exc())
+        out.append((name, result, time.perf_counter() - start))
+    return out
+
+def record_chunk(kind: str, parsed: list[tuple[str, Union[Kanji, Kotoba, ParseFailure], float]]) -> list[tuple[str, Union[Kanji, Kotoba, ParseFailure]]]:
+    "Hand the time taken to parse each page to the profiler (if profiling), and drop it from the results."
+    profiler = profiling.profiler()
+    for name, _, seconds in parsed:
+        profiler.record_page(kind, name, seconds)
+    return [(name, result) for name, result, _ in parsed]
+
+def parse_pages(kind: str, pages: Iterable[tuple[str, bytes]], jobs: int = 1, engine: str = "bs4") -> Generator[tuple[str, Union[Kanji, Kotoba, ParseFailure]], None, None]:
+    """Parse (name, page) pairs, yielding (name, result) pairs in input order. With more than one job, chunks of pages
+    are parsed on a process pool, with only a few chunks in flight at a time so that memory use stays bounded.
+    """
+    pages = iter(pages)
+    chunks = iter(lambda: list(itertools.islice(pages, CHUNK_SIZE)), [])
+    if jobs <= 1:
+        for chunk in chunks:
+            yield from record_chunk(kind, parse_chunk(kind, chunk, engine))
+        return
+
+    global_data.bundle()  # Bring the supplementary bundle up to date once, rather than in every worker
+    with ProcessPoolExecutor(jobs) as executor:
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(parse_chunk, kind, chunk, engine))
+            if len(in_flight) >= jobs * 2:
+                yield from record_chunk(kind, in_flight.popleft().result())
+        while in_flight:
+            yield from record_chunk(kind, in_flight.popleft().result())
+
+def parse_named_pages(kind: str, pages: Iterable[tuple[str, bytes]], total: int, jobs: int = 1, engine: str = "bs4") -> Generator[tuple[str, Union[Kanji, Kotoba]], None, None]:
+    "Parse (name, page) pairs in order, skipping any that fail to parse; the failures are all reported together at the end."
+    failures: list[ParseFailure] = []
+    for name, result in tqdm(parse_pages(kind, pages, jobs, engine), total=total):
+        if isinstance(result, ParseFailure):
+            failures.append(result)
+        else:
+            yield name, result
+
+    if failures:
+        print(f"{len(failures)} {kind} page(s) could not be parsed:", file=sys.stderr)
+        for failure in failures:
+            print(f"--- {failure.name}", failure.error, sep="\n", file=sys.stderr)
+
+def parse_all_pages(kind: str, pages: Iterable[tuple[str, bytes]], total: int, jobs: int = 1, engine: str = "bs4") -> Generator[Union[Kanji, Kotoba], None, None]:
+    for _, result in parse_named_pages(kind, pages, total, jobs, engine):
+        yield result
+
+def cache_version() -> str:
+    "Everything that a parsed page depends on besides its own content."
+    return f"{PARSER_VERSION}.{SCHEMA_VERSION}.{global_data.fingerprint()}"
+
+def parse_stored_pages(
+    pack: PackStore, kind: str, names: list[str], jobs: int = 1, engine: str = "bs4", cache: Optional[ParseCache] = None
+) -> Generator[Union[Kanji, Kotoba], None, None]:
+    """Parse the given pages of `kind` in the pack store, in name order. With a cache, results are reused for pages whose
+    content is unchanged since they were last parsed (by the same version of the parsers); only new or changed pages are
+    parsed, and the results for pages that have since been removed from the store are dropped.
+    """
+    if cache is None:
+        yield from parse_all_pages(kind, pack.items(kind, names, by_name=True), len(names), jobs, engine)
+        return
+
+    profiler = profiling.profiler()
+    with profiler.stage(f"{kind} cache load"):
+        hashes = pack.hashes(kind, names)
+        results = cache.load(kind, hashes)
+    stale = [name for name in hashes if name not in results]
+    print(f"{len(results)} {kind} page(s) unchanged since last parsed, {len(stale)} to parse", file=sys.stderr)
+    with profiler.stage(f"{kind} parse"):
+        parsed = list(parse_named_pages(kind, pack.items(kind, stale, by_name=True), len(stale), jobs, engine))
+    with profiler.stage(f"{kind} cache dump"):
+        for name, result in parsed:
+            cache.put(kind, name, hashes[name], result)
+            results[name] = result
+        cache.prune(kind, pack.names(kind))
+        cache.commit()
+
+    for name in sorted(results):
+        yield results[name]
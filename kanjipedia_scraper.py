@@ -1,20 +1,27 @@
-import requests
+import argparse
 import json
-import time
-import random
 import functools
-import operator
+import itertools
 import regex as re
 import os
 import sys
-from typing import Optional, Tuple
+import time
+from typing import Callable, Iterable, Optional
+
+from crawl_frontier import Frontier, FrontierEntry, UrlState
+from crawler import Crawler, FetchError
+from corpus_pack import PackStore, open_pack_store
+from page_fragments import STRIPPERS, FragmentError
+from kotoba_store import KOTOBA_KIND, KotobaStore, open_kotoba_store
 
 KANJI_URL_PATTERN = re.compile(r"/kanji/(\d+)")
 PAGE_NUMBER_PATTERN = re.compile(r'<a href="/sakuin/\w+?/.+?/\d+">(\d+)</a>')
 KOTOBA_RESULT_PATTERN = re.compile(r'(?:https://www.kanjipedia.jp)?/kotoba/(\d+)')
 
-KANJI_SEARCH_BASE = "https://www.kanjipedia.jp/search"
-INDEX_BASE = "https://www.kanjipedia.jp/sakuin"
+# Can be pointed at a local stand-in server when testing the crawler
+KANJIPEDIA_BASE = os.environ.get("KANJIPEDIA_BASE_URL", "https://www.kanjipedia.jp").rstrip("/")
+KANJI_SEARCH_BASE = f"{KANJIPEDIA_BASE}/search"
+INDEX_BASE = f"{KANJIPEDIA_BASE}/sakuin"
 HONBUN_INDEX_NAME = "honbun"
 YOJIJUKUGO_INDEX_NAME = "yojijyukugo"
 KOTOWAZA_INDEX_NAME = "koji_kotowaza"
@@ -27,187 +34,259 @@ YOJIJUKUGO_PATH = f"{BASE_PATH}/{YOJIJUKUGO_INDEX_NAME}"
 KOTOWAZA_PATH = f"{BASE_PATH}/{KOTOWAZA_INDEX_NAME}"
 JUKUJIKUN_ATEJI_PATH = f"{BASE_PATH}/{JUKUJIKUN_ATEJI_INDEX_NAME}"
 KOTOBA_PATH = f"{BASE_PATH}/kotoba"
+# Pages themselves are kept in the pack store (see corpus_pack.py), under the kinds below
 
-with open("supplementary/characters/kanken.json") as f:
-    j = json.load(f)
-    KANJI_LIST = functools.reduce(operator.add, (level["kanjiList"] for level in j))
+# Whether to store kanji and kotoba pages stripped down to the regions the collator reads; see page_fragments.py
+STORE_FRAGMENTS = False
 
-with open("supplementary/characters/hiragana.json") as f:
-    j = json.load(f)
-    HIRAGANA = functools.reduce(operator.add, (item["kana"] for item in j if len(item["kana"]) == 1))
+# Maps each kanji to the ID of its Kanjipedia page (/kanji/<id>), or null if searching for it found no page
+KANJI_PAGE_IDS_PATH = "supplementary/kanjipedia/kanji_page_ids.json"
 
-with open("supplementary/characters/katakana.json") as f:
-    j = json.load(f)
-    KATAKANA = functools.reduce(operator.add, (item["kana"] for item in j if len(item["kana"]) == 1))
+KANKEN_PATH = "supplementary/characters/kanken.json"
+HIRAGANA_PATH = "supplementary/characters/hiragana.json"
+KATAKANA_PATH = "supplementary/characters/katakana.json"
 
-def pause_after_search():
-    time.sleep(random.random())
+# The character lists and page ID index are loaded on first use, as most runs only need some of them
 
-def pause_after_fetch():
-    t = random.random() + 1.5
-    print(f"waiting {t:.0f} seconds...", end=" ", flush=True)
-    time.sleep(t)
-    print("done.")
+@functools.cache
+def kanji_list() -> list[str]:
+    with open(KANKEN_PATH) as f:
+        return list(itertools.chain.from_iterable(level["kanjiList"] for level in json.load(f)))
 
-def get_kanjipedia_url(kanji: str) -> Optional[str]:
-    search = f"{KANJI_SEARCH_BASE}?k={kanji}&kt=1&sk=perfect"
-    search_page = requests.get(search)
-    try:
-        return "https://www.kanjipedia.jp" + re.search(KANJI_URL_PATTERN, search_page.content.decode("utf-8")).group(0)
-    except AttributeError:
-        # Match does not exist
-        return None
+@functools.cache
+def kanji_page_ids() -> dict[str, Optional[str]]:
+    with open(KANJI_PAGE_IDS_PATH) as f:
+        return json.load(f)
+
+def load_kana(path: str) -> str:
+    with open(path) as f:
+        return "".join(item["kana"] for item in json.load(f) if len(item["kana"]) == 1)
+
+@functools.cache
+def hiragana() -> str:
+    return load_kana(HIRAGANA_PATH)
+
+@functools.cache
+def katakana() -> str:
+    return load_kana(KATAKANA_PATH)
 
-def get_local_path(kanji: str) -> str:
-    return f"{KANJI_PATH}/{kanji}.html"
+KANJI_KIND = "kanji"
 
-def fetch_kanji_to_file(kanji: str, path: str) -> None:
-    print(f"Fetching {kanji}...", end=" ", flush=True)
-    page_url = get_kanjipedia_url(kanji)
+def index_kind(index_name: str) -> str:
+    return f"index:{index_name}"
+
+# KOTOBA_KIND is a single kind for all kotoba, so each ID is only fetched once whichever index it was reached from
+
+def save_kanji_page_ids() -> None:
+    with open(KANJI_PAGE_IDS_PATH, mode="w") as f:
+        json.dump(dict(sorted(kanji_page_ids().items())), f, ensure_ascii=False, indent=4)
+        f.write("\n")
+
+def search_kanjipedia_url(crawler: Crawler, kanji: str) -> Optional[str]:
+    """Search Kanjipedia for the kanji's page, and record the result in the page ID index. That there is no page is only
+    recorded for a complete search page without a result; any other response is raised, for the search to be retried.
+    """
+    search = f"{KANJI_SEARCH_BASE}?k={kanji}&kt=1&sk=perfect"
+    search_page = crawler.fetch(search)
+    search_page.raise_for_status()
+    if search_page.status_code != 200:
+        raise FetchError(search, f"HTTP {search_page.status_code}")
+    content = search_page.content.decode("utf-8", errors="replace")
+    match = KANJI_URL_PATTERN.search(content)
+    if match is None and "</html>" not in content:
+        raise FetchError(search, "truncated search page")
+    page_id = match and match.group(1)
+    kanji_page_ids()[kanji] = page_id
+    return page_id and f"{KANJIPEDIA_BASE}/kanji/{page_id}"
+
+def get_kanjipedia_url(crawler: Crawler, kanji: str) -> Optional[str]:
+    "Look up the page URL for a kanji, only searching Kanjipedia if the result isn't already in the page ID index."
+    if kanji in kanji_page_ids():
+        page_id = kanji_page_ids()[kanji]
+        return page_id and f"{KANJIPEDIA_BASE}/kanji/{page_id}"
+    return search_kanjipedia_url(crawler, kanji)
+
+# Fetchers return the page content, or None if Kanjipedia has no such page; any other error response is raised, for the
+# frontier to retry later rather than the error page being saved
+def fetch_kanji(crawler: Crawler, entry: FrontierEntry) -> Optional[bytes]:
+    page_url = get_kanjipedia_url(crawler, entry.key)
     if not page_url:
-        print("no page found on Kanjipedia...")
-        return
-    print("found...", end=" ", flush=True)
-    pause_after_search()
-    data = requests.get(page_url)
-    with open(path, mode="wb") as f:
-        f.write(data.content)
-    print("saved; ", end=" ", flush=True)
-    pause_after_fetch()
-
-def download_kanji() -> None:
-    consecutive_failures = 0
-    for kanji in KANJI_LIST:
-        if len(kanji) == 3: kanji = kanji[1:-1] # Handle the 3 characters encoded as (填) etc.
-        path = get_local_path(kanji)
-
-        if os.path.exists(path):
-            continue
-
-        try:
-            fetch_kanji_to_file(kanji, path)
-            consecutive_failures = 0
-        except KeyboardInterrupt:
-            raise SystemExit(0)
-        except Exception as e:
-            print(e)
-            print("Failed to download page for", kanji, "skipping for now", file=sys.stderr)
-            if os.path.exists(path):
-                os.remove(path)
-
-            consecutive_failures += 1
-
-            if consecutive_failures >= 1500:
-                print("Over 1500 consecutive errors; quitting.", file=sys.stderr)
-                raise SystemExit(1)
-            continue
+        return None
+    response = crawler.fetch(page_url)
+    if response.status_code == 404 and kanji_page_ids().get(entry.key):
+        # The page has moved since it was indexed, so search for it afresh
+        page_url = search_kanjipedia_url(crawler, entry.key)
+        if not page_url:
+            return None
+        response = crawler.fetch(page_url)
+    response.raise_for_status()
+    return response.content
+
+def fetch_page(crawler: Crawler, entry: FrontierEntry) -> Optional[bytes]:
+    response = crawler.fetch(entry.url)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+def seed(frontier: Frontier, pack: PackStore, kind: str, entries: Iterable[tuple[str, str]],
+         on_saved: Optional[Callable[[str, bytes], None]] = None) -> None:
+    """Register (key, URL) pairs with the frontier. Pages that were saved before the frontier existed are adopted as
+    already fetched, including running `on_saved` on them, so they are never requested again.
+    """
+    for key, url in entries:
+        if frontier.add(kind, key, url) and pack.has(kind, key):
+            frontier.mark_fetched(kind, key)
+            if on_saved:
+                on_saved(key, pack.get(kind, key))
+
+def storage_form(kind: str, key: str, content: bytes) -> bytes:
+    if not STORE_FRAGMENTS or kind not in STRIPPERS:
+        return content
+    try:
+        return STRIPPERS[kind](content.decode()).encode()
+    except FragmentError:
+        print(f"Could not strip {kind} {key}; storing the full page", file=sys.stderr)
+        return content
+
+def crawl(crawler: Crawler, frontier: Frontier, pack: PackStore, kind: str, fetch: Callable[[Crawler, FrontierEntry], Optional[bytes]],
+          on_saved: Optional[Callable[[str, bytes], None]] = None) -> None:
+    """Fetch everything of `kind` that is due, until nothing more is. Failures are scheduled for a later retry by the
+    frontier rather than retried here, so a flaky page never holds up the rest of the crawl.
+    """
+    while (entries := frontier.due(kind)):
+        for entry, content, error in crawler.run(lambda entry: fetch(crawler, entry), entries):
+            if error is not None:
+                print(error)
+                print(f"Failed to download {kind} {entry.key}, scheduled for retry", file=sys.stderr)
+                frontier.mark_failed(kind, entry.key, str(error))
+            elif content is None:
+                print(f"No page found on Kanjipedia for {kind} {entry.key}...")
+                frontier.mark_not_found(kind, entry.key)
+            else:
+                pack.put(kind, entry.key, storage_form(kind, entry.key, content))
+                frontier.mark_fetched(kind, entry.key)
+                print(f"Saved {kind} {entry.key}...")
+                if on_saved:
+                    on_saved(entry.key, content)
+
+    counts = frontier.counts(kind)
+    print(f"{kind}: " + ", ".join(f"{count} {state.value}" for state, count in counts.items()))
+    if (next_retry := frontier.next_retry_time(kind)) is not None:
+        print(f"{counts.get(UrlState.FAILED, 0)} {kind} page(s) will be retried from {time.ctime(next_retry)} onwards")
 
 def get_index_url(index_name: str, kana: str, *, page: int = 1):
     url = f"{INDEX_BASE}/{index_name}/{kana}"
     if page != 1: url += f"/{page}"
     return url
 
-def get_local_index_path(index_name: str):
-    return f"{BASE_PATH}/indices/{index_name}"
-
-# Returns: the number of pages for that index, plus the first page
-def get_page_count(index_name: str, kana: str) -> Tuple[int, str]:
-    page = requests.get(get_index_url(index_name, kana))
-    content = page.content.decode()
+# Returns: the number of pages for an index, given its first page
+def get_page_count(content: str) -> int:
     page_nums = [*PAGE_NUMBER_PATTERN.finditer(content)]
 
     max_page = 1
     if len(page_nums) != 0:
         max_page = int(max(page_nums, key=lambda m: int(m.group(1))).group(1))
-    return (max_page, content)
-
-# Returns: all links to "kotoba" (e.g. https://www.kanjipedia.jp/kotoba/0000020600) from a search page
-def harvest_kotoba_links_from_search(search_page: str, save_location: str) -> None:
-    for kotoba_match in KOTOBA_RESULT_PATTERN.finditer(search_page):
-        for _ in range(5):
-            try:
-                kotoba_id = kotoba_match.group(1)
-                file_save_location = f"{save_location}/{kotoba_id}.html"
-                kotoba_url = f"https://www.kanjipedia.jp/kotoba/{kotoba_id}"
-                if not os.path.exists(file_save_location):
-                    response = requests.get(kotoba_url)
-                    with open(file_save_location, mode="wb") as f:
-                        f.write(response.content)
-                    print(f"Saved {kotoba_id}.html...", end=" ", flush=False)
-                    pause_after_fetch()
-                else:
-                    print(f"Skipping kotoba with ID {kotoba_id} as it already exists...", flush=False)
-                break
-            except Exception as e:
-                print(e)
-                print("Waiting 30 seconds before trying again...")
-                time.sleep(30)
-
-def download_index_generic(index_name: str, save_path: str, index_alphabet: list[str] = HIRAGANA) -> None:
-    index_path = get_local_index_path(index_name)
-    for kana in index_alphabet:
-        if any(page[0] == kana for page in os.listdir(index_path)):
-            # Index has already been saved
-            print(f"Skpping index {index_name} for {kana}...")
-            continue
-        else:
-            print(f"Downloading {index_name} for {kana}...")
-
-        print(f"Getting results for {kana}...", end=" ", flush=True)
-        num_pages, first_page = get_page_count(index_name, kana)
-        print(f"found {num_pages} page{'s' if num_pages != 1 else ''}...", end=" ", flush=True)
-        with open(f"kanjipedia/indices/{index_name}/{kana}_page_1.html", mode="w") as f:
-            f.write(first_page)
-
-        for i in range(2, num_pages + 1):  # If the page count is more than 1, download the other pages of the index too
-            index_page_url = get_index_url(index_name, kana, page=i)
-            request = requests.get(index_page_url)
-            with open(f"kanjipedia/indices/{index_name}/{kana}_page_{i}.html", mode="w") as f:
-                f.write(request.content.decode())
-
-    for index_page in os.listdir(index_path):
-        print("Processing", index_page)
-        with open(f"{index_path}/{index_page}") as f:
-            index_content = f.read()
-            for kotoba_link_match in KOTOBA_RESULT_PATTERN.finditer(index_content):
-                kotoba_link = "https://www.kanjipedia.jp" + kotoba_link_match.group(0)
-                file_save_path = f"{KOTOBA_PATH}/{index_name}/{kotoba_link_match.group(1)}.html"
-                if os.path.exists(file_save_path):
-                    continue
-                kotoba_content = requests.get(kotoba_link).content.decode()
-                
-                with open(file_save_path, mode="w") as g:
-                    print("Saving", file_save_path)
-                    g.write(kotoba_content)
-
-def download_honbun() -> None:
-    download_index_generic(HONBUN_INDEX_NAME, HONBUN_PATH, index_alphabet=KATAKANA)
-
-def download_yojijukugo() -> None:
-    download_index_generic(YOJIJUKUGO_INDEX_NAME, YOJIJUKUGO_PATH)
-
-def download_kotowaza() -> None:
-    download_index_generic(KOTOWAZA_INDEX_NAME, KOTOWAZA_PATH)
-
-def download_jukujikun_and_ateji() -> None:
-    download_index_generic(JUKUJIKUN_ATEJI_INDEX_NAME, JUKUJIKUN_ATEJI_PATH)
-
-def download_kotoba() -> None:
+    return max_page
+
+# Registers all links to "kotoba" (e.g. https://www.kanjipedia.jp/kotoba/0000020600) from a search page with the frontier,
+# and records that they belong to the given index
+def harvest_kotoba_links_from_search(frontier: Frontier, store: KotobaStore, search_page: str, index_name: str) -> None:
+    kotoba_ids = list(dict.fromkeys(m.group(1) for m in KOTOBA_RESULT_PATTERN.finditer(search_page)))
+    store.add_membership(index_name, kotoba_ids)
+    seed(
+        frontier,
+        store.pack,
+        KOTOBA_KIND,
+        ((kotoba_id, f"{KANJIPEDIA_BASE}/kotoba/{kotoba_id}") for kotoba_id in kotoba_ids)
+    )
+
+def seed_kanji(frontier: Frontier, store: KotobaStore) -> None:
+    def kanji_entries():
+        for kanji in kanji_list():
+            if len(kanji) == 3: kanji = kanji[1:-1] # Handle the 3 characters encoded as (填) etc.
+            yield kanji, f"{KANJI_SEARCH_BASE}?k={kanji}&kt=1&sk=perfect"
+
+    seed(frontier, store.pack, KANJI_KIND, kanji_entries(), functools.partial(harvest_kanji_page, frontier, store))
+
+def harvest_kanji_page(frontier: Frontier, store: KotobaStore, kanji: str, content: bytes) -> None:
+    harvest_kotoba_links_from_search(frontier, store, content.decode(), "kotoba")
+
+def download_kanji(crawler: Crawler, frontier: Frontier, store: KotobaStore) -> None:
+    seed_kanji(frontier, store)
+    kanji_page_ids()  # Load the index before the worker threads start sharing it
+    try:
+        crawl(crawler, frontier, store.pack, KANJI_KIND, fetch_kanji, functools.partial(harvest_kanji_page, frontier, store))
+    finally:
+        save_kanji_page_ids()
+
+def download_index_generic(crawler: Crawler, frontier: Frontier, store: KotobaStore, index_name: str, save_path: str, index_alphabet: Optional[list[str]] = None) -> None:
+    def on_index_page_saved(key: str, content: bytes) -> None:
+        content = content.decode()
+        kana, _, page = key.rpartition("_page_")
+        if page == "1":
+            # If the page count is more than 1, download the other pages of the index too
+            seed(
+                frontier,
+                store.pack,
+                index_kind(index_name),
+                ((f"{kana}_page_{i}", get_index_url(index_name, kana, page=i)) for i in range(2, get_page_count(content) + 1)),
+                on_index_page_saved
+            )
+        harvest_kotoba_links_from_search(frontier, store, content, index_name)
+
+    seed(
+        frontier,
+        store.pack,
+        index_kind(index_name),
+        ((f"{kana}_page_1", get_index_url(index_name, kana)) for kana in index_alphabet or hiragana()),
+        on_index_page_saved
+    )
+    crawl(crawler, frontier, store.pack, index_kind(index_name), fetch_page, on_index_page_saved)
+    crawl(crawler, frontier, store.pack, KOTOBA_KIND, fetch_page)
+
+def download_honbun(crawler: Crawler, frontier: Frontier, store: KotobaStore) -> None:
+    download_index_generic(crawler, frontier, store, HONBUN_INDEX_NAME, HONBUN_PATH, index_alphabet=katakana())
+
+def download_yojijukugo(crawler: Crawler, frontier: Frontier, store: KotobaStore) -> None:
+    download_index_generic(crawler, frontier, store, YOJIJUKUGO_INDEX_NAME, YOJIJUKUGO_PATH)
+
+def download_kotowaza(crawler: Crawler, frontier: Frontier, store: KotobaStore) -> None:
+    download_index_generic(crawler, frontier, store, KOTOWAZA_INDEX_NAME, KOTOWAZA_PATH)
+
+def download_jukujikun_and_ateji(crawler: Crawler, frontier: Frontier, store: KotobaStore) -> None:
+    download_index_generic(crawler, frontier, store, JUKUJIKUN_ATEJI_INDEX_NAME, JUKUJIKUN_ATEJI_PATH)
+
+def download_kotoba(crawler: Crawler, frontier: Frontier, store: KotobaStore) -> None:
     print("Downloading kotoba from saved kanji pages...")
-    SAVE_LOCATION = f"{KOTOBA_PATH}/kotoba"
-    for kanji in os.listdir(KANJI_PATH):
-        print(f"Getting kotoba from {kanji}...")
-        with open(f"{KANJI_PATH}/{kanji}") as kanji_page:
-            content = kanji_page.read()
-            harvest_kotoba_links_from_search(content, SAVE_LOCATION)
+    seed_kanji(frontier, store)  # Harvests the kotoba links of any kanji pages saved before the frontier existed
+    crawl(crawler, frontier, store.pack, KOTOBA_KIND, fetch_page)
 
 def main():
-    # download_kanji(); print("Finished scraping kanji...")
-    download_honbun(); print("Finished scraping main dictionary index...")
-    # download_yojijukugo(); print("Finished scraping yojijukugo...")
-    # download_kotowaza(); print("Finished scraping kotowaza...")
-    # download_jukujikun_and_ateji(); print("Finished scraping jukujikun...")
-    # download_kotoba(); print("Finished downloading kotoba...")
+    cli_parser = argparse.ArgumentParser(
+        prog="kanjipedia-scraper",
+        description="Program that downloads kanji and kotoba pages from Kanjipedia",
+    )
+    cli_parser.add_argument("--workers", type=int, default=4, help="maximum number of requests in flight")
+    cli_parser.add_argument("--rps", type=float, default=2.0, help="global requests-per-second budget")
+    cli_parser.add_argument("--latency-threshold", type=float, default=3.0, dest="latency_threshold",
+                            help="slow down when responses take longer than this many seconds")
+    cli_parser.add_argument("--fragments", action="store_true",
+                            help="store only the parts of kanji and kotoba pages that the collator reads")
+    args = cli_parser.parse_args()
+
+    global STORE_FRAGMENTS
+    STORE_FRAGMENTS = args.fragments
+
+    crawler = Crawler(args.workers, args.rps, latency_threshold=args.latency_threshold)
+    frontier = Frontier()
+    store = open_kotoba_store(open_pack_store())
+    # download_kanji(crawler, frontier, store); print("Finished scraping kanji...")
+    download_honbun(crawler, frontier, store); print("Finished scraping main dictionary index...")
+    # download_yojijukugo(crawler, frontier, store); print("Finished scraping yojijukugo...")
+    # download_kotowaza(crawler, frontier, store); print("Finished scraping kotowaza...")
+    # download_jukujikun_and_ateji(crawler, frontier, store); print("Finished scraping jukujikun...")
+    # download_kotoba(crawler, frontier, store); print("Finished downloading kotoba...")
     print("Done.")
 
 if __name__ == "__main__":
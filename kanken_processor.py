@@ -1,104 +1,298 @@
-import dataclasses
-import json
+from concurrent.futures import ThreadPoolExecutor
+import cProfile
+import datetime
+import functools
+import multiprocessing
+import multiprocessing.connection
 import os
 from pathlib import Path
-import pickle
 import sys
+import time
+import traceback
 import argparse
-from typing import Iterable, Optional
+from typing import Callable, Iterable, Optional
 
-from data_models import Kanji, Kotoba
+from data_models import Kanji, KankenLevels, Kotoba
+from export_writers import COMPRESSIONS, kanji_as_dict, kotoba_as_dict, write_jsonl, write_tsv
+from parse_cache import PARSE_CACHE_PATH, ParseCache
+import profiling
+from sqlite_export import write_sqlite_database
 
-KANJI_CACHE_OBJECT_PATH = Path("build/cache/kanji_cache.pickle")
-KOTOBA_CACHE_OBJECT_PATH = Path("build/cache/kotoba_cache.pickle")
-def load_pickle(path: Path) -> Optional[object]:
-    try:
-        with open(path, "rb") as f:
-            obj = pickle.load(f)
-            return obj
-    except FileNotFoundError:
-        return None
+# Whole-corpus pickles used before the per-page parse cache; only ever deleted now
+LEGACY_CACHE_PATHS = (Path("build/cache/kanji_cache.pickle"), Path("build/cache/kotoba_cache.pickle"))
 
-def dump_pickle(path: Path, obj: object) -> None:
-    with open(path, "wb") as f:
-        pickle.dump(obj, f)
-
-def parse_data_cached() -> tuple[Iterable[Kanji], Iterable[Kotoba]]:
-    """Use pickling to cache parsed kanji/kotoba data on disk and retrieve it if already stored.
-    If the data is over a certain age, or some other conditions are met, it may be invalidated. (Not yet implemented.)
+def parse_data_cached(jobs: int = 1, engine: str = "bs4") -> tuple[Iterable[Kanji], Iterable[Kotoba]]:
+    """Parse kanji/kotoba data, reusing the cached result for every page that hasn't changed since it was last parsed.
+    Results are also invalidated by changes to the parsers (PARSER_VERSION), the data models (SCHEMA_VERSION) or the
+    supplementary data they read, and pages that have been removed are dropped from the cache.
+    New and changed pages are parsed on `jobs` processes, with the given extraction engine.
     """
-    kanji = load_pickle(KANJI_CACHE_OBJECT_PATH)
-    kotoba = load_pickle(KOTOBA_CACHE_OBJECT_PATH)
-    
-    if kanji is None:
-        from kanjipedia_collator import parse_all_kanji
+    import global_data
+    from kanjipedia_collator import cache_version, parse_all_kanji, parse_all_kotoba
+    with profiling.profiler().stage("supplementary data"):
+        global_data.bundle()
+    cache = ParseCache(cache_version())
+    try:
         print("Parsing kanji from Kanjipedia dump...", file=sys.stderr)
-        kanji = list(parse_all_kanji())
-        dump_pickle(KANJI_CACHE_OBJECT_PATH, kanji)
-        
-    if kotoba is None:    
-        from kanjipedia_collator import parse_all_kotoba
+        kanji = list(parse_all_kanji(jobs=jobs, engine=engine, cache=cache))
         print("Parsing kotoba from Kanjipedia dump...", file=sys.stderr)
-        kotoba = list(parse_all_kotoba())
-        dump_pickle(KOTOBA_CACHE_OBJECT_PATH, kotoba)
+        kotoba = list(parse_all_kotoba(jobs=jobs, engine=engine, cache=cache))
+    finally:
+        cache.close()
 
     return kanji, kotoba
 
-def generate_anki_deck():
-    from anki_deck_generator import build_deck
+def collect_deck_media(all_kotoba: Iterable[Kotoba]):
+    from deck_media import collect_kotoba_media
+    print("Collecting deck media...", file=sys.stderr)
+    with profiling.profiler().stage("deck media"):
+        media = collect_kotoba_media(all_kotoba)
+    print(f"{len(media.files)} distinct media files", file=sys.stderr)
+    return media
+
+def write_anki_deck(all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba], update_package: bool = False,
+                    media: bool = False):
+    from anki_deck_generator import write_incremental_deck
+    kotoba_media = collect_deck_media(all_kotoba) if media else None
     print("Building Anki deck...", file=sys.stderr)
-    package = build_deck(*parse_data_cached())
-    package.write_to_file("build/anki/漢検一級.apkg")
+    update_path = f"build/anki/漢検一級-update-{datetime.datetime.now():%Y%m%d-%H%M%S}.apkg" if update_package else None
+    with profiling.profiler().stage("deck packaging"):
+        os.makedirs("build/anki", exist_ok=True)
+        changelog = write_incremental_deck(all_kanji, all_kotoba, "build/anki/漢検一級.apkg", update_path,
+                                           media=kotoba_media)
+    if changelog.duplicate_keys:
+        print(f"Warning: {len(changelog.duplicate_keys)} word(s) or character(s) have more than one note, which share a "
+              f"GUID and so are imported by Anki as one, e.g. {', '.join(changelog.duplicate_keys[:5])}", file=sys.stderr)
+    if changelog.is_empty:
+        print("Deck unchanged since it was last built", file=sys.stderr)
+        return
+    print(f"Deck: {changelog.summary()}; changelog written to {changelog.write()}", file=sys.stderr)
+    if update_path is not None and os.path.exists(update_path):
+        print(f"Update package written to {update_path}", file=sys.stderr)
 
-def generate_tsv_files():
+def write_tsv_files(all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba], compression: str = "none"):
     print("Building TSV files...", file=sys.stderr)
+    with profiling.profiler().stage("tsv export"):
+        os.makedirs("build/tsv", exist_ok=True)
+        write_tsv("build/tsv/kanji.tsv", all_kanji, compression)
+        write_tsv("build/tsv/kotoba.tsv", all_kotoba, compression)
 
-    def generate_dump(output_file: str, iterable: Iterable):
-        with open(output_file, mode="w") as f:
-            f.write("\n".join(str(item) for item in iterable))
+def write_json_files(all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba], compression: str = "none"):
+    print("Building JSON files...", file=sys.stderr)
+    with profiling.profiler().stage("json export"):
+        os.makedirs("build/json", exist_ok=True)
+        write_jsonl("build/json/kanji.jsonl", all_kanji, kanji_as_dict, compression)
+        write_jsonl("build/json/kotoba.jsonl", all_kotoba, kotoba_as_dict, compression)
 
-    all_kanji, all_kotoba = parse_data_cached()
-    generate_dump("build/tsv/kanji.tsv", all_kanji)
-    generate_dump("build/tsv/kotoba.tsv", all_kotoba)
+def write_sqlite_file(all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba]):
+    print("Building SQLite database...", file=sys.stderr)
+    with profiling.profiler().stage("sqlite export"):
+        write_sqlite_database(all_kanji, all_kotoba)
 
-def generate_json_files():
-    print("Building JSON files...", file=sys.stderr)
+def generate_anki_deck(jobs: int = 1, engine: str = "bs4", update_package: bool = False, media: bool = False):
+    write_anki_deck(*parse_data_cached(jobs, engine), update_package, media)
+
+def generate_tsv_files(jobs: int = 1, engine: str = "bs4", compression: str = "none"):
+    write_tsv_files(*parse_data_cached(jobs, engine), compression)
+
+def generate_json_files(jobs: int = 1, engine: str = "bs4", compression: str = "none"):
+    write_json_files(*parse_data_cached(jobs, engine), compression)
+
+def generate_sqlite_file(jobs: int = 1, engine: str = "bs4"):
+    write_sqlite_file(*parse_data_cached(jobs, engine))
+
+Sink = Callable[[Iterable[Kanji], Iterable[Kotoba]], None]
+
+# Output formats built by compile-all, by name. The text dumps and the database mostly wait on I/O or on SQLite, so they
+# share the parsed data from threads, whereas packaging the deck is CPU-bound and gets a process of its own where it can
+# (see `start_sink_process`). The text dumps are also passed the compression to write with, and the deck whether to
+# write an update package and whether to embed media.
+TEXT_SINKS: dict[str, Sink] = {"tsv": write_tsv_files, "json": write_json_files}
+DATABASE_SINKS: dict[str, Sink] = {"sqlite": write_sqlite_file}
+DECK_SINKS: dict[str, Sink] = {"deck": write_anki_deck}
+
+def timed_sink(sink: Sink, all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba]) -> float:
+    "Run `sink`, returning how long it took in seconds."
+    start = time.perf_counter()
+    sink(all_kanji, all_kotoba)
+    return time.perf_counter() - start
+
+def start_sink_process(sink: Sink, all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba]) -> Optional[multiprocessing.Process]:
+    """Run `sink` on a forked process, which inherits the parsed data rather than having it pickled over. Returns None
+    where processes can't be forked, in which case the sink should be run in this process instead.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    process = multiprocessing.get_context("fork").Process(target=sink, args=(all_kanji, all_kotoba))
+    process.start()
+    return process
+
+def write_level_decks(all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba], level_ranges: list[list[KankenLevels]],
+                      jobs: int = 1, media: bool = False):
+    """Write a deck for each of the given levels or ranges of levels, each on a forked process of its own (see
+    `start_sink_process`), with up to `jobs` of them at a time. When profiling, they are written one after another. The
+    media, if any, is collected once beforehand, for every deck to package what its own notes refer to.
+    """
+    from anki_deck_generator import level_deck_name, write_level_deck
+    kotoba_media = collect_deck_media(all_kotoba) if media else None
+    print("Building level decks...", file=sys.stderr)
+    pending = [(level_deck_name(levels), functools.partial(write_level_deck, levels=levels, media=kotoba_media))
+               for levels in level_ranges]
+    running: dict[int, tuple[str, multiprocessing.Process, float]] = {}  # By the process's sentinel
+    timings, failed = {}, []
+    while pending or running:
+        while pending and len(running) < max(jobs, 1):
+            name, sink = pending.pop(0)
+            process = None if profiling.profiler().enabled else start_sink_process(sink, all_kanji, all_kotoba)
+            if process is not None:
+                running[process.sentinel] = (name, process, time.perf_counter())
+                continue
+            try:
+                with profiling.profiler().stage(f"{name} deck"):
+                    timings[name] = timed_sink(sink, all_kanji, all_kotoba)
+            except Exception:
+                traceback.print_exc()
+                failed.append(name)
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            name, process, start = running.pop(sentinel)
+            process.join()
+            timings[name] = time.perf_counter() - start
+            if process.exitcode != 0:
+                failed.append(name)
+
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f}s", file=sys.stderr)
+    if failed:
+        raise RuntimeError(f"Failed to build: {', '.join(failed)}")
+
+def generate_level_decks(jobs: int = 1, engine: str = "bs4", level_ranges: Optional[list[list[KankenLevels]]] = None,
+                         media: bool = False):
+    level_ranges = level_ranges or [[level] for level in KankenLevels]
+    write_level_decks(*parse_data_cached(jobs, engine), level_ranges, jobs, media)
 
-    def generate_dump(output_file: str, iterable: Iterable):
-        with open(output_file, mode="w") as f:
-            f.write("\n".join(json.dumps(dataclasses.asdict(item), ensure_ascii=False) for item in iterable))
+def compile_all(jobs: int = 1, engine: str = "bs4", compression: str = "none", update_package: bool = False,
+                media: bool = False):
+    """Build every output format from a single parse. The deck is packaged in parallel with the text dumps, so that the
+    whole build takes about as long as the slowest output rather than all of them together. When profiling, the outputs
+    are built one after another instead, so that each one's time and memory can be told apart.
+    """
+    start = time.perf_counter()
+    all_kanji, all_kotoba = parse_data_cached(jobs, engine)
+    timings = {"parse": time.perf_counter() - start}
+
+    # Processes are forked before the sink threads are started, as forking a multithreaded process isn't safe
+    sink_start = time.perf_counter()
+    profiled = profiling.profiler().enabled
+    deck_sinks = {name: functools.partial(sink, update_package=update_package, media=media) for name, sink in DECK_SINKS.items()}
+    processes = {} if profiled else {name: start_sink_process(sink, all_kanji, all_kotoba) for name, sink in deck_sinks.items()}
+    text_sinks = {name: functools.partial(sink, compression=compression) for name, sink in TEXT_SINKS.items()}
+    threaded_sinks = {**text_sinks, **DATABASE_SINKS, **{name: sink for name, sink in deck_sinks.items() if processes.get(name) is None}}
+    failed = []
+    with ThreadPoolExecutor(1 if profiled else len(threaded_sinks)) as executor:
+        futures = {name: executor.submit(timed_sink, sink, all_kanji, all_kotoba) for name, sink in threaded_sinks.items()}
+        for name, process in processes.items():
+            if process is not None:
+                process.join()
+                timings[name] = time.perf_counter() - sink_start
+                if process.exitcode != 0:
+                    failed.append(name)
+        for name, future in futures.items():
+            try:
+                timings[name] = future.result()
+            except Exception:
+                traceback.print_exc()
+                failed.append(name)
+    timings["total"] = time.perf_counter() - start
 
-    all_kanji, all_kotoba = parse_data_cached()
-    generate_dump("build/json/kanji.jsonl", all_kanji)
-    generate_dump("build/json/kotoba.jsonl", all_kotoba)
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f}s", file=sys.stderr)
+    if failed:
+        raise RuntimeError(f"Failed to build: {', '.join(failed)}")
+
+def parse_level_range(spec: str) -> list[KankenLevels]:
+    "A level as printed, e.g. 準1, or a range of them, e.g. 5-3, as given on the command line."
+    ends = spec.split("-")
+    try:
+        ends = [KankenLevels.str_to_enum(end.strip().removesuffix("級")) for end in ends]
+    except KeyError:
+        raise argparse.ArgumentTypeError(f"not a level or range of levels: {spec}") from None
+    if len(ends) > 2:
+        raise argparse.ArgumentTypeError(f"not a level or range of levels: {spec}")
+    return [level for level in KankenLevels if min(ends) <= level <= max(ends)]
 
 def main():
     cli_parser = argparse.ArgumentParser(
         prog="kanken-processor",
         description="Program that collates Kanken data",
     )
-    cli_parser.add_argument("action", choices=["compile-tsv", "compile-json", "compile-deck", "compile-all"])
+    cli_parser.add_argument("action", choices=["compile-tsv", "compile-json", "compile-sqlite", "compile-deck", "compile-level-decks",
+                                               "compile-all"])
     cli_parser.add_argument("--purge-cache", action="store_true", dest="purge_cache")
+    cli_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                            help="number of processes to parse pages with (default: one per CPU core)")
+    cli_parser.add_argument("--engine", choices=["bs4", "fast"], default="bs4",
+                            help="how to extract data from pages: with BeautifulSoup (the reference), or with the fast "
+                                 "regex-and-slice extractor, which falls back to BeautifulSoup where needed")
+    cli_parser.add_argument("--compression", choices=COMPRESSIONS, default="none",
+                            help="how to compress the TSV and JSON files (default: none); zstd needs Python 3.14 or the "
+                                 "zstandard package")
+    cli_parser.add_argument("--update-package", action="store_true", dest="update_package",
+                            help="when building the deck, also write a package of only the notes added or changed since "
+                                 "the deck was last built, to import over it")
+    cli_parser.add_argument("--levels", nargs="+", type=parse_level_range, metavar="LEVEL",
+                            help="with compile-level-decks, the levels (e.g. 準1) or ranges of levels (e.g. 5-3) to build a "
+                                 "deck of each of (default: every level on its own)")
+    cli_parser.add_argument("--media", action="store_true",
+                            help="when building decks, add pitch accent images and audio (as downloaded with get_pron.py "
+                                 "into build/cache/audio) to the kotoba notes, and package the files they refer to")
+    cli_parser.add_argument("--profile", nargs="?", const="", metavar="REPORT",
+                            help="record the time and memory taken by each stage, and the time taken to parse each page, "
+                                 f"and write them to REPORT as JSON (default: a timestamped file in {profiling.PROFILE_DIRECTORY}/)")
+    cli_parser.add_argument("--cprofile", metavar="PATH",
+                            help="also write cProfile statistics of the run to PATH, e.g. for pstats or snakeviz")
+    cli_parser.add_argument("--slowest", type=int, default=20,
+                            help="number of the slowest pages of each kind to list in the profile report (default: 20)")
 
     args = cli_parser.parse_args()
 
     # Remove the object storing the cache
     if args.purge_cache and input("Really delete cached data? ") in ("y", "yes"):
-        for path in (KANJI_CACHE_OBJECT_PATH, KOTOBA_CACHE_OBJECT_PATH):
+        for path in (Path(PARSE_CACHE_PATH), *LEGACY_CACHE_PATHS):
             try:
                 os.remove(path)
             except FileNotFoundError:
                 pass
 
+    profiler = profiling.enable() if args.profile is not None else profiling.profiler()
+    cprofiler = cProfile.Profile() if args.cprofile else None
+    if cprofiler is not None:
+        cprofiler.enable()
+    try:
+        with profiler.stage("total"):
+            run_action(args)
+    finally:
+        if cprofiler is not None:
+            cprofiler.disable()
+            cprofiler.dump_stats(args.cprofile)
+            print(f"cProfile statistics written to {args.cprofile}", file=sys.stderr)
+        if profiler.enabled:
+            print(profiler.summary(), file=sys.stderr)
+            print(f"Profile report written to {profiler.write_report(args.profile, args.slowest)}", file=sys.stderr)
+
+def run_action(args: argparse.Namespace):
     action: str = args.action
     if action == "compile-tsv":
-        generate_tsv_files()
+        generate_tsv_files(args.jobs, args.engine, args.compression)
     elif action == "compile-json":
-        generate_json_files()
+        generate_json_files(args.jobs, args.engine, args.compression)
+    elif action == "compile-sqlite":
+        generate_sqlite_file(args.jobs, args.engine)
     elif action == "compile-deck":
-        generate_anki_deck()
+        generate_anki_deck(args.jobs, args.engine, args.update_package, args.media)
+    elif action == "compile-level-decks":
+        generate_level_decks(args.jobs, args.engine, args.levels, args.media)
     elif action == "compile-all":
-        pass  # WIP
+        compile_all(args.jobs, args.engine, args.compression, args.update_package, args.media)
     else:
         print("Invalid action:", action, file=sys.stderr)
 
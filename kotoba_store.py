@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import sys
+from typing import Iterable, Optional
+
+from corpus_pack import PackStore
+
+KOTOBA_PATH = "kanjipedia/kotoba"
+KOTOBA_KIND = "kotoba"  # Kind under which kotoba pages are kept in the pack store
+MEMBERSHIP_PATH = f"{KOTOBA_PATH}/membership.sqlite3"
+
+class KotobaStore:
+    """Every kotoba page is stored exactly once, keyed by its Kanjipedia ID, no matter how many indices (honbun,
+    yojijukugo, kanji pages, ...) link to it. Which indices an entry was reached from is kept as metadata.
+    """
+    def __init__(self, pack: PackStore, membership_path: str = MEMBERSHIP_PATH):
+        self.pack = pack
+        os.makedirs(os.path.dirname(membership_path), exist_ok=True)
+        self.connection = sqlite3.connect(membership_path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS membership (
+                kotoba_id TEXT NOT NULL,
+                index_name TEXT NOT NULL,
+                PRIMARY KEY (index_name, kotoba_id)
+            )
+        """)
+
+    def __contains__(self, kotoba_id: str) -> bool:
+        return self.pack.has(KOTOBA_KIND, kotoba_id)
+
+    def get(self, kotoba_id: str) -> Optional[bytes]:
+        return self.pack.get(KOTOBA_KIND, kotoba_id)
+
+    def put(self, kotoba_id: str, data: bytes) -> None:
+        self.pack.put(KOTOBA_KIND, kotoba_id, data)
+
+    def add_membership(self, index_name: str, kotoba_ids: Iterable[str]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO membership (kotoba_id, index_name) VALUES (?, ?)",
+                ((kotoba_id, index_name) for kotoba_id in kotoba_ids)
+            )
+
+    def ids_in(self, *index_names: str) -> list[str]:
+        "IDs of all stored kotoba reached from any of the given indices, in ID order and without duplicates."
+        rows = self.connection.execute(
+            f"SELECT DISTINCT kotoba_id FROM membership WHERE index_name IN ({', '.join('?' * len(index_names))}) ORDER BY kotoba_id",
+            index_names
+        )
+        stored = set(self.pack.names(KOTOBA_KIND))
+        return [kotoba_id for (kotoba_id,) in rows if kotoba_id in stored]
+
+    def index_names(self, kotoba_id: str) -> list[str]:
+        rows = self.connection.execute("SELECT index_name FROM membership WHERE kotoba_id = ? ORDER BY index_name", (kotoba_id,))
+        return [index_name for (index_name,) in rows]
+
+    def migrate_legacy_layout(self, kotoba_path: str = KOTOBA_PATH, *, delete: bool = True) -> None:
+        """Pack pages from the old per-index layout (kotoba/<index name>/<id>.html), recording the directory each came
+        from as its membership. Where the same ID was saved under several indices, the most recently downloaded copy
+        is kept. Only .html files are packed, and only they are deleted afterwards.
+        """
+        legacy_files = []
+        for index_name, index_path in legacy_index_directories(kotoba_path):
+            print(f"Migrating kotoba saved under {index_name}...", file=sys.stderr)
+            files = [os.path.join(index_path, file) for file in sorted(os.listdir(index_path))
+                     if file.endswith(".html") and os.path.isfile(os.path.join(index_path, file))]
+            self.add_membership(index_name, (os.path.splitext(os.path.basename(file))[0] for file in files))
+            legacy_files.extend(files)
+
+        # Oldest first, so that newer copies of the same ID overwrite older ones
+        legacy_files.sort(key=os.path.getmtime)
+        for file in legacy_files:
+            with open(file, mode="rb") as f:
+                self.pack.put(KOTOBA_KIND, os.path.splitext(os.path.basename(file))[0], f.read(), commit=False)
+        self.pack.commit()
+        if not delete:
+            return
+        for file in legacy_files:
+            os.remove(file)
+        for directory in {os.path.dirname(file) for file in legacy_files}:
+            if not os.listdir(directory):
+                os.rmdir(directory)
+
+def legacy_index_directories(kotoba_path: str = KOTOBA_PATH) -> list[tuple[str, str]]:
+    "The (index name, directory) pairs of the old per-index layout that still hold loose pages."
+    if not os.path.isdir(kotoba_path):
+        return []
+    directories = []
+    for index_name in sorted(os.listdir(kotoba_path)):
+        index_path = os.path.join(kotoba_path, index_name)
+        if not os.path.isdir(index_path) or index_name == "entries":  # "entries" is packed by corpus_pack itself
+            continue
+        if any(file.endswith(".html") for file in os.listdir(index_path)):
+            directories.append((index_name, index_path))
+    return directories
+
+def open_kotoba_store(pack: PackStore) -> KotobaStore:
+    """Open the kotoba store. Pages still saved in the old per-index layout are only warned about; they're packed by
+    `python corpus_pack.py migrate`.
+    """
+    store = KotobaStore(pack)
+    if directories := legacy_index_directories():
+        print(f"Warning: {', '.join(directory for _, directory in directories)} still hold(s) kotoba as loose files, "
+              "which are not read from; run `python corpus_pack.py migrate` to pack them", file=sys.stderr)
+    return store
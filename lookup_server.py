@@ -0,0 +1,233 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from data_models import Kanji, KankenLevels, Kotoba
+from export_writers import kanji_as_dict, kotoba_as_dict
+from kana import kata_to_hira, normalize_katakana
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 4096
+
+class QueryError(ValueError):
+    "A query that can't be answered, e.g. because of an unknown parameter; reported to the client as 400 Bad Request."
+
+class UnknownEndpoint(Exception):
+    "Reported to the client as 404 Not Found."
+
+def normalize_reading(reading: str) -> str:
+    "Readings are looked up in hiragana (see `normalize_katakana`), and without the separator before okurigana."
+    return "".join(normalize_katakana(char) if char in kata_to_hira else char for char in reading.strip()).replace("-", "")
+
+def normalize_level(level: str) -> KankenLevels:
+    "Levels as printed, e.g. 準1 or 準1級."
+    try:
+        return KankenLevels.str_to_enum(level.strip().removesuffix("級"))
+    except KeyError:
+        raise QueryError(f"Unknown level: {level}") from None
+
+def normalize_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"Not a number: {value}") from None
+
+def build_index(items: list, keys: Callable[[Any], list]) -> dict[Any, list[int]]:
+    "Positions in `items` of the items with each key, in order."
+    index = collections.defaultdict(list)
+    for position, item in enumerate(items):
+        for key in dict.fromkeys(keys(item)):  # Each item once per key, even if e.g. two of its readings coincide
+            index[key].append(position)
+    return dict(index)
+
+def kanji_readings(kanji: Kanji) -> list[str]:
+    return [
+        normalize_reading(reading.reading.base + reading.reading.okurigana)
+        for readings in (kanji.on, kanji.goon, kanji.kanon, kanji.kanyoon, kanji.toon, kanji.soon, kanji.kun)
+        for reading in readings
+        if reading.reading.base
+    ]
+
+# Per kind: the query parameters it can be filtered by, as (how to normalise the parameter, how to find an item's keys)
+KANJI_INDEXES: dict[str, tuple[Callable[[str], Any], Callable[[Kanji], list]]] = {
+    "character": (str.strip, lambda kanji: [kanji.character]),
+    "reading": (normalize_reading, kanji_readings),
+    "radical": (str.strip, lambda kanji: [kanji.radical]),
+    "strokes": (normalize_int, lambda kanji: [int(kanji.strokes)]),
+    "level": (normalize_level, lambda kanji: [kanji.level]),
+}
+KOTOBA_INDEXES: dict[str, tuple[Callable[[str], Any], Callable[[Kotoba], list]]] = {
+    "word": (str.strip, lambda kotoba: [kotoba.word]),
+    "reading": (normalize_reading, lambda kotoba: [normalize_reading(kotoba.reading)]),
+}
+
+class Collection:
+    "Items of one kind, with an index per query parameter, and each item's JSON encoded in advance."
+    def __init__(self, items: list, indexes: dict[str, tuple[Callable[[str], Any], Callable[[Any], list]]],
+                 serialize: Callable[[Any], dict]):
+        self.normalizers = {name: normalize for name, (normalize, _) in indexes.items()}
+        self.indexes = {name: build_index(items, keys) for name, (_, keys) in indexes.items()}
+        self.encoded = [json.dumps(serialize(item), ensure_ascii=False) for item in items]
+
+    def find(self, query: list[tuple[str, str]]) -> list[int]:
+        "Positions of the items matching every (parameter, value) of the query."
+        if not query:
+            raise QueryError(f"Give at least one of: {', '.join(self.indexes)}")
+        matches: Optional[list[int]] = None
+        for name, value in query:
+            if name not in self.indexes:
+                raise QueryError(f"Unknown parameter: {name}")
+            positions = self.indexes[name].get(self.normalizers[name](value), [])
+            if matches is None:
+                matches = positions
+            else:
+                wanted = set(positions)
+                matches = [position for position in matches if position in wanted]
+        return matches
+
+    def lookup(self, query: list[tuple[str, str]], limit: Optional[int] = None) -> str:
+        if limit is not None and limit < 0:
+            raise QueryError(f"Not a valid limit: {limit}")
+        positions = self.find(query)[:limit]
+        return f'{{"count":{len(positions)},"results":[{",".join(self.encoded[position] for position in positions)}]}}'
+
+class ResponseCache:
+    "The encoded responses to the most recent distinct queries, up to `size` of them."
+    def __init__(self, size: int = DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.responses: collections.OrderedDict[Any, bytes] = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key: Any) -> Optional[bytes]:
+        with self.lock:
+            response = self.responses.get(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.responses.move_to_end(key)
+            return response
+
+    def put(self, key: Any, response: bytes) -> None:
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.responses[key] = response
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.size:
+                self.responses.popitem(last=False)
+
+class LookupService:
+    """Kanji and kotoba, indexed in memory, and answered as JSON with the same layout as the JSON dumps. For example:
+
+        /kanji?character=亜
+        /kanji?level=準1&reading=ひいでる
+        /kanji?radical=木&strokes=12
+        /kotoba?reading=アジア
+        /keys?kind=kanji&index=radical
+        /stats
+    """
+    def __init__(self, all_kanji: list[Kanji], all_kotoba: list[Kotoba], cache_size: int = DEFAULT_CACHE_SIZE):
+        self.collections = {
+            "kanji": Collection(all_kanji, KANJI_INDEXES, kanji_as_dict),
+            "kotoba": Collection(all_kotoba, KOTOBA_INDEXES, kotoba_as_dict),
+        }
+        self.cache = ResponseCache(cache_size)
+
+    def respond(self, path: str) -> bytes:
+        "The body of the response to a GET of `path`, e.g. /kanji?character=亜."
+        url = urlsplit(path)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        if url.path == "/stats":
+            return self.stats().encode()
+
+        key = (url.path, tuple(sorted(query)))
+        response = self.cache.get(key)
+        if response is None:
+            response = self.answer(url.path.strip("/"), query).encode()
+            self.cache.put(key, response)
+        return response
+
+    def answer(self, endpoint: str, query: list[tuple[str, str]]) -> str:
+        if endpoint == "keys":
+            parameters = dict(query)
+            collection = self.collections.get(parameters.get("kind", ""))
+            if collection is None or parameters.get("index") not in collection.indexes:
+                raise QueryError("Give a kind (kanji or kotoba) and one of its indexes")
+            # As they would be given in a query, e.g. levels as 準1 rather than as their number
+            return json.dumps([str(key) for key in collection.indexes[parameters["index"]]], ensure_ascii=False)
+        if endpoint not in self.collections:
+            raise UnknownEndpoint(endpoint)
+        limit = [normalize_int(value) for name, value in query if name == "limit"]
+        return self.collections[endpoint].lookup([(name, value) for name, value in query if name != "limit"],
+                                                 limit[-1] if limit else None)
+
+    def stats(self) -> str:
+        return json.dumps({
+            "kanji": len(self.collections["kanji"].encoded),
+            "kotoba": len(self.collections["kotoba"].encoded),
+            "cache": {"size": len(self.cache.responses), "hits": self.cache.hits, "misses": self.cache.misses},
+        })
+
+class LookupRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive between requests
+    service: LookupService
+
+    def do_GET(self):
+        try:
+            # The request line is decoded as Latin-1, but clients that don't percent-encode paths send them as UTF-8
+            path = self.path.encode("iso-8859-1").decode("utf-8", errors="replace")
+            body, status = self.service.respond(path), 200
+        except QueryError as e:
+            body, status = json.dumps({"error": str(e)}).encode(), 400
+        except UnknownEndpoint:
+            body, status = json.dumps({"error": f"Not found: {self.path}"}).encode(), 404
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        pass  # One line per request would cost more than most look-ups
+
+def serve(service: LookupService, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+    handler = type("BoundLookupRequestHandler", (LookupRequestHandler,), {"service": service})
+    with ThreadingHTTPServer((host, port), handler) as server:
+        server.daemon_threads = True
+        print(f"Serving look-ups on http://{host}:{port}/", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+def main():
+    from kanken_processor import parse_data_cached
+
+    cli_parser = argparse.ArgumentParser(
+        prog="lookup-server",
+        description="Program that serves look-ups of the collated kanji and kotoba over HTTP, as JSON",
+    )
+    cli_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    cli_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    cli_parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, dest="cache_size",
+                            help=f"number of responses to keep cached (default: {DEFAULT_CACHE_SIZE})")
+    cli_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                            help="number of processes to parse changed pages with (default: one per CPU core)")
+    cli_parser.add_argument("--engine", choices=["bs4", "fast"], default="bs4",
+                            help="extraction engine to parse changed pages with (default: bs4)")
+    args = cli_parser.parse_args()
+
+    all_kanji, all_kotoba = parse_data_cached(args.jobs, args.engine)
+    service = LookupService(list(all_kanji), list(all_kotoba), args.cache_size)
+    serve(service, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import sys
+from typing import Callable, Optional
+
+import bs4
+import regex as re
+
+# Bump whenever the regions kept by the extractors below change, so that older fragments can be found and re-stripped
+FRAGMENT_VERSION = 1
+FRAGMENT_MARKER_PATTERN = re.compile(r"^<!-- kanjipedia-fragment v(\d+) -->\n")
+LEVEL_ALT_PATTERN = re.compile(r"^準?\d{1,2}級$")
+STROKE_COUNT_PATTERN = re.compile(r"画数：")
+ADDED_STROKE_COUNT_PATTERN = re.compile(r"部首内画数")
+CHROME_TAGS = ("script", "style", "noscript", "iframe")
+
+class FragmentError(Exception):
+    pass
+
+def fragment_marker(version: int = FRAGMENT_VERSION) -> str:
+    return f"<!-- kanjipedia-fragment v{version} -->\n"
+
+def fragment_version(page: str) -> Optional[int]:
+    "The extractor version a page was stripped with, or None if it is a full page."
+    m = FRAGMENT_MARKER_PATTERN.match(page)
+    return int(m.group(1)) if m else None
+
+def kanji_page_anchors(parser: bs4.BeautifulSoup) -> list[Optional[bs4.Tag]]:
+    "Everything `parse_single_kanji` reads, directly or through a regex over the raw page."
+    on_icon = parser.find("img", src="/common/images/icon_on.png")
+    kun_icon = parser.find("img", src="/common/images/icon_kun.png")
+    bushu = parser.find("p", attrs={"class": "kanjiBushu"})
+    stroke_count = parser.find(string=STROKE_COUNT_PATTERN)
+    added_stroke_count = parser.find(string=ADDED_STROKE_COUNT_PATTERN)
+    anchors = [
+        parser.find(id="kanjiOyaji"),
+        parser.find("img", alt=LEVEL_ALT_PATTERN),
+        on_icon and on_icon.find_next("p", attrs={"class": "onkunYomi"}),
+        kun_icon and kun_icon.find_next("p", attrs={"class": "onkunYomi"}),
+        bushu and bushu.find_next("img"),
+        stroke_count and stroke_count.parent,
+        added_stroke_count and added_stroke_count.parent,
+        parser.find(id="kanjiRightSection"),
+    ]
+    # Optional parts of the page
+    if (kokuji := parser.find("img", src="/common/images/icon_kokuji.gif")):
+        anchors.append(kokuji)
+    if (origin_head := parser.find(href="https://promo.kadokawa.co.jp/shinjigen/")):
+        anchors.append(origin_head.find_next("p") or origin_head)
+    return anchors
+
+def kotoba_page_anchors(parser: bs4.BeautifulSoup) -> list[Optional[bs4.Tag]]:
+    "Everything `parse_single_kotoba` and `compile_yojijukugo` read."
+    headline_div = parser.find("div", id="kotobaArea")
+    word = headline_div and headline_div.find_next("p")
+    return [
+        headline_div,
+        word,
+        word and word.find_next("p"),
+        parser.find("div", id="kotobaExplanationSection"),
+    ]
+
+def lowest_common_ancestor(tags: list[bs4.Tag]) -> bs4.Tag:
+    common = [tags[0], *tags[0].parents]
+    for tag in tags[1:]:
+        lineage = {id(ancestor) for ancestor in (tag, *tag.parents)}
+        common = [ancestor for ancestor in common if id(ancestor) in lineage]
+    return common[0]
+
+def source_offset(page: str, tag: bs4.Tag) -> int:
+    line_starts = [0, *(m.end() for m in re.finditer("\n", page))]
+    return line_starts[tag.sourceline - 1] + tag.sourcepos
+
+def raw_span(page: str, tag: bs4.Tag) -> tuple[int, int]:
+    """The (start, end) offsets of `tag` in the original page source, end tag included. The raw source is sliced rather
+    than re-serialised by bs4, as the collator runs regexes over it that depend on its exact formatting.
+    """
+    start = source_offset(page, tag)
+    depth = 0
+    for m in re.finditer(rf"<(/?){tag.name}\b[^>]*?(/?)>", page[start:], flags=re.IGNORECASE):
+        if m.group(1):
+            depth -= 1
+        elif not m.group(2):
+            depth += 1
+        if depth == 0:
+            return start, start + m.end()
+    return start, len(page)
+
+def strip_page(page: str, find_anchors: Callable[[bs4.BeautifulSoup], list[Optional[bs4.Tag]]]) -> str:
+    """Keep only the smallest element that encloses every region the collator reads, minus scripts and other chrome
+    that lie outside those regions. Relative order is preserved, so `find_next` and regex look-ups behave as on the
+    full page.
+    """
+    if fragment_version(page) is not None:
+        page = FRAGMENT_MARKER_PATTERN.sub("", page)
+    parser = bs4.BeautifulSoup(page, "html.parser")
+    anchors = find_anchors(parser)
+    if not all(anchors):
+        raise FragmentError("page is missing regions that the collator needs")
+
+    container = lowest_common_ancestor(anchors)
+    if isinstance(container, bs4.BeautifulSoup):
+        start, end = 0, len(page)
+    else:
+        start, end = raw_span(page, container)
+
+    anchor_ids = {id(anchor) for anchor in anchors}
+    removed_spans = []
+    for chrome in container.find_all(CHROME_TAGS):
+        if not any(id(ancestor) in anchor_ids for ancestor in chrome.parents):
+            removed_spans.append(raw_span(page, chrome))
+
+    fragment = []
+    position = start
+    for removed_start, removed_end in sorted(removed_spans):
+        if removed_start >= position:
+            fragment.append(page[position:removed_start])
+            position = removed_end
+    fragment.append(page[position:end])
+    return fragment_marker() + "".join(fragment)
+
+def strip_kanji_page(page: str) -> str:
+    return strip_page(page, kanji_page_anchors)
+
+def strip_kotoba_page(page: str) -> str:
+    return strip_page(page, kotoba_page_anchors)
+
+# Page kinds (as in the pack store) that can be stored as fragments
+STRIPPERS: dict[str, Callable[[str], str]] = {
+    "kanji": strip_kanji_page,
+    "kotoba": strip_kotoba_page,
+}
+
+def restrip(kind: str, *, verify: bool = False) -> None:
+    """Strip every page of `kind` in the pack store that is a full page or a fragment from an older extractor version.
+    Pages the extractor cannot handle (e.g. an old fragment lacking a region added since) are queued in the crawl frontier
+    to be downloaded again. With `verify`, each new fragment must parse to the same object as the page it replaces. The
+    pack is compacted afterwards, so that the pages replaced no longer take up space.
+    """
+    from corpus_pack import open_pack_store
+    from crawl_frontier import Frontier
+
+    if verify:
+        import kanjipedia_collator
+        parse = {"kanji": kanjipedia_collator.parse_single_kanji, "kotoba": kanjipedia_collator.parse_single_kotoba}[kind]
+
+    pack = open_pack_store()
+    failed = []
+    for name, data in pack.items(kind):
+        page = data.decode()
+        if fragment_version(page) == FRAGMENT_VERSION:
+            continue
+        try:
+            fragment = STRIPPERS[kind](page)
+        except FragmentError:
+            failed.append(name)
+            continue
+        if verify and parse(fragment) != parse(page):
+            print(f"Fragment of {kind} {name} does not parse like the original; keeping the original", file=sys.stderr)
+            continue
+        pack.put(kind, name, fragment.encode(), commit=False)
+    pack.commit()
+
+    # The full pages are still in the segments until they're rewritten without them
+    before, after = pack.compact()
+    print(f"Compacted the pack from {before / 1024 / 1024:.1f} MiB to {after / 1024 / 1024:.1f} MiB", file=sys.stderr)
+
+    if failed:
+        print(f"{len(failed)} {kind} page(s) could not be stripped, and have been queued to be downloaded again:", file=sys.stderr)
+        print("\n".join(failed), file=sys.stderr)
+        frontier = Frontier()
+        for name in failed:
+            frontier.mark_pending(kind, name)
+
+def main():
+    cli_parser = argparse.ArgumentParser(
+        prog="page-fragments",
+        description="Program that strips stored Kanjipedia pages down to the fragments the collator reads",
+    )
+    cli_parser.add_argument("kind", choices=list(STRIPPERS))
+    cli_parser.add_argument("--verify", action="store_true", help="check that every fragment parses like its original")
+    args = cli_parser.parse_args()
+    restrip(args.kind, verify=args.verify)
+
+if __name__ == "__main__":
+    main()
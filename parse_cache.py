@@ -0,0 +1,52 @@
+import os
+import pickle
+import sqlite3
+from typing import Iterable
+
+PARSE_CACHE_PATH = "build/cache/parse_cache.sqlite3"
+
+class ParseCache:
+    """Parsed pages, keyed by (kind, name). Each entry remembers the hash of the page it was parsed from and the
+    `version` of the parsers that parsed it, and is only reused while both still match, so that only new or changed
+    pages ever need parsing again.
+    """
+    def __init__(self, version: str, path: str = PARSE_CACHE_PATH):
+        self.version = version
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS parsed (
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (kind, name)
+            )
+        """)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def load(self, kind: str, hashes: dict[str, str]) -> dict[str, object]:
+        "The cached results for those of the given pages (as a name -> content hash mapping) that are up to date."
+        rows = self.connection.execute(
+            "SELECT name, content_hash, data FROM parsed WHERE kind = ? AND version = ?", (kind, self.version)
+        )
+        return {name: pickle.loads(data) for name, content_hash, data in rows if hashes.get(name) == content_hash}
+
+    def put(self, kind: str, name: str, content_hash: str, result: object) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO parsed (kind, name, content_hash, version, data) VALUES (?, ?, ?, ?, ?)",
+            (kind, name, content_hash, self.version, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+
+    def prune(self, kind: str, names: Iterable[str]) -> int:
+        "Drop the results for pages of `kind` that are no longer among `names`. Returns how many were dropped."
+        keep = set(names)
+        removed = [(kind, name) for (name,) in self.connection.execute("SELECT name FROM parsed WHERE kind = ?", (kind,)) if name not in keep]
+        self.connection.executemany("DELETE FROM parsed WHERE kind = ? AND name = ?", removed)
+        return len(removed)
+
+    def commit(self) -> None:
+        self.connection.commit()
@@ -0,0 +1,54 @@
+import sqlite3
+from typing import Optional
+
+from supplementary.pronunciation.accent_tsv_to_json import normalize_reading, normalize_word, read_accent_rows
+from supplementary_bundle import SupplementaryBundle
+
+def build_pitch_accent_table(connection: sqlite3.Connection, name: str, path: Optional[str]) -> None:
+    """One row per distinct (word, reading) of the accent TSV, with its accents as a comma-separated string. Where a
+    (word, reading) pair is listed more than once, the last row wins; `line` keeps each row's position in the file for
+    look-ups by word alone, which take the last row listed for the word.
+    """
+    connection.execute(f"""
+        CREATE TABLE "{name}" (
+            word TEXT NOT NULL,
+            reading TEXT NOT NULL,
+            line INTEGER NOT NULL,
+            accent TEXT NOT NULL,
+            PRIMARY KEY (word, reading)
+        ) WITHOUT ROWID
+    """)
+    if path is None:
+        return
+    connection.executemany(
+        f'INSERT OR REPLACE INTO "{name}" (word, reading, line, accent) VALUES (?, ?, ?, ?)',
+        ((word, reading, line, ",".join(accent)) for line, (word, reading, accent) in enumerate(read_accent_rows(path)))
+    )
+
+class PitchAccentIndex:
+    "Pitch accents by (word, reading), read from the supplementary bundle. Words and readings are normalised as in the TSV."
+    def __init__(self, bundle: SupplementaryBundle, name: str):
+        self.bundle = bundle
+        self.name = name
+
+    def get(self, word: str, reading: Optional[str] = None) -> list[str]:
+        """The accents of `word` when read as `reading`. If the word isn't listed with that reading (or no reading is
+        given), those of the last reading listed for the word are used instead. Unknown words have no accents.
+        """
+        connection = self.bundle.connection()
+        word = normalize_word(word)
+        if reading is not None:
+            row = connection.execute(
+                f'SELECT accent FROM "{self.name}" WHERE word = ? AND reading = ?', (word, normalize_reading(reading))
+            ).fetchone()
+            if row:
+                return row[0].split(",")
+        row = connection.execute(
+            f'SELECT accent FROM "{self.name}" WHERE word = ? ORDER BY line DESC LIMIT 1', (word,)
+        ).fetchone()
+        return row[0].split(",") if row else []
+
+    def __contains__(self, word: str) -> bool:
+        return self.bundle.connection().execute(
+            f'SELECT 1 FROM "{self.name}" WHERE word = ? LIMIT 1', (normalize_word(word),)
+        ).fetchone() is not None
@@ -0,0 +1,154 @@
+import bisect
+import contextlib
+import datetime
+import json
+import os
+import resource
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional
+
+PROFILE_DIRECTORY = "build/profile"
+# Upper bounds of the per-page parse time histogram's buckets, in milliseconds; the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+@dataclass
+class StageRecord:
+    name: str
+    wall_seconds: float
+    cpu_seconds: float  # Of this process, plus that of any child processes that finished during the stage
+    peak_memory: Optional[int]  # Bytes allocated by Python at the stage's peak, as traced; None if not traced
+    depth: int  # How many stages this one is nested in
+
+@dataclass
+class _OpenStage:
+    name: str
+    wall_start: float
+    cpu_start: float
+    peak: int = 0  # Highest traced memory seen so far, including that of nested stages
+    record_index: int = 0
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class Profiler:
+    """Records the wall time, CPU time and peak memory of each stage of a run, and the time taken to parse each page.
+    A disabled profiler records nothing, and costs next to nothing, so stages can be marked unconditionally.
+
+    Memory is traced with tracemalloc, which only sees this process (not parse workers) and slows allocation-heavy code
+    down noticeably, so stage timings of a profiled run are best compared with other profiled runs. Stages may be nested,
+    but not run concurrently on several threads, as the traced peak is shared by the whole process.
+    """
+    def __init__(self, enabled: bool = False, trace_memory: bool = True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.stages: list[StageRecord] = []
+        self.page_times: dict[str, list[tuple[str, float]]] = {}  # Per kind: (page name, seconds)
+        self._open: list[_OpenStage] = []
+        self._started = datetime.datetime.now()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        if self.trace_memory:
+            # The traced peak is reset for each stage, so the enclosing stage keeps hold of its own peak so far
+            current, peak = tracemalloc.get_traced_memory()
+            if self._open:
+                self._open[-1].peak = max(self._open[-1].peak, peak)
+            tracemalloc.reset_peak()
+        opened = _OpenStage(name, time.perf_counter(), time.process_time() + _children_cpu(), record_index=len(self.stages))
+        self._open.append(opened)
+        self.stages.append(StageRecord(name, 0.0, 0.0, None, len(self._open) - 1))  # Filled in once the stage ends, in start order
+        try:
+            yield
+        finally:
+            self._open.pop()
+            peak = None
+            if self.trace_memory:
+                peak = max(opened.peak, tracemalloc.get_traced_memory()[1])
+                if self._open:
+                    self._open[-1].peak = max(self._open[-1].peak, peak)
+            record = self.stages[opened.record_index]
+            record.wall_seconds = time.perf_counter() - opened.wall_start
+            record.cpu_seconds = time.process_time() + _children_cpu() - opened.cpu_start
+            record.peak_memory = peak
+
+    def record_page(self, kind: str, name: str, seconds: float) -> None:
+        if self.enabled:
+            self.page_times.setdefault(kind, []).append((name, seconds))
+
+    def page_report(self, slowest: int) -> dict:
+        report = {}
+        for kind, times in self.page_times.items():
+            milliseconds = sorted(seconds * 1000 for _, seconds in times)
+            counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+            for ms in milliseconds:
+                counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+            labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+
+            def percentile(fraction: float) -> float:
+                return milliseconds[min(len(milliseconds) - 1, int(fraction * len(milliseconds)))]
+
+            report[kind] = {
+                "pages": len(milliseconds),
+                "total_ms": sum(milliseconds),
+                "p50_ms": percentile(0.5),
+                "p90_ms": percentile(0.9),
+                "p99_ms": percentile(0.99),
+                "max_ms": milliseconds[-1],
+                "histogram": dict(zip(labels, counts)),
+                "slowest": [
+                    {"name": name, "ms": seconds * 1000}
+                    for name, seconds in sorted(times, key=lambda item: item[1], reverse=True)[:slowest]
+                ],
+            }
+        return report
+
+    def report(self, slowest: int = 20) -> dict:
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return {
+            "started": self._started.isoformat(timespec="seconds"),
+            "memory_traced": self.trace_memory,
+            "stages": [asdict(stage) for stage in self.stages],
+            "pages": self.page_report(slowest),
+            # Kilobytes on Linux (bytes on macOS)
+            "max_rss": {"self": self_usage.ru_maxrss, "largest_child": children_usage.ru_maxrss},
+        }
+
+    def write_report(self, path: Optional[str] = None, slowest: int = 20) -> str:
+        "Write the report as JSON, by default to a timestamped file in PROFILE_DIRECTORY. Returns the path written to."
+        path = path or os.path.join(PROFILE_DIRECTORY, f"report-{self._started:%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, mode="w") as f:
+            json.dump(self.report(slowest), f, indent=4, ensure_ascii=False)
+        return path
+
+    def summary(self) -> str:
+        lines = []
+        for stage in self.stages:
+            memory = f"   peak {stage.peak_memory / 1024 / 1024:8.1f} MiB" if stage.peak_memory is not None else ""
+            lines.append(f"{'  ' * stage.depth}{stage.name:<{32 - 2 * stage.depth}} wall {stage.wall_seconds:8.2f}s   "
+                         f"cpu {stage.cpu_seconds:8.2f}s{memory}")
+        for kind, pages in self.page_report(slowest=3).items():
+            lines.append(f"{kind} pages: {pages['pages']} parsed, p50 {pages['p50_ms']:.2f} ms, p99 {pages['p99_ms']:.2f} ms, "
+                         f"slowest {', '.join(page['name'] for page in pages['slowest'])}")
+        return "\n".join(lines)
+
+_profiler = Profiler()
+
+def profiler() -> Profiler:
+    "The profiler of the current run; disabled unless `enable` has been called."
+    return _profiler
+
+def enable(trace_memory: bool = True) -> Profiler:
+    global _profiler
+    _profiler = Profiler(enabled=True, trace_memory=trace_memory)
+    return _profiler
@@ -0,0 +1,168 @@
+import os
+import sqlite3
+from typing import Iterable
+
+from data_models import Kanji, KankenLevels, Kotoba
+
+SQLITE_PATH = "build/sqlite/kanken.sqlite3"
+
+# The readings of a kanji, as (kind, attribute of Kanji) pairs
+READING_KINDS = [
+    ("on", "on"),
+    ("goon", "goon"),
+    ("kanon", "kanon"),
+    ("kanyoon", "kanyoon"),
+    ("toon", "toon"),
+    ("soon", "soon"),
+    ("kun", "kun"),
+]
+
+SCHEMA = """
+    CREATE TABLE levels (
+        level INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE  -- As printed, e.g. "準1"
+    );
+    CREATE TABLE kanji (
+        id INTEGER PRIMARY KEY,
+        character TEXT NOT NULL,
+        level INTEGER NOT NULL REFERENCES levels (level),
+        is_kokuji INTEGER NOT NULL,
+        radical TEXT NOT NULL,
+        strokes INTEGER NOT NULL,
+        added_strokes INTEGER NOT NULL,
+        glyph_origin_type INTEGER NOT NULL,  -- RikuSho
+        glyph_origin TEXT NOT NULL
+    );
+    CREATE TABLE readings (
+        kanji_id INTEGER NOT NULL REFERENCES kanji (id),
+        kind TEXT NOT NULL,  -- One of READING_KINDS
+        position INTEGER NOT NULL,
+        reading TEXT NOT NULL,  -- Base and okurigana together, e.g. "おもんじる"
+        base TEXT NOT NULL,
+        okurigana TEXT NOT NULL,
+        in_kanken INTEGER NOT NULL,
+        in_wiktionary INTEGER NOT NULL,
+        is_hyougai INTEGER NOT NULL,
+        PRIMARY KEY (kanji_id, kind, position)
+    ) WITHOUT ROWID;
+    CREATE TABLE meanings (
+        id INTEGER PRIMARY KEY,
+        kanji_id INTEGER NOT NULL REFERENCES kanji (id),
+        position INTEGER NOT NULL,
+        qualifier TEXT NOT NULL
+    );
+    CREATE TABLE submeanings (
+        meaning_id INTEGER NOT NULL REFERENCES meanings (id),
+        position INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (meaning_id, position)
+    ) WITHOUT ROWID;
+    CREATE TABLE kotoba (
+        id INTEGER PRIMARY KEY,
+        word TEXT NOT NULL,
+        reading TEXT NOT NULL,
+        pitch_accent TEXT NOT NULL,  -- Comma-separated
+        meaning TEXT NOT NULL,
+        is_jukujikun_ateji INTEGER NOT NULL
+    );
+"""
+
+# Created once the tables are filled, which is much faster than keeping them up to date row by row
+INDEXES = """
+    CREATE INDEX kanji_character ON kanji (character);
+    CREATE INDEX kanji_level ON kanji (level);
+    CREATE INDEX kanji_radical ON kanji (radical, added_strokes);
+    CREATE INDEX kanji_strokes ON kanji (strokes);
+    CREATE INDEX readings_reading ON readings (reading, kind);
+    CREATE INDEX meanings_kanji ON meanings (kanji_id, position);
+    CREATE INDEX kotoba_word ON kotoba (word);
+    CREATE INDEX kotoba_reading ON kotoba (reading);
+
+    -- Japanese isn't split into words by spaces, so each character is indexed as a token of its own (see
+    -- `split_characters`), and a term of any length is searched for as a phrase of its characters (see `search_phrase`),
+    -- e.g. kotoba_search MATCH '"動 語"'. Only the index is kept; the text itself is in the kotoba table.
+    CREATE VIRTUAL TABLE kotoba_search USING fts5(
+        word, reading, meaning, content = '', tokenize = 'unicode61 remove_diacritics 0'
+    );
+    INSERT INTO kotoba_search (rowid, word, reading, meaning)
+    SELECT id, split_characters(word), split_characters(reading), split_characters(meaning) FROM kotoba;
+    ANALYZE;
+"""
+
+def split_characters(text: str) -> str:
+    "The text with every character separated by a space, for each to be a token of the full-text index."
+    return " ".join(text)
+
+def search_phrase(term: str) -> str:
+    "A full-text query for the term as it's written, to be given to MATCH: for 動語, the phrase \"動 語\" (quoted)."
+    return '"' + " ".join(term).replace('"', '""') + '"'
+
+def insert_kanji(connection: sqlite3.Connection, kanji: Kanji) -> None:
+    cursor = connection.execute(
+        "INSERT INTO kanji (character, level, is_kokuji, radical, strokes, added_strokes, glyph_origin_type, glyph_origin) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (kanji.character, int(kanji.level), kanji.is_kokuji, kanji.radical, int(kanji.strokes), int(kanji.added_strokes),
+         int(kanji.glyph_origin.type), str(kanji.glyph_origin))
+    )
+    kanji_id = cursor.lastrowid
+    connection.executemany(
+        "INSERT INTO readings (kanji_id, kind, position, reading, base, okurigana, in_kanken, in_wiktionary, is_hyougai) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (kanji_id, kind, position, reading.reading.base + reading.reading.okurigana, reading.reading.base,
+             reading.reading.okurigana, reading.in_kanken, reading.in_wiktionary, reading.is_hyougai)
+            for kind, attribute in READING_KINDS
+            for position, reading in enumerate(getattr(kanji, attribute))
+        )
+    )
+    for position, meaning in enumerate(kanji.meanings):
+        cursor = connection.execute(
+            "INSERT INTO meanings (kanji_id, position, qualifier) VALUES (?, ?, ?)", (kanji_id, position, meaning.qualifier)
+        )
+        connection.executemany(
+            "INSERT INTO submeanings (meaning_id, position, text) VALUES (?, ?, ?)",
+            ((cursor.lastrowid, position, text) for position, text in enumerate(meaning.submeanings))
+        )
+
+def write_sqlite_database(all_kanji: Iterable[Kanji], all_kotoba: Iterable[Kotoba], path: str = SQLITE_PATH) -> None:
+    """Write the kanji and kotoba into an indexed SQLite database, replacing the previous one in a single step. For
+    example, the 準1級 kanji read as ひいでる:
+
+        SELECT character FROM kanji JOIN levels USING (level) JOIN readings ON readings.kanji_id = kanji.id
+        WHERE levels.name = '準1' AND readings.kind = 'kun' AND readings.reading = 'ひいでる'
+
+    and the kotoba whose meaning mentions 動語, with the query written as `search_phrase` writes it:
+
+        SELECT kotoba.* FROM kotoba_search JOIN kotoba ON kotoba.id = kotoba_search.rowid
+        WHERE kotoba_search MATCH 'meaning: "動 語"' ORDER BY rank
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+    connection = sqlite3.connect(temporary_path)
+    connection.create_function("split_characters", 1, split_characters, deterministic=True)
+    try:
+        # Nothing needs to survive a crash mid-build, as the database only replaces the previous one once complete
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        with connection:
+            connection.executescript(SCHEMA)
+            connection.executemany(
+                "INSERT INTO levels (level, name) VALUES (?, ?)", ((int(level), str(level)) for level in KankenLevels)
+            )
+            for kanji in all_kanji:
+                insert_kanji(connection, kanji)
+            connection.executemany(
+                "INSERT INTO kotoba (word, reading, pitch_accent, meaning, is_jukujikun_ateji) VALUES (?, ?, ?, ?, ?)",
+                ((kotoba.word, kotoba.reading, ",".join(kotoba.pitch_accent_pattern), kotoba.meaning, kotoba.is_jukujikun_ateji)
+                 for kotoba in all_kotoba)
+            )
+            connection.executescript(INDEXES)
+    except BaseException:
+        connection.close()
+        os.remove(temporary_path)
+        raise
+    connection.close()
+    os.replace(temporary_path, path)
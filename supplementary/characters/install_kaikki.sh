@@ -1,2 +1,2 @@
 wget https://kaikki.org/dictionary/Chinese/pos-character/kaikki.org-dictionary-Chinese-by-pos-character.jsonl
-python kaikki_processpr.py
\ No newline at end of file
+python kaikki_processor.py
\ No newline at end of file
@@ -1,16 +1,62 @@
-from collections import defaultdict
+import argparse
 import json
+import os
+import re
+from typing import Iterator
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+KAIKKI_PATH = "kaikki.org-dictionary-Chinese-by-pos-character.jsonl"
+KANKEN_PATH = os.path.join(DIRECTORY, "kanken.json")
+PHONETIC_SERIES_PATH = os.path.join(DIRECTORY, "..", "pronunciation", "phonetic_series", "group.json")
+OUTPUT_PATH = "kanji_etymologies.jsonl"
 
 USEFUL_KEYS = {"etymology_text", "word", "etymology_templates", "redirects"}
 NECESSARY_KEYS = {"etymology_text", "word"}
-out = defaultdict(list)
-with open("kaikki.org-dictionary-Chinese-by-pos-character.jsonl") as f:
-    for line in f:
-        line_json = json.loads(line)
-        char = line_json["word"]
-        if all(key in line_json for key in NECESSARY_KEYS):
-            filtered = {key: value for key, value in line_json.items() if key in USEFUL_KEYS}
-            out[char].append(filtered)
-
-with open("kanji_etymologies.json", "w") as f:
-    f.write(json.dumps(out, ensure_ascii=False, indent=4))
+
+# Every "word" value on a line, nested ones included; if none of them is wanted, the line needn't be decoded at all
+WORD_PATTERN = re.compile(r'"word":\s*"((?:[^"\\]|\\.)*)"')
+
+def kanken_kanji() -> list[str]:
+    with open(KANKEN_PATH) as f:
+        kanji_list = [kanji for level in json.load(f) for kanji in level["kanjiList"]]
+    kanji_list = [kanji[1:-1] if len(kanji) == 3 else kanji for kanji in kanji_list]  # The 3 characters encoded as (填) etc.
+    if malformed := [kanji for kanji in kanji_list if len(kanji) != 1]:
+        raise ValueError(f"Not single characters in {KANKEN_PATH}: {', '.join(malformed)}")
+    return kanji_list
+
+def wanted_characters() -> set[str]:
+    "The Kanken kanji, and every character of the phonetic series, whose etymologies tend to explain each other."
+    characters = set(kanken_kanji())
+    with open(PHONETIC_SERIES_PATH) as f:
+        for phonetic, series in json.load(f).items():
+            characters.add(phonetic)
+            characters.update(series)
+    return characters
+
+def filter_entries(lines: Iterator[str], wanted: set[str]) -> Iterator[dict]:
+    "Yield the useful keys of each entry of the kaikki.org dump whose character is wanted and which has an etymology."
+    for line in lines:
+        if not any(json.loads(f'"{word}"') in wanted for word in WORD_PATTERN.findall(line)):
+            continue
+        entry = json.loads(line)
+        if entry["word"] in wanted and all(key in entry for key in NECESSARY_KEYS):
+            yield {key: value for key, value in entry.items() if key in USEFUL_KEYS}
+
+def main():
+    cli_parser = argparse.ArgumentParser(
+        prog="kaikki-processor",
+        description="Program that extracts the etymologies of the Kanken kanji from the kaikki.org Chinese character dump",
+    )
+    cli_parser.add_argument("input", nargs="?", default=KAIKKI_PATH, help=f"kaikki.org JSONL dump (default: {KAIKKI_PATH})")
+    cli_parser.add_argument("output", nargs="?", default=OUTPUT_PATH, help=f"where to write the etymologies (default: {OUTPUT_PATH})")
+    args = cli_parser.parse_args()
+
+    # One entry per line, in the order of the dump, so that neither the dump nor the output is ever held in memory
+    wanted = wanted_characters()
+    with open(args.input) as f, open(args.output, mode="w") as out:
+        for entry in filter_entries(f, wanted):
+            out.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+            out.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,38 @@
 from collections import defaultdict
 import json
+from typing import Iterator
 from tqdm import tqdm
 from data_models import ReadingRecord
 
+# Fullwidth forms of printable ASCII (！ to ～), which the accent data uses for e.g. digits and Latin letters
+FULLWIDTH_TO_ASCII = {codepoint: codepoint - 0xFEE0 for codepoint in range(0xFF01, 0xFF5F)}
+# Katakana ァ to ヶ, mapped to the matching hiragana
+KATAKANA_TO_HIRAGANA = {codepoint: codepoint - 0x60 for codepoint in range(0x30A1, 0x30F7)}
+
+def normalize_word(word: str) -> str:
+    return word.strip().translate(FULLWIDTH_TO_ASCII)
+
+def normalize_reading(reading: str) -> str:
+    "Readings are compared in hiragana, as some sources give (parts of) them in katakana."
+    return reading.strip().translate(FULLWIDTH_TO_ASCII).translate(KATAKANA_TO_HIRAGANA)
+
+def read_accent_rows(path: str) -> Iterator[tuple[str, str, list[str]]]:
+    "Yield (word, reading, accents) for each row of an accent TSV file, in file order, with the word and reading normalised."
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            word, reading, accent = line.rstrip("\n").split("\t")
+            yield normalize_word(word), normalize_reading(reading), accent.split(",")
+
 def main():
+    "Export the accent data as JSON keyed by word alone, where the last row for each word wins. The collator doesn't use this."
     out: dict[str, ReadingRecord] = defaultdict(ReadingRecord)
-    with open("accents.tsv") as f:
-        for line in tqdm(f):
-            word, reading, accent = line[:-1].split("\t")
-            accent = accent.split(",")
-            out[word] = ReadingRecord(reading=reading, accent=accent)
+    for word, reading, accent in tqdm(read_accent_rows("accents.tsv")):
+        out[word] = ReadingRecord(reading=reading, accent=accent)
 
     with open("accents.json", mode="w") as f:
         json.dump(out, f, ensure_ascii=False)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
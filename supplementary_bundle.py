@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import sys
+from collections.abc import Mapping
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+BUNDLE_PATH = "build/cache/supplementary.sqlite3"
+BUNDLE_FORMAT_VERSION = 2  # Bump whenever the layout of the bundle changes, so that existing bundles are rebuilt
+
+def file_hash(path: str) -> Optional[str]:
+    "SHA-256 of a file's contents, or None if it doesn't exist."
+    digest = hashlib.sha256()
+    try:
+        with open(path, mode="rb") as f:
+            while (block := f.read(1024 * 1024)):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+def file_stat(path: str) -> tuple[int, int]:
+    "(size, modification time) of a file, or (-1, -1) if it doesn't exist."
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return -1, -1
+    return stat.st_size, stat.st_mtime_ns
+
+# Creates a table of the bundle (connection, table name) and fills it from a source file, if there is one
+TableBuilder = Callable[[sqlite3.Connection, str, Optional[str]], None]
+
+def build_json_table(connection: sqlite3.Connection, name: str, path: Optional[str]) -> None:
+    "A key/value table from a JSON object, with each value stored as compact JSON."
+    connection.execute(f'CREATE TABLE "{name}" (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+    if path is None:
+        return
+    with open(path) as f:
+        table: dict[str, Any] = json.load(f)
+    connection.executemany(
+        f'INSERT INTO "{name}" (key, value) VALUES (?, ?)',
+        ((key, json.dumps(value, ensure_ascii=False, separators=(",", ":"))) for key, value in table.items())
+    )
+
+def build_jsonl_table(connection: sqlite3.Connection, name: str, path: Optional[str]) -> None:
+    """A key/value table from a JSON Lines file of records, keyed by each record's `word`, with the records of each word
+    stored as a compact JSON list in file order. The file is streamed, and sorted in SQLite rather than in memory; the
+    records are then joined one word at a time, as SQLite doesn't guarantee the order that group_concat joins them in.
+    """
+    connection.execute(f'CREATE TABLE "{name}" (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+    if path is None:
+        return
+    connection.execute("CREATE TEMP TABLE records (key TEXT NOT NULL, line INTEGER NOT NULL, value TEXT NOT NULL)")
+    with open(path) as f:
+        records = (json.loads(line) for line in f if line.strip())
+        connection.executemany(
+            "INSERT INTO records (key, line, value) VALUES (?, ?, ?)",
+            ((record["word"], line, json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+             for line, record in enumerate(records))
+        )
+    connection.execute("CREATE INDEX temp.records_order ON records (key, line)")
+    rows = connection.execute("SELECT key, value FROM records ORDER BY key, line")
+    connection.executemany(
+        f'INSERT INTO "{name}" (key, value) VALUES (?, ?)',
+        ((key, "[" + ",".join(value for _, value in group) + "]") for key, group in itertools.groupby(rows, key=lambda row: row[0]))
+    )
+    connection.execute("DROP TABLE records")
+
+class BundleTable(Mapping):
+    "Read-only mapping view of one table of the bundle. Values are decoded on every look-up, and never held in memory."
+    def __init__(self, bundle: "SupplementaryBundle", name: str):
+        self.bundle = bundle
+        self.name = name
+
+    def __getitem__(self, key: str) -> Any:
+        row = self.bundle.connection().execute(f'SELECT value FROM "{self.name}" WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __contains__(self, key: object) -> bool:
+        return self.bundle.connection().execute(f'SELECT 1 FROM "{self.name}" WHERE key = ?', (key,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for (key,) in self.bundle.connection().execute(f'SELECT key FROM "{self.name}" ORDER BY key'))
+
+    def __len__(self) -> int:
+        (count,) = self.bundle.connection().execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()
+        return count
+
+class SupplementaryBundle:
+    """The supplementary tables, compiled into one indexed SQLite file so that the collator can look entries up without
+    loading whole tables into memory. `sources` maps each table name to the file it is compiled from, by default a JSON
+    object turned into a key/value table (see `build_json_table`), or else by the table's entry in `builders`. Tables in
+    `optional` are left empty if their file is missing. The bundle is rebuilt automatically whenever a source file's
+    content changes.
+    """
+    def __init__(
+        self, sources: dict[str, str], optional: Iterable[str] = (), builders: Optional[dict[str, TableBuilder]] = None,
+        path: str = BUNDLE_PATH
+    ):
+        self.sources = sources
+        self.optional = set(optional)
+        self.builders = builders or {}
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+
+    def connection(self) -> sqlite3.Connection:
+        # SQLite connections must not be carried across fork(), so worker processes each open their own
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def table(self, name: str) -> BundleTable:
+        if name not in self.sources:
+            raise KeyError(name)
+        return BundleTable(self, name)
+
+    @property
+    def fingerprint(self) -> str:
+        "Identifies the content of every source file, e.g. for invalidating results derived from the bundle."
+        (fingerprint,) = self.connection().execute("SELECT value FROM info WHERE key = 'fingerprint'").fetchone()
+        return fingerprint
+
+    def is_fresh(self) -> bool:
+        """Whether the bundle exists and was built from the current source files. Sources are compared by size and
+        modification time first, and only hashed if those differ, so that touching a file doesn't force a rebuild.
+        """
+        if not os.path.exists(self.path):
+            return False
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                return self._sources_match(connection)
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            connection.close()
+
+    def _sources_match(self, connection: sqlite3.Connection) -> bool:
+        (format_version,) = connection.execute("SELECT value FROM info WHERE key = 'format_version'").fetchone()
+        recorded = {
+            name: (path, size, mtime, content_hash)
+            for name, path, size, mtime, content_hash in connection.execute("SELECT name, path, size, mtime, hash FROM sources")
+        }
+        if format_version != str(BUNDLE_FORMAT_VERSION) or recorded.keys() != self.sources.keys():
+            return False
+
+        for name, path in self.sources.items():
+            recorded_path, size, mtime, content_hash = recorded[name]
+            if recorded_path != path:
+                return False
+            if file_stat(path) == (size, mtime):
+                continue
+            if file_hash(path) != content_hash:
+                return False
+            connection.execute("UPDATE sources SET size = ?, mtime = ? WHERE name = ?", (*file_stat(path), name))
+        return True
+
+    def build(self) -> None:
+        "Compile every source file into a new bundle, replacing the current one in a single step."
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+        connection = sqlite3.connect(temporary_path)
+        try:
+            self._build_tables(connection)
+        except BaseException:
+            connection.close()
+            os.remove(temporary_path)
+            raise
+        connection.close()
+        os.replace(temporary_path, self.path)
+        self._connection = None
+
+    def _build_tables(self, connection: sqlite3.Connection) -> None:
+        digest = hashlib.sha256(str(BUNDLE_FORMAT_VERSION).encode())
+        with connection:
+            connection.executescript("""
+                CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE sources (name TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, mtime INTEGER, hash TEXT);
+            """)
+            for name, path in sorted(self.sources.items()):
+                size, mtime = file_stat(path)
+                content_hash = file_hash(path)
+                if content_hash is None and name not in self.optional:
+                    raise FileNotFoundError(f"Supplementary data file {path} is missing")
+                if content_hash is not None:
+                    print(f"Bundling {path}...", file=sys.stderr)
+
+                self.builders.get(name, build_json_table)(connection, name, path if content_hash is not None else None)
+                connection.execute("INSERT INTO sources VALUES (?, ?, ?, ?, ?)", (name, path, size, mtime, content_hash))
+                digest.update(f"{name}\0{path}\0{content_hash}\0".encode())
+
+            connection.executemany("INSERT INTO info (key, value) VALUES (?, ?)", [
+                ("format_version", str(BUNDLE_FORMAT_VERSION)),
+                ("fingerprint", digest.hexdigest()),
+            ])
+
+    def ensure(self) -> None:
+        "Build the bundle if it is missing or out of date."
+        if not self.is_fresh():
+            self.build()
+
+def main():
+    import global_data
+
+    cli_parser = argparse.ArgumentParser(
+        prog="supplementary-bundle",
+        description="Program that compiles the supplementary data into an indexed bundle for the collator",
+    )
+    subparsers = cli_parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("build", help="rebuild the bundle, even if it is up to date")
+    subparsers.add_parser("stats", help="show how many entries each table has, building the bundle first if needed")
+    args = cli_parser.parse_args()
+
+    bundle = SupplementaryBundle(global_data.TABLE_PATHS, global_data.OPTIONAL_TABLES, global_data.TABLE_BUILDERS)
+    if args.action == "build":
+        bundle.build()
+    elif args.action == "stats":
+        bundle.ensure()
+        for name in sorted(bundle.sources):
+            print(name, len(bundle.table(name)), sep="\t")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Helpers shared by the tests: the benchmark fixture pages, and a supplementary bundle of their own, so that running the
+tests leaves nothing behind in build/.
+"""
+import glob
+import os
+import sys
+import tempfile
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIRECTORY = os.path.join(REPOSITORY, "benchmarks", "fixtures")
+
+sys.path.insert(0, REPOSITORY)
+
+import global_data
+from kotoba_store import KOTOBA_KIND
+from supplementary_bundle import SupplementaryBundle
+
+KINDS = {"kanji": "kanji", "kotoba": KOTOBA_KIND}  # Fixture directory: page kind, as in benchmarks/pipeline.py
+
+def fixture_pages() -> dict[str, list[tuple[str, str]]]:
+    "(name, page) pairs of the fixture pages, by kind."
+    pages = {}
+    for directory, kind in KINDS.items():
+        pages[kind] = []
+        for path in sorted(glob.glob(os.path.join(FIXTURES_DIRECTORY, directory, "*.html"))):
+            with open(path) as f:
+                pages[kind].append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    return pages
+
+def use_temporary_bundle() -> tempfile.TemporaryDirectory:
+    """Have global_data read the supplementary tables from a bundle built in a temporary directory, which is removed
+    along with the returned directory.
+    """
+    directory = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(REPOSITORY)  # The tables' source files are given relative to the repository
+    try:
+        bundle = SupplementaryBundle(global_data.TABLE_PATHS, global_data.OPTIONAL_TABLES, global_data.TABLE_BUILDERS,
+                                     path=os.path.join(directory.name, "supplementary.sqlite3"))
+        bundle.ensure()
+    finally:
+        os.chdir(cwd)
+    global_data._bundle = bundle
+    return directory
@@ -0,0 +1,100 @@
+"""Tests that apkg_writer writes the same collection as genanki, run from the repository root with
+
+    python -m unittest discover tests
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+
+import genanki
+
+import support
+import apkg_writer
+import kanjipedia_collator
+
+TIMESTAMP = 1700000000.25
+
+def model(model_id: int, name: str, field_count: int, templates: list[tuple[str, str]]) -> genanki.Model:
+    return genanki.Model(
+        model_id, name,
+        fields=[{"name": f"Field {i}"} for i in range(field_count)],
+        templates=[{"name": f"Card {i}", "qfmt": question, "afmt": "{{FrontSide}}<hr id=answer>" + question}
+                   for i, (question, _) in enumerate(templates)],
+        css=".card { font-size: 20px; }",
+    )
+
+def collection_rows(package_path: str, directory: str) -> dict[str, list[tuple]]:
+    "Every row of the tables that Anki imports, in rowid order."
+    with zipfile.ZipFile(package_path) as package:
+        database_path = package.extract("collection.anki2", directory)
+    connection = sqlite3.connect(database_path)
+    try:
+        return {table: connection.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+                for table in ("col", "notes", "cards", "revlog")}
+    finally:
+        connection.close()
+
+class WritePackageTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.bundle_directory = support.use_temporary_bundle()
+        pages = support.fixture_pages()
+        cls.notes = {
+            kind: [kanjipedia_collator.PAGE_PARSERS[kind](page).as_tuple() for _, page in kind_pages]
+            for kind, kind_pages in pages.items()
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bundle_directory.cleanup()
+
+    def decks(self) -> list[tuple[genanki.Deck, genanki.Model, list[tuple[str, ...]]]]:
+        kanji_fields, kotoba_fields = self.notes["kanji"], self.notes[kanjipedia_collator.KOTOBA_KIND]
+        return [
+            (genanki.Deck(1228308188, "漢検::漢字"),
+             model(1976405439, "Kanji", len(kanji_fields[0]), [("{{Field 0}}", "")]), kanji_fields),
+            # A second card only for the notes that have a meaning, so that card requirements are compared too
+            (genanki.Deck(1095745966, "漢検::言葉"),
+             model(1616488250, "Kotoba", len(kotoba_fields[0]), [("{{Field 0}}", ""), ("{{#Field 3}}{{Field 3}}{{/Field 3}}", "")]),
+             kotoba_fields + [(kotoba_fields[0][0] + "々", "", "", "", "0")]),
+        ]
+
+    def test_same_collection_as_genanki(self):
+        with tempfile.TemporaryDirectory() as directory:
+            genanki_decks = []
+            for deck, deck_model, notes in self.decks():
+                for fields in notes:
+                    deck.add_note(genanki.Note(deck_model, fields=list(fields), guid=apkg_writer.note_guid(fields[0])))
+                genanki_decks.append(deck)
+            genanki.Package(genanki_decks).write_to_file(os.path.join(directory, "genanki.apkg"), timestamp=TIMESTAMP)
+
+            written = apkg_writer.write_package(os.path.join(directory, "direct.apkg"), [
+                apkg_writer.DeckContents(deck, deck_model, [(apkg_writer.note_guid(fields[0]), fields) for fields in notes])
+                for deck, deck_model, notes in self.decks()
+            ], TIMESTAMP)
+
+            expected = collection_rows(os.path.join(directory, "genanki.apkg"), os.path.join(directory, "genanki"))
+            actual = collection_rows(os.path.join(directory, "direct.apkg"), os.path.join(directory, "direct"))
+
+        self.assertEqual(written, sum(len(notes) for _, _, notes in self.decks()))
+        self.assertEqual(actual["col"], expected["col"])
+        self.assertEqual(actual["cards"], expected["cards"])
+        self.assertEqual(actual["revlog"], expected["revlog"])
+        self.assertEqual(len(actual["notes"]), len(expected["notes"]))
+        csum = 8  # Column of the sort field checksum, which genanki leaves as 0
+        for actual_note, expected_note in zip(actual["notes"], expected["notes"]):
+            self.assertEqual(actual_note[:csum] + actual_note[csum + 1:], expected_note[:csum] + expected_note[csum + 1:])
+            sort_field = actual_note[7]
+            self.assertNotIn("<", sort_field)  # So that Anki checksums it as it is
+            self.assertEqual(actual_note[csum], int(hashlib.sha1(sort_field.encode()).hexdigest()[:8], 16))
+
+    def test_field_checksum_strips_html(self):
+        # As Anki's stripHTMLMedia: tags are dropped, images are replaced by their file name, and entities are decoded
+        self.assertEqual(apkg_writer.field_checksum('<b>亜</b>&amp;<img src="a.png">'),
+                         int(hashlib.sha1("亜& a.png ".encode()).hexdigest()[:8], 16))
+
+if __name__ == "__main__":
+    unittest.main()
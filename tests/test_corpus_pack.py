@@ -0,0 +1,93 @@
+"""Tests of the pack store of the raw corpus, run from the repository root with
+
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import support
+import corpus_pack
+from corpus_pack import PackStore
+
+class PackStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.pack = PackStore(os.path.join(self.directory, "pack"))
+        self.addCleanup(self.pack.close)
+
+    def blob_count(self) -> int:
+        (count,) = self.pack.connection.execute("SELECT COUNT(*) FROM blobs").fetchone()
+        return count
+
+    def test_round_trip(self):
+        pages = {f"{i:07}": f"<html>{i}</html>".encode() * (i + 1) for i in range(5)}
+        for name, data in reversed(pages.items()):
+            self.pack.put("kanji", name, data)
+        self.assertEqual(self.pack.get("kanji", "0000003"), pages["0000003"])
+        self.assertIsNone(self.pack.get("kanji", "missing"))
+        self.assertIsNone(self.pack.get("kotoba", "0000003"))
+        self.assertEqual(self.pack.names("kanji"), sorted(pages))
+        self.assertEqual(dict(self.pack.items("kanji")), pages)
+        self.assertEqual([name for name, _ in self.pack.items("kanji", by_name=True)], sorted(pages))
+        self.assertEqual(dict(self.pack.items("kanji", ["0000001", "0000004"])),
+                         {name: pages[name] for name in ("0000001", "0000004")})
+
+    def test_identical_content_is_stored_once(self):
+        first = self.pack.put("kanji", "a", b"<html>same</html>")
+        second = self.pack.put("kotoba", "b", b"<html>same</html>")
+        self.assertEqual(first, second)
+        self.assertEqual(self.blob_count(), 1)
+        self.assertEqual(self.pack.get("kotoba", "b"), b"<html>same</html>")
+        size = sum(map(os.path.getsize, self.pack.segments_on_disk().values()))
+        self.pack.put("kanji", "c", b"<html>same</html>")
+        self.assertEqual(sum(map(os.path.getsize, self.pack.segments_on_disk().values())), size)
+
+    def test_compact_drops_replaced_blobs_and_unused_segments(self):
+        with mock.patch.object(corpus_pack, "SEGMENT_SIZE", 64):  # A segment per page or two
+            for i in range(6):
+                self.pack.put("kanji", str(i), f"<html>old page {i} {'x' * 100}</html>".encode())
+            for i in range(3):
+                self.pack.put("kanji", str(i), f"<html>new page {i}</html>".encode())
+            old_segments = set(self.pack.segments_on_disk())
+            before, after = self.pack.compact()
+
+        self.assertLess(after, before)
+        self.assertEqual(self.blob_count(), 6)
+        for i in range(6):
+            self.assertEqual(self.pack.get("kanji", str(i)),
+                             f"<html>{'new' if i < 3 else 'old'} page {i}{'' if i < 3 else ' ' + 'x' * 100}</html>".encode())
+        in_use = {segment for (segment,) in self.pack.connection.execute("SELECT DISTINCT segment FROM blobs")}
+        self.assertEqual(set(self.pack.segments_on_disk()), in_use)
+        self.assertFalse(old_segments & in_use)  # Everything was copied into new segments
+        # Stored afterwards, pages go on after the compacted segments
+        self.pack.put("kanji", "6", b"<html>later</html>")
+        self.assertEqual(self.pack.get("kanji", "6"), b"<html>later</html>")
+        self.assertEqual(self.pack.compact()[1], sum(map(os.path.getsize, self.pack.segments_on_disk().values())))
+
+    def test_import_directory(self):
+        loose = os.path.join(self.directory, "kanji")
+        os.makedirs(loose)
+        pages = {"0000001": b"<html>1</html>", "0000002": b"<html>2</html>"}
+        for name, data in pages.items():
+            with open(os.path.join(loose, f"{name}.html"), mode="wb") as f:
+                f.write(data)
+        with open(os.path.join(loose, "notes.txt"), mode="w") as f:
+            f.write("not a page")
+
+        self.assertEqual(self.pack.import_directory("kanji", loose, delete=True), 2)
+        self.assertEqual(dict(self.pack.items("kanji")), pages)
+        self.assertEqual(os.listdir(loose), ["notes.txt"])  # Only the pages are removed, and so the directory is kept
+
+        os.remove(os.path.join(loose, "notes.txt"))
+        with open(os.path.join(loose, "0000003.html"), mode="wb") as f:
+            f.write(b"<html>3</html>")
+        self.assertEqual(self.pack.import_directory("kanji", loose, delete=True), 1)
+        self.assertFalse(os.path.exists(loose))  # Removed once empty
+        self.assertEqual(self.pack.count("kanji"), 3)
+
+if __name__ == "__main__":
+    unittest.main()
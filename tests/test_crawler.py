@@ -0,0 +1,143 @@
+"""Tests of the crawl engine against a local stand-in for Kanjipedia, run from the repository root with
+
+    python -m unittest discover tests
+"""
+import http.server
+import os
+import sys
+import threading
+import time
+import unittest
+from typing import Optional
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kanjipedia_scraper
+from crawl_frontier import FrontierEntry, UrlState
+from crawler import Crawler, FetchError
+
+class StandInServer:
+    """Answers each GET with the next of the scripted (status, headers, body) responses, repeating the last one once
+    they run out, and records the time of every request.
+    """
+    def __init__(self, responses: list[tuple[int, dict[str, str], bytes]]):
+        self.responses = responses
+        self.request_times: list[float] = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.request_times.append(time.monotonic())
+                status, headers, body = server.responses[min(len(server.request_times), len(server.responses)) - 1]
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StandInServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def entry(key: str, url: str = "") -> FrontierEntry:
+    return FrontierEntry(kanjipedia_scraper.KANJI_KIND, key, url, UrlState.PENDING, 0, 0.0)
+
+class CrawlerTest(unittest.TestCase):
+    def test_retries_throttling_and_server_errors(self):
+        responses = [(429, {"Retry-After": "1"}, b"slow down"), (503, {}, b"unavailable"), (200, {}, b"<html>page</html>")]
+        with StandInServer(responses) as server:
+            crawler = Crawler(workers=1, requests_per_second=8.0, backoff=0.2)
+            response = crawler.fetch(f"{server.url}/kanji/0000000001")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"<html>page</html>")
+        self.assertEqual(len(server.request_times), 3)
+        # Retry-After is honoured before the second attempt, and the backoff before the third
+        self.assertGreaterEqual(server.request_times[1] - server.request_times[0], 1.0)
+        self.assertGreaterEqual(server.request_times[2] - server.request_times[1], 0.2)
+        # Halved for each of the 429 and the 503, then raised a step for the 200
+        self.assertAlmostEqual(crawler.rate, 8.0 / 4 + 8.0 / 20)
+
+    def test_gives_up_after_max_attempts(self):
+        with StandInServer([(503, {}, b"unavailable")]) as server:
+            crawler = Crawler(workers=1, requests_per_second=8.0, backoff=0.01, max_attempts=3)
+            with self.assertRaises(FetchError):
+                crawler.fetch(f"{server.url}/kanji/0000000001")
+        self.assertEqual(len(server.request_times), 3)
+        self.assertEqual(crawler.rate, 8.0 / 8)  # Halved for every attempt
+
+    def test_run_yields_errors_without_stopping(self):
+        with StandInServer([(200, {}, b"ok")]) as server:
+            crawler = Crawler(workers=3, requests_per_second=50.0)
+
+            def fetch(item: int) -> bytes:
+                if item == 2:
+                    raise ValueError(item)
+                return crawler.fetch(f"{server.url}/{item}").content
+
+            results = {item: (result, error) for item, result, error in crawler.run(fetch, range(5))}
+        self.assertEqual(sorted(results), list(range(5)))
+        self.assertIsInstance(results[2][1], ValueError)
+        self.assertTrue(all(results[item] == (b"ok", None) for item in (0, 1, 3, 4)))
+
+class FetchKanjiTest(unittest.TestCase):
+    def fetch_kanji(self, server: StandInServer) -> Optional[bytes]:
+        crawler = Crawler(workers=1, requests_per_second=50.0, backoff=0.01, max_attempts=2)
+        with mock.patch.object(kanjipedia_scraper, "get_kanjipedia_url", return_value=f"{server.url}/kanji/0000000001"):
+            return kanjipedia_scraper.fetch_kanji(crawler, entry("亜"))
+
+    def test_error_pages_are_raised_rather_than_saved(self):
+        for status in (403, 410):
+            with self.subTest(status=status), StandInServer([(status, {}, b"<html>error</html>")]) as server:
+                with self.assertRaises(requests.HTTPError):
+                    self.fetch_kanji(server)
+
+    def test_page_is_returned(self):
+        with StandInServer([(200, {}, b"<html>kanji</html>")]) as server:
+            self.assertEqual(self.fetch_kanji(server), b"<html>kanji</html>")
+
+class SearchKanjiTest(unittest.TestCase):
+    def search(self, server: StandInServer, page_ids: dict) -> Optional[str]:
+        crawler = Crawler(workers=1, requests_per_second=50.0, backoff=0.01, max_attempts=2)
+        with mock.patch.object(kanjipedia_scraper, "KANJI_SEARCH_BASE", f"{server.url}/search"), \
+             mock.patch.object(kanjipedia_scraper, "KANJIPEDIA_BASE", server.url), \
+             mock.patch.object(kanjipedia_scraper, "kanji_page_ids", return_value=page_ids):
+            return kanjipedia_scraper.search_kanjipedia_url(crawler, "亜")
+
+    def test_result_is_recorded(self):
+        page_ids = {}
+        with StandInServer([(200, {}, b'<html><a href="/kanji/0000000001">\xe4\xba\x9c</a></html>')]) as server:
+            self.assertEqual(self.search(server, page_ids), f"{server.url}/kanji/0000000001")
+        self.assertEqual(page_ids, {"亜": "0000000001"})
+
+    def test_no_result_is_recorded(self):
+        page_ids = {}
+        with StandInServer([(200, {}, b"<html><p>no results</p></html>")]) as server:
+            self.assertIsNone(self.search(server, page_ids))
+        self.assertEqual(page_ids, {"亜": None})
+
+    def test_failed_searches_are_not_recorded(self):
+        for status, body in ((403, b"<html>forbidden</html>"), (200, b"<html><p>no res"), (204, b"")):
+            page_ids = {}
+            with self.subTest(status=status, body=body), StandInServer([(status, {}, body)]) as server:
+                with self.assertRaises((requests.HTTPError, FetchError)):
+                    self.search(server, page_ids)
+            self.assertEqual(page_ids, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Tests that the fast extraction engine reads the fixture pages exactly as the BeautifulSoup one does, run from the
+repository root with
+
+    python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import unittest
+
+import support
+import extraction_parity
+
+sys.path.insert(0, os.path.join(support.REPOSITORY, "benchmarks"))
+
+from page_chrome import add_chrome
+
+class ExtractionParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.bundle_directory = support.use_temporary_bundle()
+        cls.pages = support.fixture_pages()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bundle_directory.cleanup()
+
+    def assert_parity(self, kind: str, pages: list[tuple[str, str]]):
+        result = extraction_parity.compare_engines(kind, ((name, page.encode()) for name, page in pages))
+        self.assertEqual(result.failures, [])
+        self.assertEqual([name for name, _, _ in result.mismatches], [])
+        self.assertEqual(result.checked, len(pages))
+        self.assertEqual(result.fallbacks, 0)  # Every fixture is read by the fast engine itself, not left to bs4
+
+    def test_fixtures(self):
+        for kind, pages in self.pages.items():
+            with self.subTest(kind=kind):
+                self.assert_parity(kind, pages)
+
+    def test_fixtures_with_chrome(self):
+        for kind, pages in self.pages.items():
+            with self.subTest(kind=kind):
+                self.assert_parity(kind, [(name, add_chrome(page, random.Random(name)))
+                                          for name, page in pages if not name.startswith("full-")])
+
+if __name__ == "__main__":
+    unittest.main()
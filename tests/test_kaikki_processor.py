@@ -0,0 +1,35 @@
+"""Tests of the filter that picks the Kanken kanji out of the kaikki.org dump, run from the repository root with
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "supplementary", "characters"))
+
+import kaikki_processor
+
+class WantedCharactersTest(unittest.TestCase):
+    def test_every_kanken_kanji_is_wanted(self):
+        with open(kaikki_processor.KANKEN_PATH) as f:
+            count = sum(len(level["kanjiList"]) for level in json.load(f))
+        kanji_list = kaikki_processor.kanken_kanji()
+        self.assertEqual(len(kanji_list), count)
+        wanted = kaikki_processor.wanted_characters()
+        self.assertEqual([kanji for kanji in kanji_list if kanji not in wanted], [])
+        for kanji in "填剥頬":  # Written as (填) etc. in kanken.json
+            self.assertIn(kanji, wanted)
+
+    def test_entries_of_wanted_characters_are_kept(self):
+        lines = [
+            json.dumps({"word": "頬", "etymology_text": "形声", "pos": "character"}, ensure_ascii=False),
+            json.dumps({"word": "頬", "pos": "character"}, ensure_ascii=False),  # No etymology
+            json.dumps({"word": "x", "etymology_text": "unwanted"}),
+        ]
+        entries = list(kaikki_processor.filter_entries(iter(lines), kaikki_processor.wanted_characters()))
+        self.assertEqual(entries, [{"word": "頬", "etymology_text": "形声"}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Tests of the cache of parsed pages, run from the repository root with
+
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import support
+import global_data
+import kanjipedia_collator
+from corpus_pack import PackStore
+from parse_cache import ParseCache
+
+class ParseCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.bundle_directory = support.use_temporary_bundle()
+        cls.pages = support.fixture_pages()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bundle_directory.cleanup()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.pack = PackStore(os.path.join(directory.name, "pack"))
+        self.addCleanup(self.pack.close)
+        for kind, pages in self.pages.items():
+            for name, page in pages:
+                self.pack.put(kind, name, page.encode(), commit=False)
+        self.pack.commit()
+        self.cache_path = os.path.join(directory.name, "parse_cache.sqlite3")
+
+    def parse(self, kind: str, cached: bool = True) -> tuple[list, int]:
+        "The parsed pages of `kind`, and how many of them were actually parsed rather than taken from the cache."
+        cache = ParseCache(kanjipedia_collator.cache_version(), self.cache_path) if cached else None
+        with mock.patch.object(kanjipedia_collator, "parse_chunk", wraps=kanjipedia_collator.parse_chunk) as parse_chunk:
+            try:
+                results = list(kanjipedia_collator.parse_stored_pages(self.pack, kind, self.pack.names(kind), cache=cache))
+            finally:
+                if cache is not None:
+                    cache.close()
+        return results, sum(len(call.args[1]) for call in parse_chunk.call_args_list)
+
+    def test_cached_results_equal_fresh_ones(self):
+        for kind in self.pages:
+            with self.subTest(kind=kind):
+                fresh, _ = self.parse(kind, cached=False)
+                first, parsed = self.parse(kind)
+                self.assertEqual(parsed, len(self.pages[kind]))
+                cached, parsed = self.parse(kind)
+                self.assertEqual(parsed, 0)
+                self.assertEqual(cached, fresh)
+                self.assertEqual(first, fresh)
+
+    def test_changed_page_is_parsed_again(self):
+        kind = "kanji"
+        self.parse(kind)
+        name, page = self.pages[kind][0]
+        self.pack.put(kind, name, (page + "\n").encode())
+        _, parsed = self.parse(kind)
+        self.assertEqual(parsed, 1)
+
+    def test_version_changes_invalidate_results(self):
+        kind = "kanji"
+        changes = {
+            "PARSER_VERSION": mock.patch.object(kanjipedia_collator, "PARSER_VERSION", kanjipedia_collator.PARSER_VERSION + 1),
+            "SCHEMA_VERSION": mock.patch.object(kanjipedia_collator, "SCHEMA_VERSION", kanjipedia_collator.SCHEMA_VERSION + 1),
+            "supplementary fingerprint": mock.patch.object(global_data, "fingerprint",
+                                                           return_value=global_data.fingerprint() + "-changed"),
+        }
+        for change, patch in changes.items():
+            with self.subTest(change=change):
+                self.parse(kind)
+                with patch:
+                    _, parsed = self.parse(kind)
+                    self.assertEqual(parsed, len(self.pages[kind]))
+                    _, parsed = self.parse(kind)
+                    self.assertEqual(parsed, 0)
+
+if __name__ == "__main__":
+    unittest.main()